@@ -0,0 +1,263 @@
+import operator as op
+from collections import Counter
+from itertools import islice
+import storage
+import planner
+import views
+
+# SELECT d, COUNT(*), SUM(s), MIN(s), MAX(s), AVG(s) FROM t [WHERE ...] [GROUP_BY d, ...]:
+# one output row per group, or a single row without GROUP_BY. three ways to compute them:
+#   index     - answered by the index on the only GROUP_BY column: the groups are its keys,
+#               COUNT is the length of their posting lists and MIN / MAX of that column the key
+#   endpoints - no GROUP_BY and no WHERE: COUNT(*) is the row count, MIN / MAX the first and
+#               last key of a btree index
+#   hash      - one pass over the items of the WHERE plan with a dict group -> running totals;
+#               the values are read from the column arrays or the row dicts, no row is built
+# the index can only be used when WHERE is empty or only bounds the keys of that index
+# the row layout keeps text: SUM and AVG read its values as numbers, MIN and MAX compare
+# them as text like ORDER BY does
+
+functions = ('COUNT', 'SUM', 'MIN', 'MAX', 'AVG')
+
+def output_name(entry):
+    function, column_name = entry
+    return column_name if function is None else f"{function}({column_name})"
+
+def plan_aggregate(table, select, condition=None, group_by=None, order_by=None, column=True, limit=None, offset=0):
+    # :param select: list of (function, column): function is None for a GROUP_BY column, the
+    #                column of COUNT may be '*'
+    # :return: plan dict, or None if the query is not valid for this table
+    group_by = group_by or []
+    columns = table['columns']
+    for column_name in group_by:
+        if column_name not in columns:
+            print(f"Error: Column '{column_name}' does not exist.")
+            return
+    for function, column_name in select:
+        if function is None and column_name not in group_by:
+            print(f"Error: Column '{column_name}' must be in GROUP_BY to be selected with aggregates.")
+            return
+        if function is not None and function not in functions:
+            print(f"Error: Unknown aggregate function '{function}'.")
+            return
+        if function is not None and column_name not in columns and not (function == 'COUNT' and column_name == '*'):
+            print(f"Error: Column '{column_name}' does not exist.")
+            return
+        if function in ('SUM', 'AVG') and planner.is_columnar(table) and table['types'][column_name] in ('str', 'dict'):
+            print(f"Error: {function} needs a number column, '{column_name}' holds text.")
+            return
+    names = [output_name(entry) for entry in select]
+    for column_name, order in order_by or []:
+        if column_name not in names:
+            print(f"Error: ORDER_BY '{column_name}' is not in the select list.")
+            return
+
+    scan = planner.plan_select(table, condition, None, column)
+    if scan is None:
+        return
+    condition = scan['condition']
+    plan = {'access': 'hash', 'scan': scan, 'select': select, 'names': names, 'group_by': group_by,
+            'bounds': None, 'order_by': order_by, 'limit': limit, 'offset': offset,
+            'estimated_rows': (planner.distinct_count(table, group_by[0]) or scan['estimated_rows']) if group_by else 1}
+
+    aggregates = [(function, column_name) for function, column_name in select if function is not None]
+    if len(group_by) == 1 and group_by[0] in table['index']:
+        group = group_by[0]
+        bounds, residual = planner.index_bounds(table, condition, group)
+        if not planner.is_ordered(table['index'][group]) and any(bound[1] != '=' for bound in bounds):
+            residual = condition  # a hash index has no key ranges
+        if residual is None and all(function == 'COUNT' or column_name == group for function, column_name in aggregates) \
+                and not any(function in ('SUM', 'AVG') for function, column_name in aggregates):
+            plan.update(access='index', bounds=bounds)
+    elif not group_by and not condition and all(
+            (function == 'COUNT' and column_name == '*') or
+            (function in ('MIN', 'MAX') and planner.is_ordered(table['index'].get(column_name)))
+            for function, column_name in aggregates):
+        plan['access'] = 'endpoints'
+    return plan
+
+def execute(table, plan):
+    # :return: list of the result rows, None after an error
+    table = views.read_view(table)
+    if plan['access'] == 'index':
+        rows = index_groups(table, plan)
+    elif plan['access'] == 'endpoints':
+        rows = [endpoints(table, plan)]
+    else:
+        rows = hash_groups(table, plan)
+    if rows is None:
+        return None
+    limit, offset = plan['limit'], plan['offset']
+    if plan['order_by']:
+        if limit is not None:
+            rows = planner.top_rows(rows, plan['order_by'], offset + limit)
+        else:
+            planner.sort_rows(rows, plan['order_by'])
+    if limit is not None or offset:
+        rows = list(islice(rows, offset, None if limit is None else offset + limit))
+    return rows
+
+def index_groups(table, plan):
+    # one group per index key with visible rows, counted from the length of its posting list
+    # cut at the view's rows; the postings are only read when the view has tombstones
+    group = plan['group_by'][0]
+    index = table['index'][group]
+    keys = planner.bound_keys(index, plan['bounds']) if plan['bounds'] else index.keys()
+    rows = []
+    for key in keys:
+        count = index.row_count(key)
+        if count:
+            rows.append({name: count if function == 'COUNT' else key
+                         for name, (function, column_name) in zip(plan['names'], plan['select'])})
+    return rows
+
+def key_at(index, position):
+    # the key at a position of a btree index, without copying the keys of a read view
+    if isinstance(index, views.IndexView):
+        return index.key_list[position]
+    return index.keys()[position]
+
+def end_key(index, last):
+    # the smallest (largest if last) key that still has visible rows, None for none
+    positions = range(len(index) - 1, -1, -1) if last else range(len(index))
+    for position in positions:
+        key = key_at(index, position)
+        if index.row_count(key):
+            return key
+    return None
+
+def endpoints(table, plan):
+    row = {}
+    for name, (function, column_name) in zip(plan['names'], plan['select']):
+        if function == 'COUNT':
+            row[name] = len(table['data']) - len(planner.tombstones(table) or ())
+        else:
+            row[name] = end_key(table['index'][column_name], function == 'MAX')
+    return row
+
+def number(value):
+    # a value of the row layout as a number
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+def getter(table, column_name, numeric=False):
+    # callable that reads a column from an item
+    if planner.is_columnar(table):
+        values = table['data'].column(column_name)
+        if isinstance(values, storage.DictColumn):
+            dictionary, codes = values.dictionary, values.codes
+            return lambda i: dictionary[codes[i]]
+        return values.__getitem__
+    get = op.itemgetter(column_name)
+    if numeric:
+        return lambda row: number(get(row))
+    return get
+
+def group_getter(table, group_by):
+    # :return: (callable that reads the group key of an item, callable that turns a key into
+    #           the list of group values); dictionary columns are grouped by their codes
+    if not group_by:
+        return None, lambda key: []
+    if not planner.is_columnar(table):
+        get = op.itemgetter(*group_by)
+        return get, (lambda key: [key]) if len(group_by) == 1 else list
+    readers = []
+    decoders = []
+    for column_name in group_by:
+        values = table['data'].column(column_name)
+        if isinstance(values, storage.DictColumn):
+            readers.append(values.codes.__getitem__)
+            decoders.append(values.dictionary.__getitem__)
+        else:
+            readers.append(values.__getitem__)
+            decoders.append(None)
+    if len(readers) == 1:
+        decode = decoders[0]
+        return readers[0], (lambda key: [key]) if decode is None else (lambda key: [decode(key)])
+    return (lambda item: tuple([read(item) for read in readers]),
+            lambda key: [value if decode is None else decode(value) for value, decode in zip(key, decoders)])
+
+def hash_groups(table, plan):
+    # a single pass over the items of the WHERE plan, keeping the running totals of every group
+    items = planner.select_items(table, plan['scan'])
+    group, decode = group_getter(table, plan['group_by'])
+    aggregates = [(function, column_name) for function, column_name in plan['select'] if function is not None]
+
+    if all(function == 'COUNT' for function, column_name in aggregates):
+        # only counts: counted in C
+        if group is None:
+            counts = {(): sum(1 for item in items)}
+        else:
+            counts = Counter(map(group, items))
+        totals = {key: [count] * len(aggregates) for key, count in counts.items()}
+    else:
+        # state slots: COUNT a count, SUM a sum, MIN / MAX the value so far, AVG a sum and a count
+        updates = []
+        initial = []
+        for function, column_name in aggregates:
+            read = None if function == 'COUNT' else getter(table, column_name, function in ('SUM', 'AVG'))
+            updates.append((function, len(initial), read))
+            initial.extend([0, 0] if function == 'AVG' else [None] if function in ('MIN', 'MAX') else [0])
+        totals = {}
+        try:
+            for item in items:
+                key = group(item) if group is not None else ()
+                state = totals.get(key)
+                if state is None:
+                    state = totals[key] = initial[:]
+                for function, slot, read in updates:
+                    if function == 'COUNT':
+                        state[slot] += 1
+                        continue
+                    value = read(item)
+                    if function == 'SUM':
+                        state[slot] += value
+                    elif function == 'AVG':
+                        state[slot] += value
+                        state[slot + 1] += 1
+                    elif function == 'MIN':
+                        if state[slot] is None or value < state[slot]:
+                            state[slot] = value
+                    elif state[slot] is None or value > state[slot]:
+                        state[slot] = value
+        except ValueError as e:
+            print(f"Error: SUM and AVG need numbers: {e}")
+            return None
+        for key, state in totals.items():
+            totals[key] = [state[slot] / state[slot + 1] if function == 'AVG' and state[slot + 1]
+                           else None if function == 'AVG' else state[slot]
+                           for function, slot, read in updates]
+
+    if not plan['group_by'] and not totals:
+        # no rows: COUNT is 0, everything else has no value
+        totals = {(): [0 if function == 'COUNT' else None for function, column_name in aggregates]}
+    rows = []
+    for key, values in totals.items():
+        group_values = iter(decode(key))
+        values = iter(values)
+        rows.append({name: next(group_values) if function is None else next(values)
+                     for name, (function, column_name) in zip(plan['names'], plan['select'])})
+    return rows
+
+def describe(plan):
+    # the plan as lines of text for EXPLAIN
+    if plan['access'] == 'index':
+        lines = [f"access: groups from the keys of the index on {plan['group_by'][0]}, counts from posting list lengths"]
+        if plan['bounds']:
+            lines.append("keys: " + " AND ".join(planner.condition_text(bound) for bound in plan['bounds']))
+    elif plan['access'] == 'endpoints':
+        lines = ["access: row count and index endpoints"]
+    else:
+        lines = ["access: hash aggregation over:"]
+        lines.extend("  " + line for line in planner.describe(plan['scan']))
+    lines.append("aggregate: " + ", ".join(plan['names']) + (" group by " + ", ".join(plan['group_by']) if plan['group_by'] else ""))
+    if plan['order_by']:
+        lines.append("order by: " + ", ".join(f"{column_name} {order.upper()}" for column_name, order in plan['order_by']))
+    if plan['limit'] is not None or plan['offset']:
+        lines.append(f"limit: {plan['limit']} offset: {plan['offset']}")
+    lines.append(f"estimated groups: {plan['estimated_rows']}")
+    return lines
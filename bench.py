@@ -0,0 +1,279 @@
+import os, io, sys, gc, json, time, random, platform, argparse, statistics, tracemalloc
+from contextlib import redirect_stdout
+import database
+import planner
+import aggregate
+import views
+from parser import Interpreter
+
+# reproducible benchmarks: every scenario runs against a synthetic employees table
+# generated from a fixed seed, is warmed up, repeated and timed with perf_counter.
+# results are written as json and two result files can be compared to find regressions
+#   python bench.py --sizes 10000 100000 --output new.json
+#   python bench.py --compare old.json new.json
+
+names = [
+    "Alice", "Bob", "Charlie", "Diana", "Edward", "Fiona", "George", "Hannah",
+    "Ian", "Jessica", "Kevin", "Laura", "Michael", "Nina", "Oliver", "Paula",
+    "Quentin", "Rachel", "Steven", "Tina"
+]
+positions = [
+    "Manager", "Developer", "Analyst", "HR Specialist", "Intern", "Team Lead", "CEO",
+    "Marketing Manager", "Sales Associate", "Data Scientist", "Software Engineer",
+    "Consultant", "Financial Advisor", "Product Manager", "IT Specialist",
+    "UX Designer", "Security Analyst", "Support Engineer", "HR Manager", "Accountant"
+]
+salaries = [
+    85000, 75000, 70000, 60000, 35000, 90000, 150000, 95000, 45000, 105000,
+    95000, 80000, 88000, 78000, 82000, 72000, 89000, 68000, 87000, 76000
+]
+departments = [
+    "HR", "IT", "Finance", "HR", "Marketing", "Management", "Executive",
+    "Marketing", "Sales", "Data Analytics", "Development", "Consulting",
+    "Finance", "Product", "IT", "Design", "Security", "Support", "HR", "Accounting"
+]
+
+columns = ["id", "name", "position", "salary", "department"]
+column_types = {"id": "int", "name": "str", "position": "str", "salary": "int", "department": "str"}
+indexed_columns = ["id", "name", "salary"]
+
+# table layouts every read scenario is run against
+layouts = ["rows", "columnar"]
+
+def generate(size, seed):
+    # value lists as they come from INSERT: everything is text
+    rng = random.Random(seed)
+    return [[str(i), rng.choice(names), rng.choice(positions), str(rng.choice(salaries)), rng.choice(departments)]
+            for i in range(size)]
+
+def create(layout, indexed=True):
+    database.database.clear()
+    database.create_table("employees", columns, indexed_columns if indexed else None,
+                          column_types if layout == "columnar" else None)
+    return database.database["employees"]
+
+def load(rows, layout, indexed=True):
+    table = create(layout, indexed)
+    database.bulk_insert("employees", rows)
+    return table
+
+
+# a scenario is (setup, run): setup(rows, layout) builds the state outside of the timing,
+# run(state) is the timed part. scenarios in fresh_scenarios change the table and get a
+# new state for every repetition
+
+def insert_setup(rows, layout):
+    create(layout)
+    return rows
+
+def insert_run(rows):
+    for values in rows:
+        database.insert_into_table("employees", values)
+
+def bulk_run(rows):
+    database.bulk_insert("employees", rows)
+
+def select_scenario(condition=None, order_by=None, column=False, use_indexes=True, limit=None):
+    def run(table):
+        value = condition
+        if condition and len(condition) == 3 and not column and table.get('types'):
+            value = (condition[0], condition[1], int(condition[2]) if condition[0] in ("id", "salary") else condition[2])
+        return len(planner.select(table, value, order_by, column, use_indexes=use_indexes, limit=limit))
+    return load, run
+
+def aggregate_scenario(select, group_by=None, condition=None):
+    def run(table):
+        return len(aggregate.execute(table, aggregate.plan_aggregate(table, select, condition, group_by)))
+    return load, run
+
+# about one row in twenty has a given name: these writes find their rows through the name index
+deleted = ("name", "=", "Michael", False)
+
+def delete_run(table):
+    database.delete_from_table("employees", deleted)
+
+def update_run(table):
+    database.update_table("employees", [("salary", "1")], ("name", "=", "Nina", False))
+
+def deleted_setup(rows, layout):
+    # a table with tombstones, below the share that starts a compaction
+    table = load(rows, layout)
+    database.delete_from_table("employees", deleted)
+    return table
+
+def compact_run(table):
+    database.compact_table("employees")
+
+def view_run(table):
+    # a read view after every insert: the new text ids sort before the last key ("100000" < "99999"),
+    # the view copies only the chunks of the btree keys they went into, while holding the writer lock
+    first = len(table['data'])
+    for i in range(200):
+        database.insert_into_table("employees", [str(first + i), "Nina", "Intern", "35000", "HR"])
+        views.read_view(table)
+
+def interpreter_setup(rows, layout):
+    load(rows, layout)
+    interpreter = Interpreter()
+    interpreter.output = open(os.devnull, "w")
+    statements = "\n".join([
+        'SELECT FROM employees WHERE name > "Steven";',
+        'SELECT FROM employees WHERE salary > "90000" ORDER_BY salary DESC LIMIT 100;',
+        'SELECT FROM employees WHERE department > "Sales" ORDER_BY name ASC, id DESC;',
+        'SELECT FROM employees WHERE name > position LIMIT 1000;',
+    ] + ['INSERT INTO employees ("%d", "Nina", "Intern", "35000", "HR");' % (len(rows) + i) for i in range(1000)])
+    return interpreter, statements
+
+def interpreter_run(state):
+    interpreter, statements = state
+    interpreter.run(statements)
+
+scenarios = {
+    "insert": (insert_setup, insert_run),
+    "bulk_load": (insert_setup, bulk_run),
+    "scan_equal": select_scenario(("department", "=", "IT")),
+    "scan_equal_indexed": select_scenario(("name", "=", "Michael")),
+    "scan_range": select_scenario(("salary", ">", "90000"), use_indexes=False),
+    "scan_range_indexed": select_scenario(("salary", ">", "90000")),
+    "scan_column": select_scenario(("name", ">", "position"), column=True),
+    # compound conditions: the planner converts the values of their comparisons itself
+    "scan_compound": select_scenario(("and", [("department", "=", "IT", False), ("salary", ">", "80000", False)]), use_indexes=False),
+    "scan_and_indexed": select_scenario(("and", [("name", "=", "Michael", False), ("salary", "=", "90000", False)])),
+    "scan_or_indexed": select_scenario(("or", [("name", "=", "Michael", False), ("name", "=", "Nina", False)])),
+    "scan_between_indexed": select_scenario(("and", [("salary", ">=", "70000", False), ("salary", "<=", "80000", False)])),
+    "order_by": select_scenario(order_by=[("name", "ASC"), ("id", "DESC")]),
+    "order_by_limit": select_scenario(("department", "=", "IT"), [("salary", "DESC")], limit=10),
+    "group_count_indexed": aggregate_scenario([(None, "name"), ("COUNT", "*")], ["name"]),
+    "group_sum": aggregate_scenario([(None, "department"), ("SUM", "salary"), ("AVG", "salary")], ["department"]),
+    "interpreter": (interpreter_setup, interpreter_run),
+    "delete_indexed": (load, delete_run),
+    "update_indexed": (load, update_run),
+    "scan_equal_deleted": (deleted_setup, select_scenario(("department", "=", "IT"))[1]),
+    "compact": (deleted_setup, compact_run),
+    "view_after_insert": (load, view_run),
+}
+fresh_scenarios = {"insert", "bulk_load", "interpreter", "delete_indexed", "update_indexed", "compact", "view_after_insert"}
+
+
+def measure(scenario, rows, layout, warmup=1, repeat=5):
+    # :return: dict with the run times in seconds and the peak memory allocated by one run
+    setup, run = scenarios[scenario]
+    fresh = scenario in fresh_scenarios
+    state = None
+    times = []
+    for i in range(warmup + repeat):
+        if fresh or state is None:
+            with redirect_stdout(io.StringIO()):
+                state = setup(rows, layout)
+        gc.collect()
+        with redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            run(state)
+            elapsed = time.perf_counter() - start
+        if i >= warmup:
+            times.append(elapsed)
+
+    # memory is traced in a separate run, tracing slows every allocation down
+    if fresh:
+        with redirect_stdout(io.StringIO()):
+            state = setup(rows, layout)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        with redirect_stdout(io.StringIO()):
+            run(state)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "times": times,
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.mean(times),
+        "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "peak_memory": peak,
+    }
+
+def run_benchmarks(sizes, selected=None, warmup=1, repeat=5, seed=42, out=None):
+    out = out or sys.stdout
+    results = []
+    for size in sizes:
+        rows = generate(size, seed)
+        for scenario in scenarios:
+            if selected and not any(name in scenario for name in selected):
+                continue
+            for layout in layouts:
+                result = {"scenario": scenario, "size": size, "layout": layout}
+                result.update(measure(scenario, rows, layout, warmup, repeat))
+                results.append(result)
+                out.write(f"{scenario:<20} {layout:<9} {size:>9} rows  median {result['median'] * 1000:10.2f} ms"
+                          f"  min {result['min'] * 1000:10.2f} ms  peak {result['peak_memory'] / 2 ** 20:8.2f} MiB\n")
+    database.database.clear()
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "seed": seed,
+            "warmup": warmup,
+            "repeat": repeat,
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+# peak memory differences below this many bytes are noise
+memory_noise = 1 << 16
+
+def compare(old, new, threshold=0.1, out=None):
+    # matches the results of two runs by scenario, layout and size and flags every one that got
+    # slower (median time) or bigger (peak memory) by more than threshold
+    # :return: number of regressions
+    out = out or sys.stdout
+    previous = {(result["scenario"], result["layout"], result["size"]): result for result in old["results"]}
+    regressions = 0
+    for result in new["results"]:
+        key = (result["scenario"], result["layout"], result["size"])
+        if key not in previous:
+            continue
+        base = previous[key]
+        time_ratio = result["median"] / base["median"] if base["median"] else 1.0
+        memory_ratio = result["peak_memory"] / base["peak_memory"] if base["peak_memory"] else 1.0
+        flags = []
+        if time_ratio > 1 + threshold:
+            flags.append("SLOWER")
+        elif time_ratio < 1 - threshold:
+            flags.append("faster")
+        if memory_ratio > 1 + threshold and result["peak_memory"] - base["peak_memory"] > memory_noise:
+            flags.append("MORE MEMORY")
+        if "SLOWER" in flags or "MORE MEMORY" in flags:
+            regressions += 1
+        out.write(f"{key[0]:<20} {key[1]:<9} {key[2]:>9} rows  time x{time_ratio:5.2f}  memory x{memory_ratio:5.2f}  {' '.join(flags)}\n")
+    out.write(f"{regressions} regressions (threshold {threshold:.0%})\n")
+    return regressions
+
+def main(argv=None):
+    arguments = argparse.ArgumentParser(description="OAA database benchmarks")
+    arguments.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000], help="table sizes in rows")
+    arguments.add_argument("--scenarios", nargs="+", help="run only the scenarios whose name contains one of these")
+    arguments.add_argument("--warmup", type=int, default=1, help="untimed runs before the timed ones")
+    arguments.add_argument("--repeat", type=int, default=5, help="timed runs of every scenario")
+    arguments.add_argument("--seed", type=int, default=42, help="seed of the generated data")
+    arguments.add_argument("--output", help="write the results to this json file")
+    arguments.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files instead of running")
+    arguments.add_argument("--threshold", type=float, default=0.1, help="relative change that counts as a regression")
+    options = arguments.parse_args(argv)
+
+    if options.compare:
+        with open(options.compare[0]) as old, open(options.compare[1]) as new:
+            return 1 if compare(json.load(old), json.load(new), options.threshold) else 0
+
+    results = run_benchmarks(options.sizes, options.scenarios, options.warmup, options.repeat, options.seed)
+    if options.output:
+        with open(options.output, "w") as file:
+            json.dump(results, file, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+import json, socket, asyncio
+
+# clients for server.py. execute() sends one statement and returns its output lines,
+# query() also decodes the rows of a SELECT (the server sends JSONL by default)
+#   with Client() as db:
+#       db.execute('CREATE t (id INT, name TEXT);')
+#       rows = db.query('SELECT FROM t WHERE id > "10";')
+
+class QueryError(Exception):
+    pass
+
+def statement_text(statement):
+    statement = statement.strip()
+    return (statement if statement.endswith(';') else statement + ';') + '\n'
+
+def result_line(line, lines):
+    # :return: True when line is the status line that ends the result
+    line = line.decode('utf-8')
+    if not line:
+        raise ConnectionError('the server closed the connection')
+    if line.startswith('.'):
+        lines.append(line[1:].rstrip('\n'))
+        return False
+    if line.startswith('ERROR'):
+        raise QueryError(line[6:].rstrip('\n'))
+    return True
+
+
+class Client(object):
+
+    def __init__(self, host='127.0.0.1', port=5433):
+        self.socket = socket.create_connection((host, port))
+        self.file = self.socket.makefile('rwb')
+
+    def execute(self, statement):
+        self.file.write(statement_text(statement).encode('utf-8'))
+        self.file.flush()
+        return self.read_result()
+
+    def read_result(self):
+        lines = []
+        while not result_line(self.file.readline(), lines):
+            pass
+        return lines
+
+    def query(self, statement):
+        return [json.loads(line) for line in self.execute(statement)]
+
+    def stream(self, statement):
+        # yields the output lines as they arrive
+        self.file.write(statement_text(statement).encode('utf-8'))
+        self.file.flush()
+        while True:
+            lines = []
+            if result_line(self.file.readline(), lines):
+                return
+            yield lines[0]
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class AsyncClient(object):
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host='127.0.0.1', port=5433):
+        reader, writer = await asyncio.open_connection(host, port, limit=1 << 20)
+        return cls(reader, writer)
+
+    async def execute(self, statement):
+        self.writer.write(statement_text(statement).encode('utf-8'))
+        await self.writer.drain()
+        lines = []
+        while not result_line(await self.reader.readline(), lines):
+            pass
+        return lines
+
+    async def query(self, statement):
+        return [json.loads(line) for line in await self.execute(statement)]
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
@@ -1,116 +1,497 @@
 from prettytable import PrettyTable
 from sortedcontainers import SortedDict
-import time, random
+import threading
+from itertools import islice, count, accumulate, filterfalse
+from operator import itemgetter, not_
 from sortedcontainers import SortedDict
+import storage
+import render
+import planner
+import views
 
 database = {}
 
-def create_table(table_name, columns, indexed_columns=None):
+# called with a tuple describing every change once it is applied, set by persistence.open_storage
+journal = None
+
+# called after a write has released its locks, set by persistence.open_storage to take
+# the snapshots that are due
+after_write = None
+
+# held while a table is created and while persistence takes a consistent image of all tables;
+# the lock order is: schema_lock, then table locks (by table name), then the journal
+schema_lock = threading.RLock()
+
+# functions called with the metrics of every SELECT run by the interpreter, see add_query_hook
+query_hooks = []
+
+# index types: 'btree' keeps the keys sorted (SortedDict) for range and ordered scans,
+# 'hash' is a plain dict for O(1) equality lookups
+index_types = ['btree', 'hash']
+
+def new_index(index_type=None):
+    if index_type == 'hash':
+        return {}
+    return SortedDict()
+
+# table versions, unique over all tables so that a table created again under an old name
+# never gets a version the old one had; see resultcache.py
+versions = count(1)
+
+# DELETE and UPDATE leave the old rows in place as tombstones; once they are more than this
+# share of the rows the table is compacted in a background thread, see compact_table
+compaction_threshold = 0.25
+
+def prepare_table(table):
+    # writers hold the table's lock and publish the row count readers see (views.read_view)
+    table['lock'] = threading.RLock()
+    table['key_cache'] = {}
+    table.setdefault('dead', {})  # row id -> version of the delete, tombstones of the deleted rows
+    publish(table)
+    return table
+
+def publish(table):
+    # last step of every write, under the table's lock: makes the rows visible to new
+    # read views and gives the table a new version
+    table['rows'] = len(table['data'])
+    table['version'] = next(versions)
+
+def create_table(table_name, columns, indexed_columns=None, column_types=None, index_types=None):
+    with schema_lock:
+        create_table_locked(table_name, columns, indexed_columns, column_types, index_types)
+    if after_write:
+        after_write()
+
+def create_table_locked(table_name, columns, indexed_columns=None, column_types=None, index_types=None):
     if table_name in database:
-        print(f"Table '{table_name}' already exists.")
+        print(f"Error: Table '{table_name}' already exists.")
         return
     
     # Initialize table with columns and data
-    database[table_name] = {
+    table = {
         'columns': columns,  # str list
         'data': [],  # list of dict
-        'index': {column: SortedDict() for column in columns if column in (indexed_columns or [])}  # use SortedDict for indexed columns
+        'index': {column: new_index((index_types or {}).get(column)) for column in columns if column in (indexed_columns or [])},  # SortedDict or dict for indexed columns, value -> postings of row ids
+        'stats': {column: {'min': None, 'max': None, 'text': True} for column in columns}  # used by the planner
     }
+    if column_types:
+        # columnar layout: typed column arrays instead of the list of row dicts
+        table['types'] = {column: column_types.get(column, 'str') for column in columns}
+        table['data'] = storage.ColumnStore(columns, table['types'])
+    database[table_name] = prepare_table(table)
+    if journal:
+        journal(('create', table_name, list(columns), list(indexed_columns or []), dict(column_types or {}), dict(index_types or {})))
     print(f"Table '{table_name}' was successfully created with columns: {', '.join(columns)}.")
     if indexed_columns:
         print(f"Indexed columns: {', '.join(indexed_columns)}.") 
 
+def create_index(table_name, column, index_type='btree'):
+    # builds the index of an already populated table in one pass: the postings are
+    # grouped by key in row order, then the keys are sorted once for a btree index
+    if table_name not in database:
+        print(f"Error: Table '{table_name}' does not exist.")
+        return
+    table = database[table_name]
+    if column not in table['columns']:
+        print(f"Error: Column '{column}' does not exist.")
+        return
+    if column in table['index']:
+        print(f"Error: Column '{column}' is already indexed.")
+        return
+    if index_type not in index_types:
+        print(f"Error: Unknown index type '{index_type}'.")
+        return
+    with table['lock']:
+        build_index(table_name, table, column, index_type)
+    if after_write:
+        after_write()
+
+def build_index(table_name, table, column, index_type):
+    if is_columnar(table):
+        values = table['data'].column(column)
+    else:
+        values = map(itemgetter(column), table['data'])
+    groups = {}
+    for value, row_id in zip(values, range(len(table['data']))):
+        if value in groups:
+            groups[value].append(row_id)
+        else:
+            groups[value] = storage.postings((row_id,))
+    table['index'][column] = groups if index_type == 'hash' else SortedDict(groups)
+    if journal:
+        journal(('index', table_name, column, index_type))
+    print(f"Index on '{table_name}' ({column}) was created with {len(groups)} keys.")
+
+def add_query_hook(hook):
+    # hook(metrics) is called after every SELECT with a dict of: table, access, index,
+    # estimated_rows, rows_returned, cached (parsed statement came from the cache) and the
+    # timings in seconds of parse, plan, execute (filter, sort and render streamed together)
+    # and total. EXPLAIN ANALYZE adds rows_examined and the filter, sort and render timings.
+    # nothing is measured while no hook is set
+    query_hooks.append(hook)
+
+def remove_query_hook(hook):
+    if hook in query_hooks:
+        query_hooks.remove(hook)
+
+def report_query(metrics):
+    for hook in query_hooks:
+        try:
+            hook(metrics)
+        except Exception as e:
+            print(f"Error in query hook: {e}")
+
+def is_columnar(table):
+    return isinstance(table['data'], storage.ColumnStore)
+
+def update_stats(table, column, low, high, text=True):
+    stats = table['stats'][column]
+    if not text:
+        stats['text'] = False
+    try:
+        if stats['min'] is None or low < stats['min']:
+            stats['min'] = low
+        if stats['max'] is None or high > stats['max']:
+            stats['max'] = high
+    except TypeError:
+        pass  # mixed value types in one column, keep what we have
+
 def insert_into_table(table_name, values):
     if table_name not in database:
-        print(f"Table '{table_name}' does not exist.")
+        print(f"Error: Table '{table_name}' does not exist.")
         return
     
     table = database[table_name]
     columns = table['columns']
 
     if len(values) < len(columns):
-        print(f"Values for {len(columns) - len(values)} columns are missing")
+        print(f"Error: Values for {len(columns) - len(values)} columns are missing")
         return
     elif len(values) > len(columns):
-        print(f"Extra {len(values) - len(columns)} values are present")
+        print(f"Error: Extra {len(values) - len(columns)} values are present")
+        return
+
+    with table['lock']:
+        if is_columnar(table):
+            inserted = insert_columnar(table, values)
+        else:
+            inserted = insert_row(table, values)
+        if inserted:
+            if journal:
+                journal(('insert', table_name, list(values)))
+            publish(table)
+    if after_write:
+        after_write()
+
+def insert_row(table, values):
+    columns = table['columns']
+    if not fitting_rows(table, [values]):
+        print("Error: a value of an indexed column does not compare with the keys of its index.")
         return
-    
     # Create the row from values
     row = {columns[i]: values[i] for i in range(len(columns))}
+    row_id = len(table['data'])
     table['data'].append(row)
+    for column, value in row.items():
+        update_stats(table, column, value, value, isinstance(value, str))
     
     # Update the index for indexed columns
     for column, value in row.items():
         if column in table['index']:
-            # Append row to the list of rows for this value in the index
+            # Append the row id (its position in the row list) to the postings of this value
             if value not in table['index'][column]:
-                table['index'][column][value] = []
-            table['index'][column][value].append(row)
-    
-    # print(f"Row inserted into '{table_name}': {row}")
+                table['index'][column][value] = storage.postings()
+            table['index'][column][value].append(row_id)
+    return True
+
+def insert_columnar(table, values):
+    store = table['data']
+    try:
+        values = [storage.convert(store.types[column], value) for column, value in zip(table['columns'], values)]
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
 
-def select_from_table_indexed(table, condition=None, order_by=None, column=True):
-    selected_table = []
+    row_id = len(store)
+    store.append(values)
 
-    # If there is a condition, apply the filtering
-    if condition:
-        column1, operator, value_or_column2 = condition
-        if column1 not in table['columns']:
-            print(f"Error: Column '{column1}' does not exist.")
-            return
-        
-        # Compare two columns (when column=True)
-        if column:  # Compare two columns
-            if value_or_column2 not in table['columns']:
-                print(f"Error: Column '{value_or_column2}' does not exist.")
-                return
-
-            # Filter based on operator between two columns
-            def condition_filter(row):
-                left_value = row[column1]
-                right_value = row[value_or_column2]
-
-                if operator == ">":
-                    return str(left_value) > str(right_value)
-                elif operator == "<":
-                    return str(left_value) < str(right_value)
-                elif operator == "=":
-                    return str(left_value) == str(right_value)
-                return False
-            
-            selected_table = [row for row in table['data'] if condition_filter(row)]
-
-        else:  # Compare column with a value
-            if column1 in table['index']:
-                index = table['index'][column1]
-                if operator == "=":
-                    if value_or_column2 in index:
-                        selected_table.extend(index[value_or_column2])  # Use extend to add multiple rows
-                elif operator == ">":
-                    for key in index.irange(minimum=value_or_column2,inclusive=(False, True)):
-                        selected_table.extend(index[key])  # Use extend to add multiple rows
-                elif operator == "<":
-                    for key in index.irange(maximum=value_or_column2):
-                        selected_table.extend(index[key])  # Use extend to add multiple rows
-
-    # Sort the results if necessary
-    if order_by:
-        for column_name, order in reversed(order_by):  # Reverse to prioritize first columns
-            selected_table.sort(key=lambda x: x[column_name], reverse=(order.upper() == "DESC"))
-    
-    return selected_table
+    for column, value in zip(table['columns'], values):
+        update_stats(table, column, value, value, isinstance(value, str))
+        if column in table['index']:
+            index = table['index'][column]
+            if value not in index:
+                index[value] = storage.postings()
+            index[value].append(row_id)
+    return True
+
+def bulk_insert(table_name, rows, batch_size=65536):
+    # rows: any iterable of value lists, consumed batch_size rows at a time.
+    # the rows of a batch are appended at once and the indexes are merged once per batch
+    if table_name not in database:
+        print(f"Error: Table '{table_name}' does not exist.")
+        return 0
 
+    table = database[table_name]
+    rows = iter(rows)
+    inserted = 0
+    rejected = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        added = len(batch)
+        batch = [values for values in batch if len(values) == len(table['columns'])]
+        if is_columnar(table):
+            batch = convert_batch(table, batch)
+        batch = fitting_rows(table, batch)
+        rejected += added - len(batch)
+        if batch:
+            with table['lock']:
+                append_batch(table, batch)
+                if journal:
+                    journal(('bulk', table_name, [list(values) for values in batch]))
+                publish(table)
+            inserted += len(batch)
+            if after_write:
+                after_write()
+
+    if rejected:
+        print(f"{rejected} rows with wrong values were skipped")
+    return inserted
+
+def convert_batch(table, batch):
+    types = [table['types'][column] for column in table['columns']]
+    converted = []
+    for values in batch:
+        try:
+            converted.append([storage.convert(column_type, value) for column_type, value in zip(types, values)])
+        except ValueError:
+            pass
+    return converted
+
+# btree keys are compared with each other, so every key of an index has to be of one kind
+key_kinds = {str: str, int: float, float: float}
+
+def fitting_rows(table, batch):
+    # the rows whose values can be added to the btree indexes, checked before anything is
+    # changed: a None or a number among text keys would fail inside the SortedDict after the
+    # row was already appended. the values of columnar tables are converted to the column
+    # type, so only rows of the row layout can be rejected
+    columns = table['columns']
+    for column, index in table['index'].items():
+        if not isinstance(index, SortedDict) or not batch:
+            continue
+        position = columns.index(column)
+        keys = list(map(itemgetter(position), batch))
+        kinds = set(map(key_kinds.get, set(map(type, keys))))
+        if index:
+            kind = key_kinds.get(type(index.peekitem(0)[0]))
+        else:
+            kind = next(filter(None, map(key_kinds.get, map(type, keys))), None)
+        if kinds != {kind}:
+            batch = [values for values, key in zip(batch, keys) if kind is not None and key_kinds.get(type(key)) is kind]
+    return batch
+
+def append_batch(table, batch):
+    columns = table['columns']
+    column_values = list(zip(*batch))
+
+    first_id = len(table['data'])
+    if is_columnar(table):
+        table['data'].extend(column_values)
+    else:
+        table['data'].extend([dict(zip(columns, values)) for values in batch])
+    row_ids = range(first_id, first_id + len(batch))
+
+    for column, values in zip(columns, column_values):
+        text = set(map(type, values)) == {str}
+        try:
+            update_stats(table, column, min(values), max(values), text)
+        except TypeError:
+            update_stats(table, column, None, None, text)
+    for column, index in table['index'].items():
+        merge_index(index, column_values[columns.index(column)], row_ids)
+
+def merge_index(index, values, row_ids):
+    # group the batch by key, extend the postings of known keys
+    # and add the new keys with a single sorted bulk update
+    groups = {}
+    for value, row_id in zip(values, row_ids):
+        if value in groups:
+            groups[value].append(row_id)
+        else:
+            groups[value] = storage.postings((row_id,))
+    new_keys = {}
+    for value, ids in groups.items():
+        if value in index:
+            index[value].extend(ids)
+        else:
+            new_keys[value] = ids
+    index.update(new_keys)
+
+def find_rows(table, condition, column):
+    # the row ids of the rows matching the condition, located by the planner like the rows of
+    # a SELECT; None if the condition is not valid for this table
+    view = views.read_view(table)
+    plan = planner.plan_select(view, condition, None, column)
+    if plan is None:
+        return None
+    return planner.select_ids(view, plan)
+
+def bury(table, row_ids):
+    # tombstones for the rows, with a version older than the one the write will publish
+    version = next(versions)
+    table['dead'].update(dict.fromkeys(row_ids, version))
+
+def delete_from_table(table_name, condition=None, column=False):
+    # the deleted rows stay in place as tombstones, scans and index lookups skip them until a
+    # compaction drops them; nothing is shifted and the indexes are not touched
+    # :return: number of deleted rows
+    if table_name not in database:
+        print(f"Error: Table '{table_name}' does not exist.")
+        return 0
 
+    table = database[table_name]
+    with table['lock']:
+        row_ids = find_rows(table, condition, column)
+        if row_ids is None:
+            return 0
+        if row_ids:
+            bury(table, row_ids)
+            if journal:
+                journal(('delete', table_name, condition, column))
+            publish(table)
+    print(f"{len(row_ids)} rows deleted from '{table_name}'.")
+    if after_write:
+        after_write()
+    compact_if_due(table)
+    return len(row_ids)
+
+def update_table(table_name, assignments, condition=None, column=False):
+    # :param assignments: list of (column, value)
+    # an updated row is deleted and its new version appended with the other rows of the
+    # update, so read views taken before keep seeing the old values and the indexes only
+    # get the postings of the new versions merged in
+    # :return: number of updated rows
+    if table_name not in database:
+        print(f"Error: Table '{table_name}' does not exist.")
+        return 0
 
-def print_table(columns, table):
-    # table: list of dicts with col-val pairs where each dict is a row
+    table = database[table_name]
+    columns = table['columns']
+    values = {}
+    for column_name, value in assignments:
+        if column_name not in columns:
+            print(f"Error: Column '{column_name}' does not exist.")
+            return 0
+        if is_columnar(table):
+            try:
+                value = storage.convert(table['types'][column_name], value)
+            except ValueError as e:
+                print(f"Error: {e}")
+                return 0
+        values[column_name] = value
+
+    with table['lock']:
+        row_ids = find_rows(table, condition, column)
+        if row_ids is None:
+            return 0
+        if row_ids:
+            rows = table['data'].rows(row_ids) if is_columnar(table) else map(table['data'].__getitem__, row_ids)
+            batch = [[values[column_name] if column_name in values else row[column_name] for column_name in columns] for row in rows]
+            # nothing is changed when a new version can not go into the indexes
+            if len(fitting_rows(table, batch)) != len(batch):
+                print("Error: a value of an indexed column does not compare with the keys of its index.")
+                return 0
+            bury(table, row_ids)
+            append_batch(table, batch)
+            if journal:
+                journal(('update', table_name, [list(assignment) for assignment in assignments], condition, column))
+            publish(table)
+    print(f"{len(row_ids)} rows updated in '{table_name}'.")
+    if after_write:
+        after_write()
+    compact_if_due(table)
+    return len(row_ids)
+
+def compact_if_due(table):
+    # called once the writer has released the table's lock
+    with table['lock']:
+        if table.get('compacting') or len(table['dead']) <= compaction_threshold * len(table['data']):
+            return
+        table['compacting'] = True
+    threading.Thread(target=compact, args=(table,), daemon=True).start()
 
-    print('+' + ("=" * 16 + '+') * len(columns))
-    print('║' + ' ║'.join( col_name.ljust(15) for col_name in columns) + ' ║')
-    print('+' + ("=" * 16 + '+') * len(columns))
-    for row in table:
-        print('║' + ' |'.join( str(col_value).ljust(15) for col_value in list(row.values())) + ' ║')
-        print('+' + ("-" * 16 + '+') * len(columns))
+def compact_table(table_name):
+    # compacts the table now, whatever share of its rows are tombstones
+    if table_name not in database:
+        print(f"Error: Table '{table_name}' does not exist.")
+        return
+    table = database[table_name]
+    with table['lock']:
+        if table.get('compacting'):
+            return
+        table['compacting'] = True
+    compact(table)
+
+def compact(table):
+    # rewrites the table without its deleted rows. the rows and indexes are rebuilt from a read
+    # view while reads and writes go on; only the rows appended and deleted meanwhile are
+    # applied again under the table's lock, before the new rows, indexes and tombstones replace
+    # the old ones. read views taken before keep the old ones, nothing is journaled since the
+    # rows the table holds stay the same
+    try:
+        with table['lock']:
+            view = views.read_view(table)
+            dead_count = len(table['dead'])
+            dead = table['dead']
+        if not dead_count:
+            return
+        rows = view['rows']
+        # the tombstones of the view are the first ones, deletes only add to the end of the dict
+        dead = set(islice(dead.copy(), dead_count))
+        keep = list(filterfalse(dead.__contains__, range(rows)))
+        # new row id of every kept row: the number of kept rows before it
+        positions = storage.postings(accumulate(map(not_, map(dead.__contains__, range(rows))), initial=0))
+        if is_columnar(table):
+            data = view['data'].take(keep)
+        else:
+            data = planner.posting_items(view, keep)
+        indexes = {}
+        for column, index in view['index'].items():
+            remapped = index.remapped(positions)
+            indexes[column] = SortedDict(remapped) if index.ordered else remapped
+
+        with table['lock']:
+            if table['index'].keys() != indexes.keys():
+                return  # an index was created meanwhile, the next delete tries again
+            compacted = dict(table, data=data, index=indexes)
+            live = table['data']
+            if len(live) > rows:
+                appended = live.rows(range(rows, len(live))) if is_columnar(table) else live[rows:]
+                append_batch(compacted, [[row[column] for column in table['columns']] for row in appended])
+            newer = {}
+            for row_id, version in islice(table['dead'].items(), dead_count, None):
+                newer[positions[row_id] if row_id < rows else len(keep) + row_id - rows] = version
+            table['data'] = compacted['data']
+            table['index'] = indexes
+            table['dead'] = newer
+            table['key_cache'] = {}
+            publish(table)
+    finally:
+        table['compacting'] = False
+
+def select_from_table_indexed(table, condition=None, order_by=None, column=True, lazy=False):
+    # the planner decides whether an index is worth using
+    return planner.select(table, condition, order_by, column, lazy)
+
+def print_table(columns, table, out=None, fmt='table'):
+    # table: any iterable of dicts with col-val pairs where each dict is a row,
+    # a generator returned by a lazy select is streamed out in chunks
+    # :return: number of rows printed
+    if table is None:
+        return 0
+    return render.render(columns, table, out, fmt)
 
 
 def print_pretty_table(columns, table):
@@ -123,136 +504,20 @@ def print_pretty_table(columns, table):
 
     print(prettytable)
 
-def select_from_table(table, condition=None, order_by=None, column=True):
+def select_from_table(table, condition=None, order_by=None, column=True, lazy=False):
     
     # :param condition: A tuple  
     # example: ("name", ">", "Murzik") or ("age", ">", "salary").
+    # AND / OR / NOT combinations are nested tuples, see the top of planner.py
+    # example: ("and", [("name", ">=", "M", False), ("age", ">", "salary", True)])
 
     # :param order_by: A list of tuples
     # example: [("name", "ASC"), ("id", "DESC")].
     
     # :param column: Whether we should compare against a column (True) or a value (False)
-    
-    # :return: list of dicts with col-val pairs where each dict is a row
-
-    selected_table = table["data"]
-    columns = table["columns"]
-
-    # Filter rows based on WHERE condition
-    if condition:
-        column1, operator, value_or_column2 = condition
-        if column1 not in columns:
-            print(f"Error: Column '{column1}' does not exist.")
-            return
-
-        def condition_filter(row):
-            left_value = row[column1]
-            # Right value can be another column or a literal
-            right_value = row[value_or_column2] if column else value_or_column2
-
-            if operator == ">":
-                return str(left_value) > str(right_value)
-            return False
-
-        selected_table = [row for row in selected_table if condition_filter(row)]
-
-    # Sort rows based on ORDER_BY clause
-    if order_by:
-        for column_name, order in reversed(order_by):  # Reverse to prioritize first columns
-            if column_name not in columns:
-                print(f"Error: Column '{column_name}' does not exist.")
-                return
-            selected_table.sort(key=lambda x: x[column_name], reverse=(order.upper() == "DESC"))
-
-    # Print the result in table format
-    return selected_table
-
-
 
+    # :param lazy: Return a generator that yields the rows one by one instead of a list
     
+    # :return: list of dicts with col-val pairs where each dict is a row
 
-# Example usage
-
-if __name__ == "__main__":
-
-    # Create a table named 'employees'
-    print('CREATE employees (id, name, position, salary, department)')
-    create_table("employees", ["id", "name", "position", "salary", "department"], ['salary', 'id', 'name'])
-    # Populate the 'employees' table with 10 entries
-
-    names = [
-    "Alice", "Bob", "Charlie", "Diana", "Edward", "Fiona", "George", "Hannah", 
-    "Ian", "Jessica", "Kevin", "Laura", "Michael", "Nina", "Oliver", "Paula", 
-    "Quentin", "Rachel", "Steven", "Tina"
-    ]
-    positions = [
-        "Manager", "Developer", "Analyst", "HR Specialist", "Intern", "Team Lead", "CEO", 
-        "Marketing Manager", "Sales Associate", "Data Scientist", "Software Engineer", 
-        "Consultant", "Financial Advisor", "Product Manager", "IT Specialist", 
-        "UX Designer", "Security Analyst", "Support Engineer", "HR Manager", "Accountant"
-    ]
-    salaries = [
-        85000, 75000, 70000, 60000, 35000, 90000, 150000, 95000, 45000, 105000, 
-        95000, 80000, 88000, 78000, 82000, 72000, 89000, 68000, 87000, 76000
-    ]
-    departments = [
-        "HR", "IT", "Finance", "HR", "Marketing", "Management", "Executive", 
-        "Marketing", "Sales", "Data Analytics", "Development", "Consulting", 
-        "Finance", "Product", "IT", "Design", "Security", "Support", "HR", "Accounting"
-    ]
-    n = 1000000
-    for i in range(n):
-        insert_into_table(
-            "employees", 
-            [
-                i, 
-                random.choice(names), 
-                random.choice(positions), 
-                str(random.choice(salaries)), 
-                random.choice(departments)
-                ]
-            )    
-
-    print(f"inserted { n } random rows")
-
-    start = time.time()
-    # selected = select_from_table(
-    #     database['employees'], 
-    #     condition=("name", ">", "Michael"), 
-    #     # order_by=[("name", "ASC"), ("id", "DESC")],
-    #     column=False
-        # )
-    selected = select_from_table(
-        database['employees'], 
-        condition=("name", ">", "position"), 
-        # order_by=[("name", "ASC"), ("id", "DESC")],
-        column=True
-        )
-    end = time.time()
-
-    start_indexed = time.time()
-    # selected_indexed = select_from_table_indexed(
-    #     database['employees'], 
-    #     condition=("name", ">", "Michael"), 
-    #     # order_by=[("name", "ASC"), ("id", "DESC")],
-    #     column=False
-    #     )
-    selected_indexed = select_from_table_indexed(
-        database['employees'], 
-        condition=("name", ">", "position"), 
-        # order_by=[("name", "ASC"), ("id", "DESC")],
-        column=True
-        )
-    end_indexed = time.time()
-
-    print(f"time taken for regular: {end - start} sec. | {len(selected)} rows")
-    print(f"time taken for indexed: {end_indexed - start_indexed} sec. | {len(selected_indexed)} rows")
-
-    # print_pretty_table(database['employees']['columns'], selected)
-    # print_pretty_table(database['employees']['columns'], selected_indexed)
-
-    # print_pretty_table(database['employees']['columns'], select_from_table(database['employees']))
-
-    # print_pretty_table(database['employees']['columns'], select_from_table(database['employees'], condition=("name", ">", "salary"), order_by=[("name", "ASC"), ("id", "DESC")]))
-
-    # print("Query by index 'age=30':", print_pretty_table(database['employees']['columns'], query_by_index("employees", "salary", 75000)))
+    return planner.select(table, condition, order_by, column, lazy, use_indexes=False)
@@ -0,0 +1,291 @@
+import operator as op
+from itertools import chain, islice
+from math import log2
+import storage
+import planner
+
+# SELECT FROM a JOIN b ON a.x = b.y: the pairs of rows of both tables with equal join values,
+# as rows with the qualified column names "a.x", "b.y". WHERE and ORDER BY name the columns
+# qualified, or bare when only one of the tables has them. the parts of an AND in WHERE that
+# only name the columns of one table filter that table before the join, through its own plan
+# (and indexes); the rest is checked on the joined rows. two ways to find the pairs:
+#   hash_join  - build a dict join value -> rows over the side with fewer rows, then probe
+#                it with every row of the other side
+#   index_join - look the join value of every row of one side up in the index (btree or hash)
+#                on the join column of the other side; no hash table, the other side is not scanned
+# the cheaper one is picked from the estimated row counts of both (filtered) sides
+
+# putting one row into the hash table and probing it with one row
+build_cost = 1.5
+probe_cost = 1.0
+
+def kind(table, column):
+    # 'number' or 'text' for the columns compared as they are, None for a row layout
+    # column without text, whose values are compared as text
+    if planner.is_columnar(table) and table['types'][column] in ('int', 'float'):
+        return 'number'
+    return 'text' if planner.is_text(table, column) else None
+
+def plan_join(tables, names, on, condition=None, order_by=None, limit=None, offset=0):
+    # :param tables: the two tables (read views) in the order they were named
+    # :param names: their names
+    # :param on: the two column names of ON, qualified or bare
+    # :return: plan dict, or None if the query is not valid for these tables
+    if names[0] == names[1]:
+        print("Error: a table can not be joined with itself.")
+        return
+    owner = {}  # qualified column -> (side, bare column)
+    bare = {}   # bare column -> qualified columns
+    for side, (name, table) in enumerate(zip(names, tables)):
+        for column in table['columns']:
+            owner[name + '.' + column] = (side, column)
+            bare.setdefault(column, []).append(name + '.' + column)
+
+    def resolve(column_name):
+        if column_name in owner:
+            return column_name
+        if len(bare.get(column_name, [])) == 1:
+            return bare[column_name][0]
+        if column_name in bare:
+            print(f"Error: Column '{column_name}' is in both tables, write it as {' or '.join(bare[column_name])}.")
+        else:
+            print(f"Error: Column '{column_name}' does not exist.")
+        return None
+
+    def qualify(condition):
+        # the condition with qualified column names and the values converted for their columns
+        if not planner.is_comparison(condition):
+            kind_, operand = condition
+            children = [qualify(child) for child in ([operand] if kind_ == 'not' else operand)]
+            if None in children:
+                return None
+            return ('not', children[0]) if kind_ == 'not' else (kind_, children)
+        column1, operator, value_or_column2, column = condition
+        column1 = resolve(column1)
+        if column1 is None:
+            return None
+        if column:
+            value_or_column2 = resolve(value_or_column2)
+            return None if value_or_column2 is None else (column1, operator, value_or_column2, True)
+        side, column_name = owner[column1]
+        checked = planner.check_condition(tables[side], (column_name, operator, value_or_column2, False))
+        return None if checked is None else (column1, operator, checked[2], False)
+
+    keys = []
+    for column_name in on:
+        keys.append(resolve(column_name))
+        if keys[-1] is None:
+            return
+    if owner[keys[0]][0] == owner[keys[1]][0]:
+        print("Error: the columns of ON must come from different tables.")
+        return
+    keys.sort(key=lambda column_name: owner[column_name][0])
+    if condition:
+        condition = qualify(planner.normalize_condition(condition, True))
+        if condition is None:
+            return
+    if order_by:
+        order_by = [(resolve(column_name), order) for column_name, order in order_by]
+        if any(column_name is None for column_name, order in order_by):
+            return
+
+    # the parts of an AND that only name the columns of one side filter that side
+    pushed = [[], []]
+    residual = []
+    conditions = [condition] if condition else []
+    if condition and not planner.is_comparison(condition) and condition[0] == 'and':
+        conditions = condition[1]
+    for child in conditions:
+        sides = {owner[column_name][0] for column_name in condition_columns(child)}
+        if len(sides) == 1:
+            pushed[sides.pop()].append(rename(child, {column_name: owner[column_name][1] for column_name in owner}))
+        else:
+            residual.append(child)
+
+    sides = []
+    for side, (name, table) in enumerate(zip(names, tables)):
+        side_condition = planner.join_conditions('and', pushed[side])
+        plan = planner.plan_select(table, side_condition)
+        if plan is None:
+            return
+        sides.append({'name': name, 'table': table, 'column': owner[keys[side]][1], 'condition': side_condition,
+                      'plan': plan, 'rows': plan['estimated_rows']})
+    left, right = sides
+
+    distinct = max(planner.distinct_count(left['table'], left['column']) or 1,
+                   planner.distinct_count(right['table'], right['column']) or 1)
+    estimated_rows = int(left['rows'] * right['rows'] / distinct)
+    build = 0 if left['rows'] <= right['rows'] else 1
+    candidates = [{'access': 'hash_join', 'build': build, 'outer': None,
+                   'cost': left['plan']['cost'] + right['plan']['cost'] + build_cost * sides[build]['rows'] + probe_cost * sides[1 - build]['rows']}]
+    for inner in (0, 1):
+        # the inner side is only read through the index on its join column
+        side = sides[inner]
+        index = side['table']['index'].get(side['column'])
+        if index is None or not planner.index_fits(side['table'], side['column']):
+            continue
+        outer = sides[1 - inner]
+        matches = len(side['table']['data']) / (planner.distinct_count(side['table'], side['column']) or 1)
+        probe = log2(len(index) + 1) if planner.is_ordered(index) else 1
+        filtering = planner.scan_cost * planner.comparison_count(side['condition']) if side['condition'] else 0
+        candidates.append({'access': 'index_join', 'build': None, 'outer': 1 - inner,
+                           'cost': outer['plan']['cost'] + outer['rows'] * (probe + matches * (planner.fetch_cost + filtering))})
+    plan = min(candidates, key=lambda candidate: candidate['cost'])
+
+    sorting = planner.sort_cost * estimated_rows * log2(estimated_rows + 1) if order_by else 0
+    plan.update(sides=sides, columns=list(owner), condition=condition, residual=planner.join_conditions('and', residual),
+                kinds={column_name: kind(tables[side], column_name_) for column_name, (side, column_name_) in owner.items()},
+                order_by=order_by, limit=limit, offset=offset, estimated_rows=estimated_rows, cost=plan['cost'] + sorting)
+    return plan
+
+def condition_columns(condition):
+    if not planner.is_comparison(condition):
+        return [column_name for child in ([condition[1]] if condition[0] == 'not' else condition[1]) for column_name in condition_columns(child)]
+    return [condition[0], condition[2]] if condition[3] else [condition[0]]
+
+def rename(condition, names):
+    # the condition with its column names replaced by names[column]
+    if not planner.is_comparison(condition):
+        if condition[0] == 'not':
+            return ('not', rename(condition[1], names))
+        return (condition[0], [rename(child, names) for child in condition[1]])
+    column1, operator, value_or_column2, column = condition
+    return (names[column1], operator, names[value_or_column2] if column else value_or_column2, column)
+
+def join_key(plan):
+    # the function that turns a join value into the value that is hashed: columns of the
+    # same kind are compared as they are, anything else as text
+    left, right = plan['sides']
+    kinds = {kind(left['table'], left['column']), kind(right['table'], right['column'])}
+    return None if len(kinds) == 1 and None not in kinds else str
+
+def index_key(plan, inner):
+    # the function that turns a join value of the outer side into the key of the index on
+    # the inner side, or raises ValueError when no key can be equal to it
+    if join_key(plan) is None:
+        return lambda value: value
+    side = plan['sides'][inner]
+    if not planner.is_columnar(side['table']) or side['table']['types'][side['column']] in ('str', 'dict'):
+        return str
+    column_type = side['table']['types'][side['column']]
+
+    def key(value):
+        # compared as text: 7 only joins "7", not "007"
+        text = str(value)
+        converted = storage.convert(column_type, text)
+        if str(converted) != text:
+            raise ValueError(text)
+        return converted
+    return key
+
+def compile_joined(plan, condition):
+    # the condition as a callable over a joined row, comparing like planner.compile_predicate
+    if not planner.is_comparison(condition):
+        kind_, operand = condition
+        if kind_ == 'not':
+            test = compile_joined(plan, operand)
+            return lambda row: not test(row)
+        tests = [compile_joined(plan, child) for child in operand]
+        if kind_ == 'and':
+            return lambda row: all([test(row) for test in tests])
+        return lambda row: any([test(row) for test in tests])
+    column1, operator, value_or_column2, column = condition
+    compare = planner.comparisons[operator]
+    kinds = plan['kinds']
+    get = op.itemgetter(column1)
+    if column:
+        get_right = op.itemgetter(value_or_column2)
+        if kinds[column1] is not None and kinds[column1] == kinds[value_or_column2]:
+            return lambda row: compare(get(row), get_right(row))
+        return lambda row: compare(str(get(row)), str(get_right(row)))
+    if kinds[column1] is not None:
+        return lambda row: compare(get(row), value_or_column2)
+    value = str(value_or_column2)
+    return lambda row: compare(str(get(row)), value)
+
+def side_rows(side):
+    return planner.execute(side['table'], side['plan'], lazy=True)
+
+def pairs(plan):
+    # yields the (left row, right row) pairs with equal join values
+    left, right = plan['sides']
+    key = join_key(plan)
+    if plan['access'] == 'hash_join':
+        build = plan['build']
+        build_column, probe_column = plan['sides'][build]['column'], plan['sides'][1 - build]['column']
+        hashed = {}
+        for row in side_rows(plan['sides'][build]):
+            value = row[build_column]
+            hashed.setdefault(value if key is None else key(value), []).append(row)
+        for row in side_rows(plan['sides'][1 - build]):
+            value = row[probe_column]
+            matches = hashed.get(value if key is None else key(value))
+            if matches:
+                for match in matches:
+                    yield (match, row) if build == 0 else (row, match)
+        return
+
+    outer, inner = plan['outer'], 1 - plan['outer']
+    outer_column = plan['sides'][outer]['column']
+    side = plan['sides'][inner]
+    index = side['table']['index'][side['column']]
+    keep = planner.compile_predicate(side['table'], side['condition']) if side['condition'] else None
+    lookup_key = index_key(plan, inner)
+    for row in side_rows(plan['sides'][outer]):
+        try:
+            postings = index.get(lookup_key(row[outer_column]))
+        except (ValueError, TypeError):
+            continue
+        if not postings:
+            continue
+        postings = planner.posting_items(side['table'], postings)
+        if keep is not None:
+            postings = list(filter(keep, postings))
+        for match in planner.materialize(side['table'], postings):
+            yield (row, match) if outer == 0 else (match, row)
+
+def execute(plan, lazy=False):
+    # :return: the joined rows, a generator if lazy
+    columns = plan['columns']
+    rows = (dict(zip(columns, chain(left.values(), right.values()))) for left, right in pairs(plan))
+    if plan['residual']:
+        rows = filter(compile_joined(plan, plan['residual']), rows)
+    limit, offset = plan['limit'], plan['offset']
+    if plan['order_by']:
+        if limit is not None:
+            rows = planner.top_rows(rows, plan['order_by'], offset + limit)
+        else:
+            rows = list(rows)
+            planner.sort_rows(rows, plan['order_by'])
+    if limit is not None or offset:
+        rows = islice(rows, offset, None if limit is None else offset + limit)
+    return rows if lazy else list(rows)
+
+def describe(plan):
+    # the plan as lines of text for EXPLAIN
+    left, right = plan['sides']
+    on = f"{left['name']}.{left['column']} = {right['name']}.{right['column']}"
+    inner = None
+    if plan['access'] == 'hash_join':
+        lines = [f"access: hash join on {on}, hash table built over {plan['sides'][plan['build']]['name']}"]
+    else:
+        inner = plan['sides'][1 - plan['outer']]
+        lines = [f"access: index join on {on}, {plan['sides'][plan['outer']]['name']} looked up in the index on {inner['name']}.{inner['column']}"]
+    for side in plan['sides']:
+        if plan['access'] == 'index_join' and side is inner:
+            # only read through the index, its own plan is not used
+            side_lines = [f"access: index lookups on {side['column']}"]
+            if side['condition']:
+                side_lines.append("filter: " + planner.condition_text(side['condition']))
+        else:
+            side_lines = planner.describe(side['plan'])
+        lines.extend(f"  {side['name']}: {line}" for line in side_lines)
+    if plan['residual']:
+        lines.append("filter: " + planner.condition_text(plan['residual']))
+    if plan['order_by']:
+        lines.append("order by: " + ", ".join(f"{column_name} {order.upper()}" for column_name, order in plan['order_by']))
+        lines.append("sort: " + ("top-k heap" if plan['limit'] is not None else "full sort"))
+    if plan['limit'] is not None or plan['offset']:
+        lines.append(f"limit: {plan['limit']} offset: {plan['offset']}")
+    lines.append(f"estimated rows: {plan['estimated_rows']}  cost: {plan['cost']:.1f}")
+    return lines
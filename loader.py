@@ -0,0 +1,68 @@
+import csv, json, os
+import database
+
+# file extensions recognized by COPY when no format is given
+formats = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.json': 'jsonl'}
+
+def read_csv(path, columns):
+    # yields value lists in the table's column order,
+    # the first line is used as a header if it holds the column names
+    with open(path, newline='', encoding='utf-8') as file:
+        reader = csv.reader(file)
+        first = next(reader, None)
+        if first is None:
+            return
+        if sorted(first) == sorted(columns):
+            order = [first.index(column) for column in columns]
+            if order == list(range(len(columns))):
+                yield from reader
+            else:
+                for values in reader:
+                    yield [values[i] for i in order] if len(values) == len(order) else values
+        else:
+            yield first
+            yield from reader
+
+def read_jsonl(path, columns):
+    # one json object (column -> value) or list (values in column order) per line
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if isinstance(record, dict):
+                yield [text(record.get(column)) for column in columns]
+            else:
+                yield [text(value) for value in record]
+
+def text(value):
+    # values are kept as text like the ones coming from INSERT, typed columns convert them later
+    if value is None:
+        return ""
+    return value if isinstance(value, str) else str(value)
+
+def copy_from(table_name, path, file_format=None, batch_size=65536):
+    if table_name not in database.database:
+        print(f"Error: Table '{table_name}' does not exist.")
+        return 0
+    if not os.path.isfile(path):
+        print(f"Error: File '{path}' does not exist.")
+        return 0
+
+    file_format = (file_format or formats.get(os.path.splitext(path)[1].lower(), 'csv')).lower()
+    columns = database.database[table_name]['columns']
+    if file_format == 'csv':
+        rows = read_csv(path, columns)
+    elif file_format == 'jsonl':
+        rows = read_jsonl(path, columns)
+    else:
+        print(f"Error: Unknown file format '{file_format}', expected CSV or JSONL.")
+        return 0
+
+    try:
+        count = database.bulk_insert(table_name, rows, batch_size)
+    except (ValueError, csv.Error) as e:
+        print(f"Error while reading '{path}': {e}")
+        return 0
+    print(f"{count} rows copied into '{table_name}'.")
+    return count
@@ -0,0 +1,86 @@
+import sys, time, random, asyncio, argparse
+from client import AsyncClient, QueryError
+
+# load generator for server.py: many concurrent connections send a mix of statements
+# and the throughput and latency percentiles are reported
+#   python main.py --serve 127.0.0.1:5433 &
+#   python loadgen.py --clients 64 --requests 200 --rows 100000
+
+# statements sent by the clients, %(id)d and %(value)d are filled in for every request
+workload = {
+    'point': 'SELECT FROM load WHERE id = "%(id)d";',
+    'range': 'SELECT FROM load WHERE value > "%(value)d" ORDER_BY value ASC LIMIT 20;',
+    'insert': 'INSERT INTO load ("%(id)d", "%(value)d", "name%(value)d");',
+}
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+async def setup(host, port, rows, batch=1000):
+    client = await AsyncClient.connect(host, port)
+    try:
+        await client.execute('CREATE load (id INT INDEXED, value INT INDEXED, name TEXT);')
+    except QueryError:
+        pass  # table left from an earlier run
+    for start in range(0, rows, batch):
+        statements = ''.join('INSERT INTO load ("%d", "%d", "name%d");\n' % (i, i % 1000, i % 1000)
+                             for i in range(start, min(start + batch, rows)))
+        # one request with many statements, every statement answers with a status line
+        client.writer.write(statements.encode('utf-8'))
+        await client.writer.drain()
+        for i in range(start, min(start + batch, rows)):
+            await client.reader.readline()
+    await client.close()
+
+async def run_client(host, port, requests, mix, rows, seed, latencies, errors):
+    rng = random.Random(seed)
+    client = await AsyncClient.connect(host, port)
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    for i in range(requests):
+        kind = rng.choices(kinds, weights)[0]
+        statement = workload[kind] % {'id': rng.randrange(rows * 2 or 1), 'value': rng.randrange(1000)}
+        start = time.perf_counter()
+        try:
+            await client.execute(statement)
+        except QueryError:
+            errors.append(kind)
+        latencies[kind].append(time.perf_counter() - start)
+    await client.close()
+
+async def generate(host, port, clients, requests, rows, mix, seed):
+    if rows:
+        await setup(host, port, rows)
+    latencies = {kind: [] for kind in mix}
+    errors = []
+    start = time.perf_counter()
+    await asyncio.gather(*[run_client(host, port, requests, mix, rows, seed + i, latencies, errors) for i in range(clients)])
+    elapsed = time.perf_counter() - start
+
+    total = sum(len(values) for values in latencies.values())
+    sys.stdout.write(f"{clients} clients, {total} requests in {elapsed:.2f} sec: {total / elapsed:.0f} requests/sec, {len(errors)} errors\n")
+    for kind, values in list(latencies.items()) + [('all', [value for values in latencies.values() for value in values])]:
+        if not values:
+            continue
+        values.sort()
+        sys.stdout.write(f"{kind:<8} {len(values):>8}  p50 {percentile(values, 0.5) * 1000:8.2f} ms  p90 {percentile(values, 0.9) * 1000:8.2f} ms"
+                         f"  p99 {percentile(values, 0.99) * 1000:8.2f} ms  max {values[-1] * 1000:8.2f} ms\n")
+
+def main(argv=None):
+    arguments = argparse.ArgumentParser(description="load generator for the OAA database server")
+    arguments.add_argument("--host", default="127.0.0.1")
+    arguments.add_argument("--port", type=int, default=5433)
+    arguments.add_argument("--clients", type=int, default=16, help="concurrent connections")
+    arguments.add_argument("--requests", type=int, default=100, help="statements sent by every connection")
+    arguments.add_argument("--rows", type=int, default=10000, help="rows loaded into the load table first, 0 to skip")
+    arguments.add_argument("--mix", default="point=8,range=1,insert=1", help="relative weights of the statement kinds")
+    arguments.add_argument("--seed", type=int, default=42)
+    options = arguments.parse_args(argv)
+    mix = {kind: float(weight) for kind, weight in (part.split("=") for part in options.mix.split(","))}
+    for kind in mix:
+        if kind not in workload:
+            arguments.error(f"unknown statement kind '{kind}', expected one of {', '.join(workload)}")
+    asyncio.run(generate(options.host, options.port, options.clients, options.requests, options.rows, mix, options.seed))
+
+if __name__ == "__main__":
+    main()
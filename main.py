@@ -1,4 +1,40 @@
+import sys
+import argparse
 from parser import Interpreter
+import persistence
+import database
+import parallel
+import resultcache
 
-a=Interpreter()
-a.interpret()
+arguments=argparse.ArgumentParser(description="OAA database")
+arguments.add_argument("script", nargs="?", help="file with commands to run instead of the prompt, - for stdin")
+arguments.add_argument("--data-dir", help="directory to keep the database in, nothing is saved without it")
+arguments.add_argument("--sync-every", type=int, default=1000, help="fsync the log after this many changes or one second, whichever comes first")
+arguments.add_argument("--snapshot-every", type=int, default=None, help="write a snapshot after this many changes")
+arguments.add_argument("--workers", type=int, default=parallel.workers, help="processes for parallel scans, 1 turns them off")
+arguments.add_argument("--parallel-threshold", type=int, default=parallel.threshold, help="scan tables with at least this many rows in parallel")
+arguments.add_argument("--result-cache", type=int, default=0, metavar="MB", help="cache SELECT results in this many megabytes, 0 turns the cache off")
+arguments.add_argument("--compaction-threshold", type=float, default=database.compaction_threshold, help="compact a table once this share of its rows are deleted")
+arguments.add_argument("--serve", metavar="HOST:PORT", help="serve the database over TCP instead of reading commands")
+options=arguments.parse_args()
+
+parallel.workers=options.workers
+parallel.threshold=options.parallel_threshold
+database.compaction_threshold=options.compaction_threshold
+resultcache.results.resize(options.result_cache<<20)
+
+if options.data_dir:
+    persistence.open_storage(options.data_dir, options.sync_every, snapshot_every=options.snapshot_every)
+
+if options.serve:
+    import server
+    host, _, port=options.serve.rpartition(":")
+    server.run(host or "127.0.0.1", int(port))
+elif options.script and options.script!="-":
+    with open(options.script, encoding="utf-8") as script:
+        Interpreter(script).interpret()
+elif options.script=="-" or not sys.stdin.isatty():
+    #commands piped in: run them without prompts
+    Interpreter(sys.stdin).interpret()
+else:
+    Interpreter().interpret()
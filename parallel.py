@@ -0,0 +1,54 @@
+import os, threading
+from array import array
+from itertools import compress, count
+from multiprocessing import get_all_start_methods, get_context
+
+# full scans of large tables are split into row ranges that are filtered in worker processes.
+# the workers are forked for every scan, so they see the table exactly as it is and read the
+# column data from the memory they share with the parent (copy-on-write) instead of getting
+# it pickled; only the ids of the matching rows are sent back, as typed arrays
+
+# tables with fewer rows are scanned in the calling process
+threshold = 1000000
+
+# number of worker processes, 1 turns parallel scans off
+workers = os.cpu_count() or 1
+
+# planner cost of starting the workers and collecting their results, in rows of a scan
+startup_cost = 50000
+
+# the workers need fork to inherit the table, spawned processes would have to unpickle it
+available = 'fork' in get_all_start_methods()
+
+# selectors(start, stop) of the running scan, set before the workers are forked;
+# scans from several threads take turns
+selectors = None
+scan_lock = threading.Lock()
+
+def usable(rows):
+    return available and workers > 1 and rows >= threshold and rows > 0
+
+def scan_range(bounds):
+    start, stop = bounds
+    return array('q', compress(count(start), selectors(start, stop)))
+
+def scan(row_count, compiled, processes=None):
+    # :param compiled: selectors function of planner.compile_selectors
+    # :return: list of the ids of the matching rows in row order
+    global selectors
+    if not row_count:
+        return []
+    processes = processes or workers
+    step = -(-row_count // processes)
+    ranges = [(start, min(start + step, row_count)) for start in range(0, row_count, step)]
+    with scan_lock:
+        selectors = compiled
+        try:
+            with get_context('fork').Pool(len(ranges)) as pool:
+                parts = pool.map(scan_range, ranges)
+        finally:
+            selectors = None
+    ids = array('q')
+    for part in parts:
+        ids.extend(part)
+    return ids.tolist()
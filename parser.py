@@ -1,11 +1,35 @@
 import sys
 import re #regex
+import io
+from time import perf_counter
+from collections import OrderedDict
 import database
+import storage
+import loader
+import render
+import planner
+import joins
+import aggregate
+import resultcache
+import views
+import persistence
 
-whitespaces = [' ', '\t', '\r', '\n', '\0']
-specialchar = ['(', ')', ',', ';', '>', '<', '=']
+# one compiled pattern for all tokens, applied to whole buffers at once;
+# strings can not span lines, so a buffer can be cut at any line break
+token_pattern=re.compile(r"""
+     (?P<space>\s+)
+    |"(?P<string>[^"\n]*)"
+    |(?P<error>"[^\n]*)
+    |(?P<sign><=|>=|!=|<>|[<>=])
+    |(?P<comma>,)
+    |(?P<bracket>[()])
+    |(?P<end>;)
+    |(?P<keyword>(?:[^\s(),;<>="!]|!(?!=))+)
+""", re.VERBOSE)
 
 class Token(object):
+    __slots__=("type", "text")
+
     def __init__(self, type, text):
         self.type=type
         self.text=text
@@ -20,106 +44,168 @@ class Token(object):
         return self.__str__()
 
 class Lexer(object):
-    def __init__(self, text=""):
-        self.text=text+"\n"
-        self.pos=0
-        self.current_char=self.text[self.pos]
+    def tokenize(self, text):
+        tokens=[]
+        for match in token_pattern.finditer(text):
+            kind=match.lastgroup
+            if kind=="space":
+                continue
+            if kind=="error":
+                sys.stderr.write('ERROR at '+match.group(kind)[:10]+': a string must be written on a single line\n')
+                tokens.append(Token("error", "string break"))
+            else:
+                tokens.append(Token(kind, match.group(kind)))
+        return tokens
 
-    def getinput(self, text=".. "):
-        self.text=input(text)+"\n"
-        self.pos=0
-        self.current_char=self.text[self.pos]
-        
-    def advance(self):
-        self.pos+=1
-        if self.pos >= len(self.text):
-            self.getinput()
-        else:
-            self.current_char = self.text[self.pos]
-        
-    def skip_whitespace(self):
-        while self.current_char is not None and self.current_char in whitespaces:
-            self.advance()
-            
-    def get_next_token(self):
-        text=""
-        if self.current_char in whitespaces:
-            self.skip_whitespace()
-
-        if self.current_char=='"':
-            self.advance()
-            while self.current_char!='"':
-                if self.current_char=="\n":
-                    sys.stderr.write('ERROR at '+text[-10:]+': a string must be written on a single line\n')
-                    return Token("error", "string break")
-                else:
-                    text+=self.current_char
-                    self.advance()
-            self.advance()
-            return Token("string", text)
-
-        elif self.current_char=='>' or self.current_char=='<' or self.current_char=='=':
-            text+=self.current_char
-            self.advance()
-            return Token("sign", text)
-
-        elif self.current_char==',':
-            self.advance()
-            return Token("comma", ",")
-
-        elif self.current_char=='(' or self.current_char==')':
-            text+=self.current_char
-            self.advance()
-            return Token("bracket", text)
-
-        elif self.current_char==';':
-            #no need to advance past this
-            return Token("end", ";")
-        
-        else:
-            while self.current_char not in whitespaces and self.current_char not in specialchar:
-                text+=self.current_char
-                self.advance()
-            return Token("keyword", text)
+def is_quit(token):
+    return token.type=="keyword" and token.text.lower() in ("q", "quit")
 
 class Parser(object):
-    def __init__(self):
-        self.lexer=Lexer(input("> "))
-        self.current_token=self.lexer.get_next_token()
+    # splits the input into statements: lists of tokens ending with the "end" token.
+    # reads from the interactive prompt, or from a file/pipe in batch mode (no prompts)
 
-    def next_token(self):
-        self.current_token=self.lexer.get_next_token()
+    def __init__(self, source=None):
+        self.lexer=Lexer()
+        self.source=source
+        self.pending=[]
 
-    def reset(self):
-        self.lexer.getinput("> ")
-        self.next_token()
+    def statements(self):
+        if self.source is None:
+            return self.prompt_statements()
+        return self.batch_statements()
 
-    def tokenize(self):
-        tokens=[]
-        while self.current_token.type!="end":
-            if self.current_token.type=="error":
-                return []
-            elif self.current_token.text.lower()=="q" or self.current_token.text.lower()=="quit":
-                return [Token("end", "quit")]
-            tokens.append(self.current_token)
-            self.next_token()
-        tokens.append(self.current_token)
-        return tokens
+    def split(self, tokens):
+        # whole statements found so far; a statement with a lexer error is dropped
+        for token in tokens:
+            if token.type=="error":
+                self.pending=[]
+                continue
+            self.pending.append(token)
+            if token.type=="end":
+                statement=self.pending
+                self.pending=[]
+                yield statement
+
+    def prompt_statements(self):
+        while True:
+            try:
+                line=input("> " if not self.pending else ".. ")
+            except EOFError:
+                return
+            tokens=self.lexer.tokenize(line)
+            if not self.pending and tokens and is_quit(tokens[0]):
+                return
+            yield from self.split(tokens)
+
+    def batch_statements(self):
+        buffer=""
+        while True:
+            chunk=self.source.read(1 << 20)
+            if not chunk:
+                break
+            buffer+=chunk
+            cut=buffer.rfind("\n")+1
+            if cut:
+                yield from self.split(self.lexer.tokenize(buffer[:cut]))
+                buffer=buffer[cut:]
+        yield from self.split(self.lexer.tokenize(buffer))
+        if self.pending:
+            sys.stderr.write('Error: the last command is missing its ";"\n')
+            self.pending=[]
+
+    def parse(self, text):
+        # statements of a string, for running commands from code
+        self.pending=[]
+        statements=list(self.split(self.lexer.tokenize(text+"\n")))
+        self.pending=[]
+        return statements
+
+
+# statements that go through the statement cache and can be prepared
+cached_commands=("SELECT", "INSERT", "DELETE", "UPDATE")
+
+class Param(object):
+    # placeholder for the n-th literal value of a parsed statement
+    __slots__=("index",)
+
+    def __init__(self, index):
+        self.index=index
+
+def normalize(tokens, placeholders=False):
+    # replaces the literal values (and, for a statement being prepared, the ? placeholders)
+    # with numbered parameter tokens; outside PREPARE a ? stays a keyword and is rejected by
+    # the parser like any other misplaced word
+    # :return: (cache key, values of the literals with None for ?, tokens to parse)
+    key=[]
+    params=[]
+    template=[]
+    for token in tokens:
+        if token.type=="string" or (placeholders and token.type=="keyword" and token.text=="?"):
+            params.append(None if token.type=="keyword" else token.text)
+            token=Token("param", str(len(params)-1))
+        template.append(token)
+        key.append(token.type if token.type=="param" else token.text)
+    return tuple(key), params, template
+
+def bind(statement, params):
+    # copy of a parsed statement with the parameter values filled in
+    if isinstance(statement, Param):
+        return params[statement.index]
+    if isinstance(statement, dict):
+        return {key: bind(value, params) for key, value in statement.items()}
+    if isinstance(statement, (list, tuple)):
+        return type(statement)(bind(value, params) for value in statement)
+    return statement
+
+# the stages of a query timed in its metrics, besides parse and plan
+select_stages=('parse', 'plan', 'filter', 'sort', 'render')
+execute_stages=('parse', 'plan', 'execute')
 
+def start_metrics(metrics):
+    # the metrics dict of a query: the one of EXPLAIN or of a statement timed from its parsing,
+    # a new one for a prepared statement while query hooks want them, else None
+    if metrics is None and database.query_hooks:
+        return {'parse': 0.0, 'cached': True}
+    return metrics
+
+def total_time(metrics, stages):
+    metrics['total']=sum(metrics[stage] for stage in stages)
+
+def timing_line(metrics, stages):
+    # the "stage: x ms" line of EXPLAIN ANALYZE, with the total
+    total_time(metrics, stages)
+    return ('  '.join(stage+': '+format(metrics[stage]*1000, '.3f')+' ms' for stage in stages+('total',))
+        +('  (cached statement)' if metrics['cached'] else ''))
+
+class PreparedStatement(object):
+    def __init__(self, interpreter, statement, params):
+        self.interpreter=interpreter
+        self.statement=statement
+        self.params=params #literal values, None where a ? has to be filled in
+
+    def execute(self, *values):
+        if len(values)!=self.params.count(None):
+            sys.stderr.write('Error: expected '+str(self.params.count(None))+' values, got '+str(len(values))+'\n')
+            return
+        values=iter(values)
+        self.interpreter.run_statement(self.statement, [next(values) if param is None else param for param in self.params])
 
 class Interpreter(object):
 
-    def __init__(self):
-        self.parser=Parser()
-        self.tokens=self.parser.tokenize()
+    def __init__(self, source=None):
+        # source: None for the interactive prompt, or a file to run as a script
+        self.format="table"
+        self.output=None #stdout
+        self.parser=Parser(source)
+        self.tokens=[]
         self.pos=0
-        if(len(self.tokens)>0):
-            self.current_token=self.tokens[0]
+        self.cache=OrderedDict() #normalized statement -> parsed statement
+        self.cache_size=256
+        self.prepared={} #name -> PreparedStatement
 
-    def reset(self):
-        self.parser.reset()
+    def reset(self, tokens):
         self.pos=0
-        self.tokens=self.parser.tokenize()
+        self.tokens=tokens
         self.current_token=self.tokens[self.pos]
 
     def next_token(self):
@@ -129,6 +215,12 @@ class Interpreter(object):
     def interpret_create(self):
         self.next_token()
         columns=[]
+        types={}
+        indexed=[]
+        index_types={}
+        if self.current_token.type=="keyword" and self.current_token.text.upper()=="INDEX":
+            self.interpret_create_index()
+            return
         if self.current_token.type!="keyword":
             sys.stderr.write('Unexpected argument "'+self.current_token.text+'": expected the table\'s name\n')
             return
@@ -142,9 +234,17 @@ class Interpreter(object):
             while True:
                 columns.append(self.current_token.text)
                 self.next_token()
+                if self.current_token.type=="keyword" and self.current_token.text.upper() in storage.type_names:
+                    #a declared type makes the table columnar
+                    types[columns[-1]]=storage.type_names[self.current_token.text.upper()]
+                    self.next_token()
                 if(self.current_token.type=="keyword"):
                     if self.current_token.text.upper()=="INDEXED":
-                        self.next_token() #unused
+                        indexed.append(columns[-1])
+                        self.next_token()
+                        if self.current_token.type=="keyword" and self.current_token.text.upper() in ("HASH", "BTREE"):
+                            index_types[columns[-1]]=self.current_token.text.lower()
+                            self.next_token()
                     else:
                         sys.stderr.write('Unknown keyword '+self.current_token.text.upper())
                         return
@@ -164,14 +264,52 @@ class Interpreter(object):
                 sys.stderr.write('Error: expected the command to end after the list of column names\n')
                 return
             else:
-                database.create_table(tablename, columns)
+                database.create_table(tablename, columns, indexed, types, index_types)
                 return
             
         else:
             sys.stderr.write('ERROR: invalid table name "'+self.current_token.text+'"\n')
             return
 
-    def interpret_insert(self):
+    def interpret_create_index(self):
+        #CREATE INDEX ON table (column) [HASH|BTREE]
+        self.next_token()
+        index_type="btree"
+        if self.current_token.type!="keyword" or self.current_token.text.upper()!="ON":
+            sys.stderr.write('Error: expected ON after CREATE INDEX.\n')
+            return
+        self.next_token()
+        if self.current_token.type!="keyword":
+            sys.stderr.write('Error: expected the table name after ON.\n')
+            return
+        tablename=self.current_token.text
+        self.next_token()
+        if self.current_token.type!="bracket" or self.current_token.text!="(":
+            sys.stderr.write('Unexpected argument "'+self.current_token.text+'": expected the column name enclosed in brackets\n')
+            return
+        self.next_token()
+        if self.current_token.type!="keyword":
+            sys.stderr.write('Error: expected the column name.\n')
+            return
+        column=self.current_token.text
+        self.next_token()
+        if self.current_token.type!="bracket" or self.current_token.text!=")":
+            sys.stderr.write('Unexpected argument "'+self.current_token.text+'": expected the closing bracket\n')
+            return
+        self.next_token()
+        if self.current_token.type=="keyword":
+            if self.current_token.text.upper() not in ("HASH", "BTREE"):
+                sys.stderr.write('Error: Unknown keyword '+self.current_token.text.upper()+', expected HASH or BTREE.\n')
+                return
+            index_type=self.current_token.text.lower()
+            self.next_token()
+        if self.current_token.type!="end":
+            sys.stderr.write('Error: expected the command to end after the index type\n')
+            return
+        database.create_index(tablename, column, index_type)
+        return
+
+    def parse_insert(self):
         values=[]
         self.next_token()
         if(self.current_token.type!="keyword"):
@@ -186,10 +324,10 @@ class Interpreter(object):
             return
         self.next_token()
         while True:
-            if(self.current_token.type!="string"):
+            if(self.current_token.type not in ("string", "param")):
                 sys.stderr.write('Values must be enclosed in double quotes.\n')
                 return
-            values.append(self.current_token.text)
+            values.append(self.literal())
             self.next_token()
             if(self.current_token.type=="comma"):
                 self.next_token()
@@ -207,16 +345,120 @@ class Interpreter(object):
             sys.stderr.write('Error: expected the command to end after the list of column names\n')
             return
         else:
-            database.insert_into_table(tablename, values)
+            return {'kind': 'insert', 'table': tablename, 'values': values}
+
+    def parse_delete(self):
+        #DELETE FROM table [WHERE condition]
+        self.next_token()
+        if not self.is_word("FROM"):
+            sys.stderr.write('Error: expected FROM after DELETE.\n')
+            return
+        self.next_token()
+        if self.current_token.type!="keyword":
+            sys.stderr.write('Error: expected the table name after FROM.\n')
+            return
+        tablename=self.current_token.text
+        self.next_token()
+        condition=self.parse_where()
+        if condition is False:
             return
+        return {'kind': 'delete', 'table': tablename, 'condition': condition}
 
-    def interpret_select(self):
+    def parse_update(self):
+        #UPDATE table SET column = value [, column = value ...] [WHERE condition]
+        self.next_token()
+        if self.current_token.type!="keyword":
+            sys.stderr.write('Error: expected the table name after UPDATE.\n')
+            return
+        tablename=self.current_token.text
+        self.next_token()
+        if not self.is_word("SET"):
+            sys.stderr.write('Error: expected SET after the table name.\n')
+            return
+        self.next_token()
+        assignments=[]
+        while True:
+            if self.current_token.type!="keyword":
+                sys.stderr.write('Error: expected a column name after SET.\n')
+                return
+            column_name=self.current_token.text
+            self.next_token()
+            if self.current_token.type!="sign" or self.current_token.text!="=":
+                sys.stderr.write('Error: expected = after the column name in SET.\n')
+                return
+            self.next_token()
+            value=self.parse_value("=")
+            if value is None:
+                return
+            assignments.append((column_name, value))
+            if self.current_token.type!="comma":
+                break
+            self.next_token()
+        condition=self.parse_where()
+        if condition is False:
+            return
+        return {'kind': 'update', 'table': tablename, 'assignments': assignments, 'condition': condition}
+
+    def parse_where(self):
+        #optional WHERE condition up to the end of the statement
+        #:return: the condition, None without WHERE, False after an error
+        condition=None
+        if self.is_word("WHERE"):
+            self.next_token()
+            condition=self.parse_or()
+            if condition is None:
+                return False
+        if self.current_token.type!="end":
+            sys.stderr.write('Error: Unexpected argument '+self.current_token.text+'\n')
+            return False
+        return condition
+
+    def interpret_copy(self):
+        self.next_token()
+        file_format=None
+        if self.current_token.type!="keyword":
+            sys.stderr.write('Error: expected the table name after COPY.\n')
+            return
+        tablename=self.current_token.text
+        self.next_token()
+        if self.current_token.type!="keyword" or self.current_token.text.upper()!="FROM":
+            sys.stderr.write('Error: expected FROM after the table name.\n')
+            return
+        self.next_token()
+        if self.current_token.type!="string":
+            sys.stderr.write('Error: the file name must be enclosed in double quotes.\n')
+            return
+        path=self.current_token.text
+        self.next_token()
+        if self.current_token.type=="keyword":
+            if self.current_token.text.upper() not in ("CSV", "JSONL"):
+                sys.stderr.write('Error: Unknown keyword '+self.current_token.text.upper()+', expected CSV or JSONL.\n')
+                return
+            file_format=self.current_token.text.lower()
+            self.next_token()
+        if self.current_token.type!="end":
+            sys.stderr.write('Error: expected the command to end after the file name\n')
+            return
+        loader.copy_from(tablename, path, file_format)
+        return
+
+    def parse_select(self):
         self.next_token()
         condition=None
         order_by=None
         column=True
+        limit=None
+        offset=0
+        select=None
+        group_by=None
+        if self.is_word("*"):
+            self.next_token()
+        elif not self.is_word("FROM"):
+            select=self.parse_select_list()
+            if select is None:
+                return
         if self.current_token.type!="keyword" or self.current_token.text.upper()!="FROM":
-            sys.stderr.write('Error: do not put anything between SELECT and FROM, this command only supports selecting all columns.\n')
+            sys.stderr.write('Error: expected FROM after the selected columns.\n')
             return
         self.next_token()
         if self.current_token.type!="keyword":
@@ -224,32 +466,31 @@ class Interpreter(object):
             return
         tablename=self.current_token.text
         self.next_token()
-        if self.current_token.type=="keyword" and self.current_token.text.upper()=="WHERE":
-            condition=[]
-            self.next_token()
-            if self.current_token.type!="keyword":
-                sys.stderr.write('Error: expected the column name after WHERE.\n')
-                return
-            condition.append(self.current_token.text)
-            self.next_token()
-            if self.current_token.type!="sign":
-                sys.stderr.write('Error: the sign after the column name in WHERE.\n')
+        join=None
+        if self.is_word("JOIN"):
+            join=self.parse_join()
+            if join is None:
                 return
-            if self.current_token.text!=">":
-                sys.stderr.write('Error: only the ">" operator is supported.\n')
-                return
-            else:
-                condition.append(">")
+        if self.current_token.type=="keyword" and self.current_token.text.upper()=="WHERE":
             self.next_token()
-            if self.current_token.type=="keyword":
-                column=True
-            elif self.current_token.type=="string":
-                column=False
-            else:
-                sys.stderr.write('Error: expected a value or a column name after the comparison operator.\n')
+            condition=self.parse_or()
+            if condition is None:
                 return
-            condition.append(self.current_token.text)
+        if self.is_word("GROUP_BY"):
+            group_by=[]
             self.next_token()
+            while True:
+                if self.current_token.type!="keyword":
+                    sys.stderr.write('Error: expected a comma-separated list of columns after GROUP BY.\n')
+                    return
+                group_by.append(self.current_token.text)
+                self.next_token()
+                if self.current_token.type!="comma":
+                    break
+                self.next_token()
+        if select is not None and not group_by and all(function is None for function, column_name in select):
+            sys.stderr.write('Error: selecting single columns is only supported with aggregates or GROUP_BY.\n')
+            return
         if self.current_token.type=="keyword" and self.current_token.text.upper()=="ORDER_BY":
             order_by=[]
             self.next_token()
@@ -258,9 +499,15 @@ class Interpreter(object):
                 if self.current_token.type!="keyword":
                     sys.stderr.write('Error: expected a comma-separated list of columns after ORDER BY.\n')
                     return
-                column=self.current_token.text
+                column_name=self.current_token.text
                 self.next_token()
-                if self.current_token.type=="keyword":
+                if self.current_token.type=="bracket" and self.current_token.text=="(":
+                    #an aggregate of the select list
+                    call=self.parse_call(column_name)
+                    if call is None:
+                        return
+                    column_name=aggregate.output_name(call)
+                if self.current_token.type=="keyword" and self.current_token.text.upper()!="LIMIT":
                     if self.current_token.text.upper()=="DESC":
                         sort="DESC"
                         self.next_token()
@@ -270,29 +517,596 @@ class Interpreter(object):
                     else:
                         sys.stderr.write('Error: Unknown keyword '+self.current_token.text.upper()+', expected ASC or DESC.\n')
                         return
-                order_by.append((column, sort))
+                order_by.append((column_name, sort))
                 if self.current_token.type=="comma":
                     self.next_token()
                     continue
-                if self.current_token.type=="end":
+                if self.current_token.type=="end" or (self.current_token.type=="keyword" and self.current_token.text.upper()=="LIMIT"):
                     break
                 else:
                     sys.stderr.write('Error: Unexpected argument '+self.current_token.text+'\n')
                     return
-        database.print_table(database.database[tablename]['columns'], database.select_from_table(database.database[tablename], condition, order_by, column))
+        if self.current_token.type=="keyword" and self.current_token.text.upper()=="LIMIT":
+            self.next_token()
+            limit=self.read_count("LIMIT")
+            if limit is None:
+                return
+            if self.current_token.type=="keyword" and self.current_token.text.upper()=="OFFSET":
+                self.next_token()
+                offset=self.read_count("OFFSET")
+                if offset is None:
+                    return
+        if self.current_token.type!="end":
+            sys.stderr.write('Error: Unexpected argument '+self.current_token.text+'\n')
+            return
+        return {'kind': 'select', 'table': tablename, 'join': join, 'condition': condition, 'order_by': order_by,
+                'column': column, 'limit': limit, 'offset': offset, 'select': select, 'group_by': group_by}
+
+    def parse_select_list(self):
+        #column, FUNCTION(column), COUNT(*) separated by commas
+        #:return: list of (function, column) with function None for a plain column
+        select=[]
+        while True:
+            if self.current_token.type!="keyword":
+                sys.stderr.write('Error: expected a column or an aggregate like COUNT(*) after SELECT.\n')
+                return None
+            name=self.current_token.text
+            self.next_token()
+            if self.current_token.type=="bracket" and self.current_token.text=="(":
+                call=self.parse_call(name)
+                if call is None:
+                    return None
+                select.append(call)
+            else:
+                select.append((None, name))
+            if self.current_token.type!="comma":
+                return select
+            self.next_token()
+
+    def parse_call(self, name):
+        #the "(column)" after an aggregate function name
+        function=name.upper()
+        if function not in aggregate.functions:
+            sys.stderr.write('Error: unknown aggregate function '+name+', expected one of '+', '.join(aggregate.functions)+'.\n')
+            return None
+        self.next_token()
+        if self.current_token.type!="keyword":
+            sys.stderr.write('Error: expected a column name in '+function+'().\n')
+            return None
+        column_name=self.current_token.text
+        self.next_token()
+        if self.current_token.type!="bracket" or self.current_token.text!=")":
+            sys.stderr.write('Error: expected ")" after '+function+'('+column_name+'.\n')
+            return None
+        self.next_token()
+        return (function, column_name)
+
+    def parse_join(self):
+        #JOIN table ON column = column
+        self.next_token()
+        if self.current_token.type!="keyword":
+            sys.stderr.write('Error: expected the table name after JOIN.\n')
+            return None
+        join={'table': self.current_token.text}
+        self.next_token()
+        if not self.is_word("ON"):
+            sys.stderr.write('Error: expected ON and the join columns after the table name.\n')
+            return None
+        self.next_token()
+        if self.current_token.type!="keyword":
+            sys.stderr.write('Error: expected a column name after ON.\n')
+            return None
+        join['on']=[self.current_token.text]
+        self.next_token()
+        if self.current_token.type!="sign" or self.current_token.text!="=":
+            sys.stderr.write('Error: only joins on equal columns (ON a.x = b.y) are supported.\n')
+            return None
+        self.next_token()
+        if self.current_token.type!="keyword":
+            sys.stderr.write('Error: expected a column name after "=" in ON.\n')
+            return None
+        join['on'].append(self.current_token.text)
+        self.next_token()
+        return join
+
+    #WHERE conditions, from the loosest to the tightest binding:
+    #  condition OR condition, condition AND condition, NOT condition, (condition),
+    #  column <op> value|column with <op> one of = != <> < <= > >=, column BETWEEN value AND value
+    #they are parsed into the condition tuples of planner.py
+
+    def is_word(self, word):
+        return self.current_token.type=="keyword" and self.current_token.text.upper()==word
+
+    def parse_or(self):
+        conditions=[self.parse_and()]
+        while conditions[-1] is not None and self.is_word("OR"):
+            self.next_token()
+            conditions.append(self.parse_and())
+        if None in conditions:
+            return None
+        return conditions[0] if len(conditions)==1 else ('or', conditions)
+
+    def parse_and(self):
+        conditions=[self.parse_not()]
+        while conditions[-1] is not None and self.is_word("AND"):
+            self.next_token()
+            conditions.append(self.parse_not())
+        if None in conditions:
+            return None
+        return conditions[0] if len(conditions)==1 else ('and', conditions)
+
+    def parse_not(self):
+        if self.is_word("NOT"):
+            self.next_token()
+            condition=self.parse_not()
+            return None if condition is None else ('not', condition)
+        if self.current_token.type=="bracket" and self.current_token.text=="(":
+            self.next_token()
+            condition=self.parse_or()
+            if condition is None:
+                return None
+            if self.current_token.type!="bracket" or self.current_token.text!=")":
+                sys.stderr.write('Error: expected ")" after the condition.\n')
+                return None
+            self.next_token()
+            return condition
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        if self.current_token.type!="keyword":
+            sys.stderr.write('Error: expected a column name in the WHERE condition.\n')
+            return None
+        column_name=self.current_token.text
+        self.next_token()
+        if self.is_word("BETWEEN"):
+            self.next_token()
+            low=self.parse_value("BETWEEN")
+            if low is None:
+                return None
+            if not self.is_word("AND"):
+                sys.stderr.write('Error: expected AND between the two values of BETWEEN.\n')
+                return None
+            self.next_token()
+            high=self.parse_value("AND")
+            if high is None:
+                return None
+            return ('and', [(column_name, ">=", low, False), (column_name, "<=", high, False)])
+        if self.current_token.type!="sign":
+            sys.stderr.write('Error: expected a comparison operator after the column name in WHERE.\n')
+            return None
+        operator="!=" if self.current_token.text=="<>" else self.current_token.text
+        self.next_token()
+        if self.current_token.type=="keyword":
+            condition=(column_name, operator, self.current_token.text, True)
+            self.next_token()
+            return condition
+        value=self.parse_value("the comparison operator")
+        return None if value is None else (column_name, operator, value, False)
+
+    def parse_value(self, after):
+        if self.current_token.type not in ("string", "param"):
+            sys.stderr.write('Error: expected a value after '+after+'.\n')
+            return None
+        value=self.literal()
+        self.next_token()
+        return value
+
+    def run_select(self, statement, metrics=None, explain=None):
+        # :param metrics: dict to collect the query metrics in, they are sent to the query hooks
+        # :param explain: "plan" to only describe the plan, "analyze" to also run it stage by stage
+        tablename=statement['table']
+        names=[tablename]+([statement['join']['table']] if statement.get('join') else [])
+        for name in names:
+            if name not in database.database:
+                sys.stderr.write('Error: table "'+name+'" does not exist.\n')
+                return
+        limit, offset=statement['limit'], statement['offset']
+        if not all(count is None or str(count).isdigit() for count in (limit, offset)):
+            sys.stderr.write('Error: LIMIT and OFFSET must be numbers of rows.\n')
+            return
+        entry=None
+        if explain is None and resultcache.results.max_bytes:
+            #(key, versions of the tables) of the result cache entry for this statement
+            entry=((self.format, repr(statement)), tuple(database.database[name]['version'] for name in names))
+            if self.cached_result(entry, ' JOIN '.join(names), metrics):
+                return
+        if statement.get('join'):
+            if statement.get('select') or statement.get('group_by'):
+                sys.stderr.write('Error: aggregates and GROUP_BY are not supported with JOIN.\n')
+                return
+            self.run_join(statement, None if limit is None else int(limit), int(offset), metrics, explain, entry)
+            return
+        if statement.get('select') or statement.get('group_by'):
+            self.run_aggregate(statement, None if limit is None else int(limit), int(offset), metrics, explain, entry)
+            return
+        table=views.read_view(database.database[tablename])
+        metrics=start_metrics(metrics)
+        if metrics is not None:
+            start=perf_counter()
+        plan=planner.plan_select(table, statement['condition'], statement['order_by'], statement['column'],
+            limit=None if limit is None else int(limit), offset=int(offset))
+        if plan is None:
+            return
+        if metrics is not None:
+            metrics.update(table=tablename, access=plan['access'], index=plan['index'],
+                estimated_rows=plan['estimated_rows'], plan=perf_counter()-start)
+
+        if explain=="plan":
+            self.write_lines(planner.describe(plan))
+        elif explain=="analyze":
+            items=planner.analyze(table, plan, metrics)
+            start=perf_counter()
+            #the rows are formatted like for the output but not written out
+            metrics['rows_returned']=render.render(table['columns'], planner.materialize(table, items, lazy=True), io.StringIO(), self.format)
+            metrics['render']=perf_counter()-start
+            self.write_lines(planner.describe(plan)+[
+                'rows examined: '+str(metrics['rows_examined'])+'  rows returned: '+str(metrics['rows_returned']),
+                timing_line(metrics, select_stages)])
+        else:
+            rows=planner.execute(table, plan, lazy=True)
+            if metrics is None:
+                self.print_result(table['columns'], rows, entry)
+                return
+            start=perf_counter()
+            metrics['rows_returned']=self.print_result(table['columns'], rows, entry)
+            metrics['execute']=perf_counter()-start
+            total_time(metrics, execute_stages)
+        if metrics is not None:
+            database.report_query(metrics)
+        return
+
+    def run_aggregate(self, statement, limit, offset, metrics=None, explain=None, entry=None):
+        tablename=statement['table']
+        table=views.read_view(database.database[tablename])
+        select=statement['select'] or [(None, column_name) for column_name in statement['group_by']]
+        metrics=start_metrics(metrics)
+        if metrics is not None:
+            start=perf_counter()
+        plan=aggregate.plan_aggregate(table, select, statement['condition'], statement['group_by'], statement['order_by'],
+            statement['column'], limit, offset)
+        if plan is None:
+            return
+        if metrics is not None:
+            metrics.update(table=tablename, access='aggregate_'+plan['access'], index=plan['group_by'][0] if plan['access']=='index' else None,
+                estimated_rows=plan['estimated_rows'], plan=perf_counter()-start)
+
+        if explain=="plan":
+            self.write_lines(aggregate.describe(plan))
+        else:
+            if metrics is not None:
+                start=perf_counter()
+            rows=aggregate.execute(table, plan)
+            if rows is None:
+                return
+            if explain=="analyze":
+                metrics['execute']=perf_counter()-start
+                metrics['rows_returned']=len(rows)
+                self.write_lines(aggregate.describe(plan)+['rows returned: '+str(metrics['rows_returned']), timing_line(metrics, execute_stages)])
+            else:
+                count=self.print_result(plan['names'], rows, entry)
+                if metrics is None:
+                    return
+                metrics['rows_returned']=count
+                metrics['execute']=perf_counter()-start
+                total_time(metrics, execute_stages)
+        database.report_query(metrics)
+
+    def run_join(self, statement, limit, offset, metrics=None, explain=None, entry=None):
+        names=[statement['table'], statement['join']['table']]
+        tables=[views.read_view(database.database[name]) for name in names]
+        metrics=start_metrics(metrics)
+        if metrics is not None:
+            start=perf_counter()
+        plan=joins.plan_join(tables, names, statement['join']['on'], statement['condition'], statement['order_by'], limit, offset)
+        if plan is None:
+            return
+        if metrics is not None:
+            metrics.update(table=' JOIN '.join(names), access=plan['access'], index=None,
+                estimated_rows=plan['estimated_rows'], plan=perf_counter()-start)
+
+        if explain=="plan":
+            self.write_lines(joins.describe(plan))
+        elif explain=="analyze":
+            #the join runs as one stage, the rows are formatted but not written out
+            start=perf_counter()
+            metrics['rows_returned']=render.render(plan['columns'], joins.execute(plan, lazy=True), io.StringIO(), self.format)
+            metrics['execute']=perf_counter()-start
+            self.write_lines(joins.describe(plan)+['rows returned: '+str(metrics['rows_returned']), timing_line(metrics, execute_stages)])
+        elif metrics is None:
+            self.print_result(plan['columns'], joins.execute(plan, lazy=True), entry)
+            return
+        else:
+            start=perf_counter()
+            metrics['rows_returned']=self.print_result(plan['columns'], joins.execute(plan, lazy=True), entry)
+            metrics['execute']=perf_counter()-start
+            total_time(metrics, execute_stages)
+        database.report_query(metrics)
+
+    def print_result(self, columns, rows, entry=None):
+        # prints the rows of a SELECT; with a result cache entry the output is also kept in the cache
+        # :return: number of rows printed
+        if entry is None:
+            return database.print_table(columns, rows, self.output, self.format)
+        out=resultcache.Tee(self.output or sys.stdout, resultcache.results.max_bytes)
+        count=database.print_table(columns, rows, out, self.format)
+        text=out.text()
+        if text is not None:
+            resultcache.results.put(entry[0], entry[1], text, count)
+        return count
+
+    def cached_result(self, entry, tablename, metrics=None):
+        # writes the cached output of a SELECT
+        # :return: True if the result cache had it
+        start=perf_counter()
+        found=resultcache.results.get(*entry)
+        if found is None:
+            return False
+        text, count=found
+        out=self.output or sys.stdout
+        out.write(text)
+        out.flush()
+        metrics=start_metrics(metrics)
+        if metrics is not None:
+            metrics.update(table=tablename, access='result_cache', index=None, estimated_rows=count, plan=0.0,
+                rows_returned=count, execute=perf_counter()-start)
+            total_time(metrics, execute_stages)
+            database.report_query(metrics)
+        return True
+
+    def write_lines(self, lines):
+        out=self.output or sys.stdout
+        out.write(''.join(line+'\n' for line in lines))
+        out.flush()
+
+    def run_statement(self, statement, params=(), metrics=None):
+        if None in params:
+            sys.stderr.write('Error: no value was given for parameter '+str(params.index(None)+1)+'\n')
+            return
+        statement=bind(statement, params)
+        if statement['kind']=="select":
+            self.run_select(statement, metrics)
+        elif statement['kind']=="insert":
+            database.insert_into_table(statement['table'], statement['values'])
+        elif statement['kind']=="delete":
+            database.delete_from_table(statement['table'], statement['condition'])
+        elif statement['kind']=="update":
+            database.update_table(statement['table'], statement['assignments'], statement['condition'])
+
+    def literal(self):
+        # the value of a string token, or a placeholder for a parameter
+        if self.current_token.type=="param":
+            return Param(int(self.current_token.text))
+        return self.current_token.text
+
+    def read_count(self, keyword):
+        # a non-negative row count, written with or without quotes
+        if self.current_token.type=="param":
+            count=self.literal()
+            self.next_token()
+            return count
+        if self.current_token.type in ("keyword", "string") and self.current_token.text.isdigit():
+            count=int(self.current_token.text)
+            self.next_token()
+            return count
+        sys.stderr.write('Error: expected a number of rows after '+keyword+'.\n')
+        return None
+
+    def interpret_set(self):
+        self.next_token()
+        if self.current_token.type!="keyword":
+            sys.stderr.write('Error: expected FORMAT, OUTPUT or CACHE after SET.\n')
+            return
+        setting=self.current_token.text.upper()
+        self.next_token()
+        if setting=="FORMAT":
+            if self.current_token.type!="keyword" or self.current_token.text.lower() not in render.formats:
+                sys.stderr.write('Error: expected one of '+', '.join(render.formats).upper()+' after SET FORMAT.\n')
+                return
+            value=self.current_token.text.lower()
+        elif setting=="CACHE":
+            #SET CACHE <megabytes> | OFF
+            if self.current_token.type=="keyword" and self.current_token.text.upper()=="OFF":
+                value=0
+            elif self.current_token.type in ("keyword", "string") and self.current_token.text.isdigit():
+                value=int(self.current_token.text)<<20
+            else:
+                sys.stderr.write('Error: expected the size of the result cache in megabytes or OFF after SET CACHE.\n')
+                return
+        elif setting=="OUTPUT":
+            if self.current_token.type=="string":
+                value=self.current_token.text
+            elif self.current_token.type=="keyword" and self.current_token.text.upper()=="STDOUT":
+                value=None
+            else:
+                sys.stderr.write('Error: expected a file name in double quotes or STDOUT after SET OUTPUT.\n')
+                return
+        else:
+            sys.stderr.write('Error: Unknown setting '+setting+', expected FORMAT, OUTPUT or CACHE.\n')
+            return
+        self.next_token()
+        if self.current_token.type!="end":
+            sys.stderr.write('Error: expected the command to end after the setting\n')
+            return
+        if setting=="FORMAT":
+            self.format=value
+        elif setting=="CACHE":
+            resultcache.results.resize(value)
+        else:
+            if self.output is not None:
+                self.output.close()
+            self.output=render.open_output(value) if value else None
         return
 
     def interpret(self):
-        if len(self.tokens)==0:
-            self.reset()
-            self.interpret()
-        if self.current_token.text.lower() == "q" or self.current_token.text.lower() == "quit":
+        for tokens in self.parser.statements():
+            if is_quit(tokens[0]):
+                return
+            self.execute(tokens)
+
+    def run(self, text):
+        # runs all the statements in a string
+        for tokens in self.parser.parse(text):
+            self.execute(tokens)
+
+    def execute(self, tokens):
+        try:
+            command=tokens[0].text.upper()
+            if tokens[0].type=="keyword" and command in cached_commands:
+                if database.query_hooks:
+                    self.interpret_explain(tokens, None)
+                    return
+                key, params, template=normalize(tokens)
+                statement=self.cached_statement(key, template)
+                if statement is not None:
+                    self.run_statement(statement, params)
+            elif tokens[0].type=="keyword" and command=="EXPLAIN":
+                analyze=len(tokens)>1 and tokens[1].type=="keyword" and tokens[1].text.upper()=="ANALYZE"
+                tokens=tokens[2 if analyze else 1:]
+                if tokens[0].type!="keyword" or tokens[0].text.upper()!="SELECT":
+                    sys.stderr.write('Error: only SELECT can be explained\n')
+                    return
+                self.interpret_explain(tokens, "analyze" if analyze else "plan")
+            elif tokens[0].type=="keyword" and command=="PREPARE":
+                self.interpret_prepare(tokens)
+            elif tokens[0].type=="keyword" and command=="EXECUTE":
+                self.reset(tokens)
+                self.interpret_execute()
+            elif tokens[0].type=="keyword" and command=="DEALLOCATE":
+                self.reset(tokens)
+                self.next_token()
+                if self.prepared.pop(self.current_token.text, None) is None:
+                    sys.stderr.write('Error: no prepared statement called "'+self.current_token.text+'"\n')
+            else:
+                self.reset(tokens)
+                self.interpret_statement()
+        except IndexError:
+            sys.stderr.write('Error: unexpected end of the command\n')
+
+    def interpret_explain(self, tokens, explain):
+        # runs a statement with its metrics measured from the start of parsing
+        start=perf_counter()
+        key, params, template=normalize(tokens)
+        cached=key in self.cache
+        statement=self.cached_statement(key, template)
+        if statement is None:
+            return
+        statement=bind(statement, params)
+        if statement['kind']=="select":
+            self.run_select(statement, {'parse': perf_counter()-start, 'cached': cached}, explain)
+        else:
+            self.run_statement(statement)
+
+    def cached_statement(self, key, template):
+        # parsed statements are kept in an LRU cache keyed by the statement text with its
+        # literal values taken out, so the same query shape is parsed only once
+        statement=self.cache.get(key)
+        if statement is not None:
+            self.cache.move_to_end(key)
+            return statement
+        self.reset(template)
+        statement=self.parse_statement()
+        if statement is not None and self.cache_size:
+            self.cache[key]=statement
+            if len(self.cache)>self.cache_size:
+                self.cache.popitem(last=False)
+        return statement
+
+    def parse_statement(self):
+        command=self.current_token.text.upper()
+        if command=="SELECT":
+            return self.parse_select()
+        if command=="DELETE":
+            return self.parse_delete()
+        if command=="UPDATE":
+            return self.parse_update()
+        return self.parse_insert()
+
+    def prepare(self, text):
+        # python side of PREPARE: returns a PreparedStatement or None if the text is not valid,
+        # literals in the text are kept and every ? is filled in by PreparedStatement.execute
+        statements=self.parser.parse(text if text.rstrip().endswith(";") else text+";")
+        if len(statements)!=1 or statements[0][0].type!="keyword" or statements[0][0].text.upper() not in cached_commands:
+            sys.stderr.write('Error: only a single SELECT, INSERT, DELETE or UPDATE can be prepared\n')
+            return None
+        key, params, template=normalize(statements[0], True)
+        try:
+            statement=self.cached_statement(key, template)
+        except IndexError:
+            sys.stderr.write('Error: unexpected end of the command\n')
+            return None
+        if statement is None:
+            return None
+        return PreparedStatement(self, statement, params)
+
+    def interpret_prepare(self, tokens):
+        #PREPARE name AS statement
+        if len(tokens)<4 or tokens[1].type!="keyword" or tokens[2].type!="keyword" or tokens[2].text.upper()!="AS":
+            sys.stderr.write('Error: expected PREPARE name AS statement\n')
+            return
+        if tokens[3].type!="keyword" or tokens[3].text.upper() not in cached_commands:
+            sys.stderr.write('Error: only SELECT, INSERT, DELETE and UPDATE can be prepared\n')
+            return
+        key, params, template=normalize(tokens[3:], True)
+        statement=self.cached_statement(key, template)
+        if statement is not None:
+            self.prepared[tokens[1].text]=PreparedStatement(self, statement, params)
+
+    def interpret_execute(self):
+        #EXECUTE name ("value", ...)
+        self.next_token()
+        name=self.current_token.text
+        if name not in self.prepared:
+            sys.stderr.write('Error: no prepared statement called "'+name+'"\n')
             return
-        elif self.current_token.text.upper() == "CREATE":
+        values=[]
+        self.next_token()
+        if self.current_token.type=="bracket" and self.current_token.text=="(":
+            self.next_token()
+            while not (self.current_token.type=="bracket" and self.current_token.text==")"):
+                if self.current_token.type!="string":
+                    sys.stderr.write('Values must be enclosed in double quotes.\n')
+                    return
+                values.append(self.current_token.text)
+                self.next_token()
+                if self.current_token.type=="comma":
+                    self.next_token()
+            self.next_token()
+        if self.current_token.type!="end":
+            sys.stderr.write('Error: expected the command to end after the list of values\n')
+            return
+        self.prepared[name].execute(*values)
+
+    def interpret_show(self):
+        #SHOW CACHE: size and hit statistics of the result cache
+        self.next_token()
+        if self.current_token.type!="keyword" or self.current_token.text.upper()!="CACHE":
+            sys.stderr.write('Error: expected CACHE after SHOW.\n')
+            return
+        self.next_token()
+        if self.current_token.type!="end":
+            sys.stderr.write('Error: SHOW CACHE takes no arguments\n')
+            return
+        stats=resultcache.results.stats()
+        lookups=stats['hits']+stats['misses']
+        self.write_lines([
+            'result cache: '+('off' if not stats['max_bytes'] else format(stats['bytes']/(1<<20), '.2f')+' of '+format(stats['max_bytes']/(1<<20), '.0f')+' MiB used by '+str(stats['entries'])+' entries'),
+            'hits: '+str(stats['hits'])+'  misses: '+str(stats['misses'])+'  hit rate: '+(format(stats['hits']/lookups, '.1%') if lookups else '-')
+            +'  evictions: '+str(stats['evictions'])+'  invalidations: '+str(stats['invalidations'])])
+
+    def interpret_statement(self):
+        if self.current_token.text.upper() == "CREATE":
             self.interpret_create()
-        elif self.current_token.text.upper() == "INSERT":
-            self.interpret_insert()
-        elif self.current_token.text.upper() == "SELECT":
-            self.interpret_select()
-        self.reset()
-        self.interpret()
+        elif self.current_token.text.upper() == "COPY":
+            self.interpret_copy()
+        elif self.current_token.text.upper() == "SET":
+            self.interpret_set()
+        elif self.current_token.text.upper() == "SHOW":
+            self.interpret_show()
+        elif self.current_token.text.upper() == "CHECKPOINT":
+            self.next_token()
+            if self.current_token.type!="end":
+                sys.stderr.write('Error: CHECKPOINT takes no arguments\n')
+            else:
+                persistence.checkpoint()
+        elif self.current_token.type!="end":
+            sys.stderr.write('Error: Unknown command '+self.current_token.text.upper()+'\n')
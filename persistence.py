@@ -0,0 +1,367 @@
+import os, io, time, glob, mmap, marshal, struct, zlib, atexit, threading
+from contextlib import redirect_stdout, ExitStack
+from array import array
+from itertools import groupby, repeat
+from sortedcontainers import SortedDict
+import database
+import storage
+import planner
+import views
+
+# durable storage for the in-memory database, kept in one directory:
+#   wal.<generation>.log - append-only log of every CREATE/INSERT/DELETE/UPDATE since the snapshot
+#   snapshot.oaa         - compact binary image of all tables and indexes
+# recovery loads the snapshot through mmap and replays only the logs written after it
+
+snapshot_name = 'snapshot.oaa'
+magic = b'OAADB\x00\x01\x00'
+record_header = struct.Struct('<II')  # payload length, crc32 of the payload
+meta_header = struct.Struct('<8sQ')  # magic, length of the marshalled table descriptions
+
+directory = None
+log = None
+generation = 0
+checkpoint_every = None
+
+# serializes the appends to the log; always taken after the table locks
+journal_lock = threading.RLock()
+checkpoint_lock = threading.Lock()
+
+
+class WriteAheadLog(object):
+    # records are marshalled tuples, each framed by its length and checksum.
+    # every record is handed to the OS as it is appended, so a killed process loses nothing.
+    # fsyncs, which protect against a crash of the machine, are done for a group of records:
+    # after sync_every records, and by a background thread at most sync_interval seconds
+    # after a record was appended, also when no more records follow
+
+    def __init__(self, path, sync_every=1000, sync_interval=1.0):
+        self.path = path
+        self.file = open(path, 'ab')
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.pending = 0
+        self.records = 0
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+        threading.Thread(target=self.sync_periodically, daemon=True).start()
+
+    def append(self, record):
+        payload = marshal.dumps(record)
+        with self.lock:
+            self.file.write(record_header.pack(len(payload), zlib.crc32(payload)) + payload)
+            self.file.flush()
+            self.pending += 1
+            self.records += 1
+            if self.pending >= self.sync_every:
+                self.sync_locked()
+
+    def sync(self):
+        with self.lock:
+            if not self.file.closed:
+                self.sync_locked()
+
+    def sync_locked(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+
+    def sync_periodically(self):
+        while not self.closed.wait(self.sync_interval):
+            with self.lock:
+                if self.pending and not self.file.closed:
+                    self.sync_locked()
+
+    def close(self):
+        with self.lock:
+            self.closed.set()
+            if not self.file.closed:
+                self.sync_locked()
+                self.file.close()
+
+
+def read_log(path):
+    # yields the records of a log file, stops at the first torn or corrupted record
+    # and cuts the file there so new records are not appended after garbage
+    with open(path, 'r+b') as file:
+        position = 0
+        while True:
+            header = file.read(record_header.size)
+            if len(header) < record_header.size:
+                break
+            length, checksum = record_header.unpack(header)
+            payload = file.read(length)
+            if len(payload) < length or zlib.crc32(payload) != checksum:
+                break
+            yield marshal.loads(payload)
+            position += record_header.size + length
+        file.truncate(position)
+
+def replay(records):
+    # consecutive inserts into the same table are applied as one bulk insert
+    for (kind, table_name), group in groupby(records, key=lambda record: (record[0], record[1])):
+        if kind == 'create':
+            for record in group:
+                database.create_table(*record[1:])
+        elif kind == 'index':
+            for record in group:
+                database.create_index(*record[1:])
+        elif kind == 'insert':
+            database.bulk_insert(table_name, (record[2] for record in group))
+        elif kind == 'bulk':
+            database.bulk_insert(table_name, (values for record in group for values in record[2]))
+        elif kind == 'delete':
+            # the condition finds the same rows again in the same table
+            for record in group:
+                database.delete_from_table(*record[1:])
+        elif kind == 'update':
+            for record in group:
+                database.update_table(*record[1:])
+
+def log_path(number):
+    return os.path.join(directory, f'wal.{number}.log')
+
+def log_files():
+    # existing log files as (generation, path), oldest first
+    files = []
+    for path in glob.glob(os.path.join(directory, 'wal.*.log')):
+        number = os.path.basename(path).split('.')[1]
+        if number.isdigit():
+            files.append((int(number), path))
+    return sorted(files)
+
+def journal(record):
+    # called by the writers while they hold the table lock
+    with journal_lock:
+        log.append(record)
+
+def checkpoint_if_due():
+    # called by the writers once their locks are released
+    if checkpoint_every and log is not None and log.records >= checkpoint_every:
+        checkpoint()
+
+def open_storage(path, sync_every=1000, sync_interval=1.0, snapshot_every=None):
+    # loads the database from the directory and logs every following change into it
+    # :param snapshot_every: write a snapshot after this many logged changes
+    global directory, log, generation, checkpoint_every
+    if directory is not None:
+        close_storage()
+    os.makedirs(path, exist_ok=True)
+    directory = path
+    checkpoint_every = snapshot_every
+    generation = 0
+
+    database.journal = None
+    start = time.time()
+    with redirect_stdout(io.StringIO()):
+        snapshot = os.path.join(directory, snapshot_name)
+        if os.path.isfile(snapshot):
+            generation = load_snapshot(snapshot)
+        for number, file in log_files():
+            if number >= generation:
+                replay(read_log(file))
+                generation = number
+    log = WriteAheadLog(log_path(generation), sync_every, sync_interval)
+    database.journal = journal
+    database.after_write = checkpoint_if_due
+    print(f"Loaded {len(database.database)} tables from '{directory}' in {time.time() - start:.2f} sec.")
+
+def close_storage():
+    global directory, log
+    if log is not None:
+        log.close()
+    database.journal = None
+    database.after_write = None
+    directory = None
+    log = None
+
+def checkpoint():
+    # starts a new log and writes a snapshot of everything logged before it, older logs are
+    # removed once the snapshot is in place. all writers are held only while the read views of
+    # the tables are taken and the log is switched, the snapshot is written from the views
+    if directory is None:
+        print("Error: Storage is not open.")
+        return
+    with checkpoint_lock:
+        write_checkpoint()
+
+def write_checkpoint():
+    global log, generation
+    with ExitStack() as locks:
+        locks.enter_context(database.schema_lock)
+        for table_name in sorted(database.database):
+            locks.enter_context(database.database[table_name]['lock'])
+        locks.enter_context(journal_lock)
+        tables = {table_name: views.read_view(table) for table_name, table in database.database.items()}
+        log.close()
+        generation += 1
+        log = WriteAheadLog(log_path(generation), log.sync_every, log.sync_interval)
+
+    path = os.path.join(directory, snapshot_name)
+    write_snapshot(path + '.tmp', generation, tables)
+    os.replace(path + '.tmp', path)
+    sync_directory()
+    for number, file in log_files():
+        if number < generation:
+            os.remove(file)
+
+def sync_directory():
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class SnapshotWriter(object):
+    # lays out the data blobs one after another, aligned to 8 bytes
+
+    def __init__(self):
+        self.blobs = []
+        self.size = 0
+
+    def add(self, data):
+        start = self.size
+        length = len(data) * getattr(data, 'itemsize', 1)
+        self.blobs.append(data)
+        self.size += length
+        padding = -self.size % 8
+        if padding:
+            self.blobs.append(bytes(padding))
+            self.size += padding
+        return start, length
+
+    def add_array(self, values):
+        return (values.typecode,) + self.add(values)
+
+    def add_marshal(self, value):
+        return self.add(marshal.dumps(value))
+
+
+def write_snapshot(path, next_generation, tables):
+    # :param tables: read views of the tables by name
+    writer = SnapshotWriter()
+    descriptions = {}
+    for table_name, table in tables.items():
+        descriptions[table_name] = describe_table(writer, table)
+    meta = marshal.dumps({'generation': next_generation, 'tables': descriptions})
+
+    with open(path, 'wb') as file:
+        file.write(meta_header.pack(magic, len(meta)))
+        file.write(meta)
+        file.write(bytes(-(meta_header.size + len(meta)) % 8))
+        for blob in writer.blobs:
+            file.write(blob)
+        file.flush()
+        os.fsync(file.fileno())
+
+def describe_table(writer, table):
+    # table: a read view, the column arrays are shared with the live table and keep growing,
+    # so only copies of the view's rows are written
+    columns = table['columns']
+    data = table['data']
+    rows = len(data)
+    columnar = database.is_columnar(table)
+    description = {
+        'columns': columns,
+        'types': table.get('types'),
+        'stats': table['stats'],
+        'data': {},
+        'index': {},
+        'dead': writer.add_array(storage.postings(sorted(planner.tombstones(table) or ())))
+    }
+
+    for column in columns:
+        if columnar:
+            values = data.column(column)
+            if isinstance(values, storage.DictColumn):
+                description['data'][column] = ('dict', writer.add_array(values.codes[:rows]), writer.add_marshal(values.dictionary))
+            elif isinstance(values, array):
+                description['data'][column] = ('array', writer.add_array(values[:rows]))
+            else:
+                description['data'][column] = ('marshal', writer.add_marshal(values[:rows]))
+        else:
+            description['data'][column] = ('marshal', writer.add_marshal([row[column] for row in data]))
+
+    for column, index in table['index'].items():
+        # postings are written as one flat array of row ids plus the offset of every key
+        row_ids = storage.postings()
+        offsets = array('q', [0])
+        keys = []
+        for key in index.keys():
+            postings = index[key]
+            if not postings:
+                continue  # only has rows added after the view
+            keys.append(key)
+            row_ids.extend(postings)
+            offsets.append(len(row_ids))
+        index_type = 'btree' if index.ordered else 'hash'
+        description['index'][column] = (index_type, writer.add_marshal(keys), writer.add_array(row_ids), writer.add_array(offsets))
+    return description
+
+def load_snapshot(path):
+    # :return: the log generation that follows the snapshot
+    with open(path, 'rb') as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                found, length = meta_header.unpack_from(view, 0)
+                if found != magic:
+                    raise ValueError(f"'{path}' is not a snapshot file")
+                meta = marshal.loads(view[meta_header.size:meta_header.size + length])
+                base = meta_header.size + length
+                base += -base % 8
+                for table_name, description in meta['tables'].items():
+                    database.database[table_name] = load_table(view, base, description)
+            finally:
+                view.release()
+    return meta['generation']
+
+def load_table(view, base, description):
+    def read_array(typecode, start, length):
+        values = array(typecode)
+        values.frombytes(view[base + start:base + start + length])
+        return values
+
+    def read_marshal(start, length):
+        return marshal.loads(view[base + start:base + start + length])
+
+    columns = description['columns']
+    table = {'columns': columns, 'data': [], 'index': {}, 'stats': description['stats']}
+    if description['types']:
+        table['types'] = description['types']
+        store = storage.ColumnStore(columns, description['types'])
+        for column, (kind, *parts) in description['data'].items():
+            if kind == 'dict':
+                values = store.column(column)
+                values.codes = read_array(*parts[0])
+                values.dictionary = read_marshal(*parts[1])
+                values.lookup = {value: code for code, value in enumerate(values.dictionary)}
+            elif kind == 'array':
+                store.arrays[column] = read_array(*parts[0])
+            else:
+                store.arrays[column] = read_marshal(*parts[0])
+        store.size = len(store.column(columns[0])) if columns else 0
+        table['data'] = store
+    else:
+        lists = [read_marshal(*description['data'][column][1]) for column in columns]
+        table['data'] = list(map(dict, map(zip, repeat(columns), zip(*lists))))
+    if description.get('dead'):
+        table['dead'] = dict.fromkeys(read_array(*description['dead']).tolist(), 0)
+    database.prepare_table(table)
+
+    for column, (index_type, keys, row_ids, offsets) in description['index'].items():
+        keys = read_marshal(*keys)
+        row_ids = read_array(*row_ids)
+        if row_ids.typecode != storage.posting_type:
+            row_ids = storage.postings(row_ids)  # snapshots of older versions wrote 8 byte ids
+        offsets = read_array(*offsets)
+        postings = [row_ids[offsets[i]:offsets[i + 1]] for i in range(len(keys))]
+        table['index'][column] = SortedDict(zip(keys, postings)) if index_type == 'btree' else dict(zip(keys, postings))
+    return table
+
+@atexit.register
+def flush_on_exit():
+    if log is not None:
+        log.sync()
@@ -0,0 +1,832 @@
+import operator as op
+import heapq
+from functools import partial, reduce
+from itertools import islice, compress, filterfalse, count
+from math import log2
+from time import perf_counter
+from sortedcontainers import SortedDict
+import storage
+import parallel
+import views
+
+# one planner for every SELECT: it estimates how many rows a condition keeps from the
+# per-column statistics and picks the cheapest way to produce the (sorted) result:
+#   full_scan   - read the condition's columns for every row, then sort
+#   index_range - read the postings of the matching keys of an index, or intersect / unite the
+#                 row ids read from several indexes, filter them by the rest of the condition, then sort
+#   index_order - walk the index of the leading ORDER BY column in order, no sort needed
+# with a LIMIT the sort becomes a top-k heap selection and the index walk stops after enough rows
+#
+# a condition is a comparison (column1, operator, value_or_column2, column), where column tells
+# whether value_or_column2 names a column, or one of ('and', [conditions]), ('or', [conditions])
+# and ('not', condition). the three element comparisons of the old interface get the column
+# flag passed along with them
+
+comparisons = {'>': op.gt, '<': op.lt, '=': op.eq, '>=': op.ge, '<=': op.le, '!=': op.ne}
+
+# comparisons with a value that a btree index answers with a key range, a hash index only takes '='
+range_operators = ('=', '>', '<', '>=', '<=')
+
+# relative cost of reading a row in a sequential scan, fetching a row through an
+# index posting and of one comparison while sorting
+scan_cost = 1.0
+fetch_cost = 2.5
+sort_cost = 0.5
+# reading one row id of a posting list into a set, to intersect or unite it with another
+id_cost = 0.5
+
+# selectivity used when the statistics can not tell anything better
+default_selectivity = {'=': 0.1, '>': 1 / 3, '<': 1 / 3, '>=': 1 / 3, '<=': 1 / 3, '!=': 0.9}
+
+def is_columnar(table):
+    return isinstance(table['data'], storage.ColumnStore)
+
+def tombstones(table):
+    # the ids of the deleted rows of a table or read view, None when there are none
+    dead = table.get('dead')
+    if isinstance(dead, views.Tombstones):
+        return dead.ids()
+    return dead or None
+
+def is_ordered(index):
+    # btree indexes keep their keys sorted, hash indexes only answer equality
+    if isinstance(index, views.IndexView):
+        return index.ordered
+    return isinstance(index, SortedDict)
+
+def distinct_count(table, column):
+    # exact where it is free: number of index keys or dictionary entries
+    if column in table['index']:
+        return len(table['index'][column])
+    if is_columnar(table):
+        values = table['data'].column(column)
+        if isinstance(values, storage.DictColumn):
+            return len(values.dictionary)
+    return None
+
+def selectivity(table, column_name, operator, value):
+    # estimated fraction of rows for which "column_name <operator> value" holds
+    if operator == '!=':
+        return 1 - selectivity(table, column_name, '=', value)
+    greater = operator in ('>', '>=')
+    stats = table['stats'].get(column_name, {})
+    low, high = stats.get('min'), stats.get('max')
+    try:
+        if low is not None and (value < low or value > high):
+            return 1.0 if (greater and value < low) or (operator in ('<', '<=') and value > high) else 0.0
+    except TypeError:
+        low = high = None
+
+    if operator == '=':
+        distinct = distinct_count(table, column_name)
+        return 1 / distinct if distinct else default_selectivity['=']
+
+    if isinstance(value, (int, float)) and isinstance(low, (int, float)) and isinstance(high, (int, float)) and high > low:
+        # numbers: assume the values are spread evenly between min and max
+        fraction = (value - low) / (high - low)
+        return 1 - fraction if greater else fraction
+
+    if column_name in table['index'] and is_ordered(table['index'][column_name]) and len(table['index'][column_name]):
+        # text: the share of index keys on the requested side of the value
+        index = table['index'][column_name]
+        try:
+            if operator == '>':
+                return (len(index) - index.bisect_right(value)) / len(index)
+            if operator == '>=':
+                return (len(index) - index.bisect_left(value)) / len(index)
+            if operator == '<':
+                return index.bisect_left(value) / len(index)
+            return index.bisect_right(value) / len(index)
+        except TypeError:
+            pass  # the keys are numbers of the row layout, compared as text by the scan
+    return default_selectivity[operator]
+
+def is_comparison(condition):
+    return len(condition) != 2
+
+def normalize_condition(condition, column):
+    # the condition with the column flag in every comparison, an AND (OR) nested in an AND (OR)
+    # is merged into its parent, so a BETWEEN or a bracketed AND is one more list of bounds
+    if is_comparison(condition):
+        return tuple(condition) if len(condition) == 4 else tuple(condition) + (bool(column),)
+    kind, operand = condition
+    if kind == 'not':
+        return ('not', normalize_condition(operand, column))
+    children = []
+    for child in operand:
+        child = normalize_condition(child, column)
+        if not is_comparison(child) and child[0] == kind:
+            children.extend(child[1])
+        else:
+            children.append(child)
+    return (kind, children)
+
+def join_conditions(kind, conditions):
+    # conditions combined with 'and' / 'or', None for none
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else (kind, conditions)
+
+def check_condition(table, condition):
+    # :return: the condition with the values converted to the column types of a columnar
+    # table, or None if it is not valid for this table
+    if not is_comparison(condition):
+        kind, operand = condition
+        if kind == 'not':
+            operand = check_condition(table, operand)
+            return None if operand is None else ('not', operand)
+        if kind not in ('and', 'or') or not operand:
+            print(f"Error: Unsupported condition '{kind}'.")
+            return
+        children = []
+        for child in operand:
+            child = check_condition(table, child)
+            if child is None:
+                return
+            children.append(child)
+        return (kind, children)
+
+    columns = table['columns']
+    column1, operator, value_or_column2, column = condition
+    if column1 not in columns:
+        print(f"Error: Column '{column1}' does not exist.")
+        return
+    if column and value_or_column2 not in columns:
+        print(f"Error: Column '{value_or_column2}' does not exist.")
+        return
+    if operator not in comparisons:
+        print(f"Error: Unsupported operator '{operator}'.")
+        return
+    if not column and is_columnar(table):
+        try:
+            return (column1, operator, storage.convert(table['types'][column1], value_or_column2), column)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+    if not column:
+        # the row layout compares values as text
+        return (column1, operator, str(value_or_column2), column)
+    return condition
+
+def split_bounds(conditions):
+    # the value comparisons of an AND list that an index can answer, grouped by column:
+    # :return: ({column: [comparisons]}, [other conditions])
+    bounds = {}
+    rest = []
+    for condition in conditions:
+        if is_comparison(condition) and not condition[3] and condition[1] in range_operators:
+            bounds.setdefault(condition[0], []).append(condition)
+        else:
+            rest.append(condition)
+    return bounds, rest
+
+def column_bounds(condition, column_name):
+    # splits the condition into the comparisons that restrict the keys of an index on column_name
+    # and the residual condition the rows still have to pass
+    # :return: (bounds, residual condition or None)
+    if not condition:
+        return [], None
+    if is_comparison(condition):
+        conditions = [condition]
+    elif condition[0] == 'and':
+        conditions = condition[1]
+    else:
+        return [], condition
+    bounds = split_bounds(conditions)[0].get(column_name, [])
+    return bounds, join_conditions('and', [child for child in conditions if child not in bounds])
+
+def index_fits(table, column_name):
+    # whether the keys of the column's index compare with the values of a condition the way the
+    # scan compares them: the columnar layout converts the values to the column type, the row
+    # layout compares as text, which only the index of a column holding nothing but text does
+    return is_columnar(table) or is_text(table, column_name)
+
+def index_bounds(table, condition, column_name):
+    # column_bounds for a walk over the keys of the column's index, no bounds when they
+    # would not select the rows the scan selects
+    if not index_fits(table, column_name):
+        return [], condition or None
+    return column_bounds(condition, column_name)
+
+def range_fraction(table, bounds):
+    # estimated fraction of rows within all the comparisons of bounds, which are on one column
+    equal = [selectivity(table, *bound[:3]) for bound in bounds if bound[1] == '=']
+    if equal:
+        return min(equal)
+    lower = [selectivity(table, *bound[:3]) for bound in bounds if bound[1] in ('>', '>=')]
+    upper = [selectivity(table, *bound[:3]) for bound in bounds if bound[1] in ('<', '<=')]
+    if lower and upper:
+        # the share above the lower bound and the share below the upper bound overlap
+        return max(min(lower) + min(upper) - 1, 0.0)
+    return min(lower or upper)
+
+def estimate(table, condition):
+    # estimated fraction of rows that pass the condition, the conditions of an AND or OR are
+    # taken as independent except for the bounds on the same column, which form one range
+    if is_comparison(condition):
+        column1, operator, value_or_column2, column = condition
+        return default_selectivity[operator] if column else selectivity(table, column1, operator, value_or_column2)
+    kind, operand = condition
+    if kind == 'not':
+        return 1 - estimate(table, operand)
+    if kind == 'or':
+        missed = 1.0
+        for child in operand:
+            missed *= 1 - estimate(table, child)
+        return 1 - missed
+    bounds, rest = split_bounds(operand)
+    fraction = 1.0
+    for comparisons_ in bounds.values():
+        fraction *= range_fraction(table, comparisons_)
+    for child in rest:
+        fraction *= estimate(table, child)
+    return fraction
+
+def comparison_count(condition):
+    if is_comparison(condition):
+        return 1
+    if condition[0] == 'not':
+        return comparison_count(condition[1])
+    return sum(map(comparison_count, condition[1]))
+
+def plan_lookup(table, condition, n):
+    # how the indexes produce the candidate items of a condition. a lookup is
+    #   ('range', column, bounds) - the postings of the keys of the column's index within the bounds
+    #   ('and', [lookups]) / ('or', [lookups]) - the intersection / union of the row ids of lookups
+    # the comparisons of an AND on the same column become one key range (BETWEEN), an OR needs
+    # every one of its conditions answered by indexes alone
+    # :return: (lookup, residual condition or None, estimated fraction of candidate rows,
+    #           fraction of rows read from posting lists, probe cost) or None when no index helps
+    if not is_comparison(condition) and condition[0] == 'not':
+        return None
+    if not is_comparison(condition) and condition[0] == 'or':
+        lookups = []
+        for child in condition[1]:
+            found = plan_lookup(table, child, n)
+            if found is None or found[1] is not None:
+                return None
+            lookups.append(found)
+        return (('or', [found[0] for found in lookups]), None, min(sum(found[2] for found in lookups), 1.0),
+                sum(found[3] for found in lookups), sum(found[4] for found in lookups))
+
+    conditions = [condition] if is_comparison(condition) else condition[1]
+    bounds, rest = split_bounds(conditions)
+    found = []  # (lookup, fraction, fetched, probe cost, the conditions it answers)
+    for column_name, comparisons_ in bounds.items():
+        index = table['index'].get(column_name)
+        if index is None or not (is_ordered(index) or all(bound[1] == '=' for bound in comparisons_)):
+            continue
+        if not index_fits(table, column_name):
+            continue
+        # a btree pays a key search, a hash index a single probe
+        probe = log2(len(index) + 1) if is_ordered(index) else 1
+        fraction = range_fraction(table, comparisons_)
+        found.append((('range', column_name, comparisons_), fraction, fraction, probe, comparisons_))
+    for child in rest:
+        if not is_comparison(child) and child[0] == 'or':
+            union = plan_lookup(table, child, n)
+            if union is not None:
+                found.append((union[0], union[2], union[3], union[4], [child]))
+    if not found:
+        return None
+
+    # start from the most selective lookup; another one joins the intersection when reading
+    # its row ids costs less than fetching and filtering the candidates it rules out
+    found.sort(key=lambda lookup: lookup[1])
+    chosen = found[:1]
+    fraction = found[0][1]
+    for lookup in found[1:]:
+        if id_cost * lookup[2] < fraction * (1 - lookup[1]) * (fetch_cost + scan_cost):
+            chosen.append(lookup)
+            fraction *= lookup[1]
+    answered = [child for lookup in chosen for child in lookup[4]]
+    residual = join_conditions('and', [child for child in conditions if child not in answered])
+    lookup = chosen[0][0] if len(chosen) == 1 else ('and', [lookup[0] for lookup in chosen])
+    return (lookup, residual, fraction, sum(lookup[2] for lookup in chosen), sum(lookup[3] for lookup in chosen))
+
+def lookup_columns(lookup):
+    if lookup[0] == 'range':
+        return [lookup[1]]
+    return [column_name for part in lookup[1] for column_name in lookup_columns(part)]
+
+def plan_select(table, condition=None, order_by=None, column=True, use_indexes=True, limit=None, offset=0):
+    # :return: plan dict, or None if the query is not valid for this table
+    columns = table['columns']
+    n = len(table['data'])
+
+    if condition:
+        condition = check_condition(table, normalize_condition(condition, column))
+        if condition is None:
+            return
+    for column_name, order in order_by or []:
+        if column_name not in columns:
+            print(f"Error: Column '{column_name}' does not exist.")
+            return
+
+    fraction = estimate(table, condition) if condition else 1.0
+    estimated_rows = max(int(n * fraction), 0)
+    wanted = offset + limit if limit is not None else estimated_rows
+    sorting = (sort_cost * estimated_rows * log2(min(wanted, estimated_rows) + 1)) if order_by else 0
+
+    # a scan that can not stop early is split over the worker processes on large tables
+    workers = 1
+    if condition and parallel.usable(n) and not (limit is not None and not order_by):
+        workers = parallel.workers
+
+    # every comparison of the condition reads its columns for every row
+    scanning = scan_cost * n * (comparison_count(condition) if condition else 1)
+    plan = {
+        'access': 'full_scan',
+        'index': None,
+        'lookup': None,
+        'residual': None,
+        'workers': workers,
+        'condition': condition,
+        'column': column,
+        'order_by': order_by,
+        'limit': limit,
+        'offset': offset,
+        'estimated_rows': estimated_rows,
+        'cost': scanning / workers + (parallel.startup_cost if workers > 1 else 0) + sorting
+    }
+    candidates = [plan]
+
+    found = plan_lookup(table, condition, n) if use_indexes and condition else None
+    if found is not None:
+        lookup, residual, candidate_fraction, fetched, probes = found
+        # a single key range fetches the items of its postings, a combination first reads
+        # the row ids of all its postings and only fetches the items that are left
+        if lookup[0] == 'range':
+            reading, fetching = 0, fetch_cost * n * fetched
+        else:
+            reading, fetching = id_cost * n * fetched, fetch_cost * n * candidate_fraction
+        filtering = scan_cost * n * candidate_fraction * comparison_count(residual) if residual else 0
+        candidates.append(dict(plan, access='index_range', index=', '.join(lookup_columns(lookup)), workers=1,
+                               lookup=lookup, residual=residual, cost=probes + reading + fetching + filtering + sorting))
+
+    if use_indexes and order_by and is_ordered(table['index'].get(order_by[0][0])):
+        # rows come out already ordered on the leading column, the remaining order
+        # columns only sort the (small) groups of equal keys
+        walked = n
+        bounds, residual = index_bounds(table, condition, order_by[0][0])
+        if bounds:
+            walked = n * range_fraction(table, bounds)
+        groups = distinct_count(table, order_by[0][0]) or n or 1
+        if limit is not None:
+            # stops once enough rows passed the condition, but reads at least one whole group of equal keys
+            walked = min(walked, max(wanted / max(fraction, 1 / (n or 1)), n / groups if len(order_by) > 1 else 0))
+        tie_sorting = sort_cost * walked * log2(walked / groups + 1) if len(order_by) > 1 else 0
+        candidates.append(dict(plan, access='index_order', index=order_by[0][0], workers=1, residual=residual,
+                               cost=fetch_cost * walked + tie_sorting))
+
+    return min(candidates, key=lambda candidate: candidate['cost'])
+
+def execute(table, plan, lazy=False):
+    return materialize(table, select_items(table, plan), lazy)
+
+def select_items(table, plan):
+    # the items of the result in order, an iterator where the access path produces them lazily
+    # items are row dicts for the row layout and row ids for the columnar layout
+    access = plan['access']
+    limit, offset = plan.get('limit'), plan.get('offset', 0)
+    if access == 'index_order':
+        items = walk_index(table, plan)
+    else:
+        if access == 'index_range':
+            items = index_lookup(table, plan)
+        else:
+            items = scan(table, plan['condition'], plan['column'], not plan['order_by'], plan.get('workers', 1))
+        if plan['order_by'] and limit is not None:
+            items = top_items(table, items, plan['order_by'], offset + limit)
+        elif plan['order_by']:
+            items = list(items)
+            sort_items(table, items, plan['order_by'])
+    if limit is not None or offset:
+        items = islice(items, offset, None if limit is None else offset + limit)
+    return items
+
+def select(table, condition=None, order_by=None, column=True, lazy=False, use_indexes=True, limit=None, offset=0):
+    table = views.read_view(table)
+    plan = plan_select(table, condition, order_by, column, use_indexes, limit, offset)
+    if plan is None:
+        return
+    return execute(table, plan, lazy)
+
+def analyze(table, plan, metrics):
+    # runs the plan like execute, but one stage after the other so that every stage can be
+    # timed, and counts the rows the access path had to read. the scan still stops early
+    # when execute would. the timings (seconds) and counts are stored in metrics
+    # :return: list of the result items
+    access = plan['access']
+    limit, offset = plan.get('limit'), plan.get('offset', 0)
+    wanted = None if limit is None else offset + limit
+    start = perf_counter()
+    if access == 'index_order':
+        visited = [0]
+        items = walk_index(table, plan, visited)
+        items = list(items if wanted is None else islice(items, wanted))
+        examined = visited[0]
+    elif access == 'index_range':
+        visited = [0]
+        items = index_lookup(table, plan, visited)
+        examined = visited[0]
+    elif wanted is not None and not plan['order_by']:
+        items = list(islice(scan(table, plan['condition'], plan['column'], True), wanted))
+        examined = scanned_rows(table, items, wanted)
+    else:
+        items = list(scan(table, plan['condition'], plan['column'], workers=plan.get('workers', 1)))
+        examined = len(table['data'])
+    metrics['filter'] = perf_counter() - start
+
+    start = perf_counter()
+    if plan['order_by'] and access != 'index_order':
+        if limit is not None:
+            items = top_items(table, items, plan['order_by'], wanted)
+        else:
+            sort_items(table, items, plan['order_by'])
+    if limit is not None or offset:
+        items = items[offset:wanted]
+    metrics['sort'] = perf_counter() - start
+    metrics['rows_examined'] = examined
+    return items
+
+def scanned_rows(table, items, wanted):
+    # rows a scan read before it had found the wanted number of items
+    if len(items) < wanted or not items:
+        return len(table['data'])
+    if is_columnar(table):
+        return items[-1] + 1
+    last = items[-1]
+    return next(i for i, row in enumerate(table['data']) if row is last) + 1
+
+def describe(plan):
+    # the plan as lines of text for EXPLAIN
+    lines = []
+    if plan['access'] == 'full_scan' and plan.get('workers', 1) > 1:
+        lines.append(f"access: full scan in {plan['workers']} parallel workers")
+    elif plan['access'] == 'full_scan':
+        lines.append("access: full scan")
+    elif plan['access'] == 'index_range':
+        combined = {'range': 'range', 'and': 'intersection', 'or': 'union'}[plan['lookup'][0]]
+        lines.append(f"access: index {combined} on {plan['index']}")
+    else:
+        lines.append(f"access: index order on {plan['index']}")
+    if plan['condition']:
+        lines.append("condition: " + condition_text(plan['condition']))
+    if plan.get('residual') and plan['access'] != 'full_scan':
+        lines.append("filter: " + condition_text(plan['residual']))
+    if plan['order_by']:
+        lines.append("order by: " + ", ".join(f"{column_name} {order.upper()}" for column_name, order in plan['order_by']))
+        if plan['access'] == 'index_order':
+            lines.append("sort: " + ("groups of equal keys only" if len(plan['order_by']) > 1 else "none, index order"))
+        else:
+            lines.append("sort: " + ("top-k heap" if plan['limit'] is not None else "full sort"))
+    if plan['limit'] is not None or plan['offset']:
+        lines.append(f"limit: {plan['limit']} offset: {plan['offset']}")
+    lines.append(f"estimated rows: {plan['estimated_rows']}  cost: {plan['cost']:.1f}")
+    return lines
+
+def condition_text(condition, nested=False):
+    if is_comparison(condition):
+        column1, operator, value_or_column2, column = condition
+        return f"{column1} {operator} {value_or_column2 if column else repr(value_or_column2)}"
+    kind, operand = condition
+    if kind == 'not':
+        return "NOT " + condition_text(operand, True)
+    text = f" {kind.upper()} ".join(condition_text(child, True) for child in operand)
+    return f"({text})" if nested else text
+
+def materialize(table, items, lazy=False):
+    if is_columnar(table):
+        store = table['data']
+        return store.iter_rows(items) if lazy else store.rows(items)
+    if lazy:
+        return iter(items)
+    return items if isinstance(items, list) else list(items)
+
+def sort_key(table, column_name):
+    if is_columnar(table):
+        return table['data'].sort_key(column_name)
+    return op.itemgetter(column_name)
+
+class Descending(object):
+    # sort key of a value that orders the other way round, for the DESC columns of a mixed
+    # direction ORDER BY whose values can not be negated, see order_keys
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+def order_keys(table, order_by):
+    # the ORDER BY list as pre-bound (key, descending, flip) per column, where flip turns the
+    # keys of a DESC column around for an ascending composite key: numbers and dictionary
+    # codes are negated, text and the values of the row layout are wrapped in Descending
+    keys = []
+    for column_name, order in order_by:
+        numeric = is_columnar(table) and table['types'][column_name] in ('int', 'float', 'dict')
+        keys.append((sort_key(table, column_name), order.upper() == "DESC", op.neg if numeric else Descending))
+    return keys
+
+def row_keys(order_by):
+    # order_keys of plain row dicts, like the result rows of aggregates and joins
+    return [(op.itemgetter(column_name), order.upper() == "DESC", Descending) for column_name, order in order_by]
+
+def sort_by(items, keys):
+    # one stable sort per column with a plain key, last column first: CPython compares lists
+    # of only ints or only strings on its specialized fast paths, which is faster than a single
+    # sort over composite tuple keys, and a descending text column needs no ranking this way
+    for key, descending, flip in reversed(keys):
+        items.sort(key=key, reverse=descending)
+
+def top_by(items, keys, k, composite=None):
+    # the first k items in the order of keys without sorting everything, in O(n log k).
+    # several columns get a composite key per item, built column by column in map() and taken
+    # ascending with the DESC columns flipped, or descending when all of them are; the counter
+    # keeps equal keys in their order, so the items themselves are never compared
+    # :param composite: key of all the columns at once for row dicts (itemgetter), used when
+    #                   they all go in the same direction
+    directions = {descending for key, descending, flip in keys}
+    if len(keys) == 1 or (composite is not None and len(directions) == 1):
+        key = keys[0][0] if len(keys) == 1 else composite
+        return heapq.nlargest(k, items, key=key) if keys[0][1] else heapq.nsmallest(k, items, key=key)
+    items = items if isinstance(items, list) else list(items)
+    if len(directions) > 1:
+        columns = [map(flip, map(key, items)) if descending else map(key, items) for key, descending, flip in keys]
+        return list(map(op.itemgetter(-1), heapq.nsmallest(k, zip(*columns, count(), items))))
+    columns = [map(key, items) for key, descending, flip in keys]
+    if directions.pop():
+        return list(map(op.itemgetter(-1), heapq.nlargest(k, zip(*columns, count(0, -1), items))))
+    return list(map(op.itemgetter(-1), heapq.nsmallest(k, zip(*columns, count(), items))))
+
+def sort_items(table, items, order_by):
+    sort_by(items, order_keys(table, order_by))
+
+def top_items(table, items, order_by, k):
+    composite = None if is_columnar(table) else op.itemgetter(*[column_name for column_name, order in order_by])
+    return top_by(items, order_keys(table, order_by), k, composite)
+
+def sort_rows(rows, order_by):
+    # sorts a list of plain row dicts by the ORDER BY list
+    sort_by(rows, row_keys(order_by))
+
+def top_rows(rows, order_by, k):
+    return top_by(rows, row_keys(order_by), k, op.itemgetter(*[column_name for column_name, order in order_by]))
+
+def bound_keys(index, bounds):
+    # the keys of the index that satisfy all the comparisons of bounds
+    low = high = None
+    low_inclusive = high_inclusive = True
+    for column_name, operator, value, column in bounds:
+        if operator in ('=', '>', '>=') and (low is None or value > low or (value == low and operator == '>')):
+            low, low_inclusive = value, operator != '>'
+        if operator in ('=', '<', '<=') and (high is None or value < high or (value == high and operator == '<')):
+            high, high_inclusive = value, operator != '<'
+    if low is not None and high is not None and (low > high or (low == high and not (low_inclusive and high_inclusive))):
+        return []
+    if low is not None and low == high:
+        return [low] if low in index else []
+    return index.irange(low, high, (low_inclusive, high_inclusive))
+
+def row_getter(table):
+    # row id -> row dict of a row layout table or read view
+    rows = table['data']
+    return rows.live.__getitem__ if isinstance(rows, views.RowsView) else rows.__getitem__
+
+def posting_items(table, ids):
+    # the items of the row ids read from the postings: the row ids themselves for columnar
+    # tables, the row dicts of the row layout, which are only looked up here
+    if is_columnar(table):
+        return ids
+    return list(map(row_getter(table), ids))
+
+def index_ids(table, column_name, bounds):
+    # the row ids in the postings of the keys within the bounds, in key order
+    index = table['index'][column_name]
+    ids = storage.postings()
+    for key in bound_keys(index, bounds):
+        ids.extend(index[key])
+    return ids
+
+def index_range(table, column_name, bounds):
+    return posting_items(table, index_ids(table, column_name, bounds))
+
+def lookup_ids(table, lookup, visited):
+    # the set of row ids of a lookup
+    if lookup[0] == 'range':
+        ids = index_ids(table, lookup[1], lookup[2])
+        if visited is not None:
+            visited[0] += len(ids)
+        return set(ids)
+    sets = [lookup_ids(table, part, visited) for part in lookup[1]]
+    if lookup[0] == 'or':
+        return set().union(*sets)
+    sets.sort(key=len)
+    return sets[0].intersection(*sets[1:])
+
+def index_lookup(table, plan, visited=None):
+    # the items of an index_range plan: the postings of a single key range in key order, or
+    # the row ids several indexes agree on in row order; either filtered by the residual condition
+    # :param visited: one element list, counts the postings read from the indexes
+    lookup = plan['lookup']
+    if lookup[0] == 'range':
+        items = index_range(table, lookup[1], lookup[2])
+        if visited is not None:
+            visited[0] += len(items)
+    else:
+        items = posting_items(table, sorted(lookup_ids(table, lookup, visited)))
+    if plan['residual']:
+        items = list(filter(compile_predicate(table, plan['residual']), items))
+    return items
+
+def select_ids(table, plan):
+    # the row ids of the rows an unordered plan selects, in row order and for both layouts;
+    # DELETE and UPDATE find their rows with it
+    if plan['access'] == 'index_range':
+        lookup = plan['lookup']
+        if lookup[0] == 'range':
+            ids = sorted(index_ids(table, lookup[1], lookup[2]))
+        else:
+            ids = sorted(lookup_ids(table, lookup, None))
+        if plan['residual']:
+            ids = list(compress(ids, map(compile_predicate(table, plan['residual']), posting_items(table, ids))))
+        return ids
+    rows = range(len(table['data']))
+    if not plan['condition']:
+        return list(live_ids(table, rows))
+    selectors = compile_selectors(table, plan['condition'], plan['column'])
+    if plan.get('workers', 1) > 1:
+        return list(live_ids(table, parallel.scan(len(rows), selectors, plan['workers'])))
+    return list(live_ids(table, compress(rows, selectors())))
+
+# value <swapped[op]> x is the same test as x <op> value, so the literal can be bound first
+swapped = {'>': op.lt, '<': op.gt, '=': op.eq, '>=': op.le, '<=': op.ge, '!=': op.ne}
+flipped = {op.gt: op.lt, op.lt: op.gt, op.ge: op.le, op.le: op.ge, op.eq: op.eq, op.ne: op.ne}
+
+def is_text(table, column_name):
+    if is_columnar(table):
+        return table['types'][column_name] in ('str', 'dict')
+    return table['stats'][column_name].get('text', False)
+
+def compile_predicate(table, condition, column=False):
+    # the condition as a callable over a single item, built once per query with the
+    # column accessors bound in advance; values are only turned into text when the
+    # column does not hold text already, like the row layout always did
+    condition = normalize_condition(condition, column)
+    if not is_comparison(condition):
+        kind, operand = condition
+        if kind == 'not':
+            test = compile_predicate(table, operand)
+            return lambda item: not test(item)
+        tests = [compile_predicate(table, child) for child in operand]
+        if kind == 'and':
+            return lambda item: all([test(item) for test in tests])
+        return lambda item: any([test(item) for test in tests])
+    column1, operator, value_or_column2, column = condition
+    compare = comparisons[operator]
+    if is_columnar(table):
+        store = table['data']
+        left = store.column(column1)
+        if column:
+            right = store.column(value_or_column2)
+            if store.types[column1] != store.types[value_or_column2] and not (is_text(table, column1) and is_text(table, value_or_column2)):
+                return lambda i: compare(str(left[i]), str(right[i]))
+            return lambda i: compare(left[i], right[i])
+        if isinstance(left, storage.DictColumn):
+            compare, code = left.code_condition(operator, value_or_column2)
+            codes = left.codes
+            return lambda i: compare(codes[i], code)
+        return lambda i: compare(left[i], value_or_column2)
+
+    if column:
+        if is_text(table, column1) and is_text(table, value_or_column2):
+            return lambda row: compare(row[column1], row[value_or_column2])
+        return lambda row: compare(str(row[column1]), str(row[value_or_column2]))
+    value = str(value_or_column2)
+    if is_text(table, column1):
+        return lambda row: compare(row[column1], value)
+    return lambda row: compare(str(row[column1]), value)
+
+def part(values, start, stop):
+    # the values of the rows start..stop, slicing copies in C where islice would step over the skipped values
+    if start == 0 and stop is None:
+        return values
+    if isinstance(values, storage.DictColumn):
+        return list(map(values.dictionary.__getitem__, values.codes[start:stop]))
+    return values[start:stop]
+
+def compile_selectors(table, condition, column=False):
+    # the condition as a function selectors(start=0, stop=None) that returns an iterator of
+    # one boolean per row of that range. the comparisons run in map() over the column values,
+    # so no python code runs per row; AND, OR and NOT combine the booleans in map() as well
+    condition = normalize_condition(condition, column)
+    if not is_comparison(condition):
+        kind, operand = condition
+        if kind == 'not':
+            inner = compile_selectors(table, operand)
+            return lambda start=0, stop=None: map(op.not_, inner(start, stop))
+        parts = [compile_selectors(table, child) for child in operand]
+        combine = op.and_ if kind == 'and' else op.or_
+        return lambda start=0, stop=None: reduce(partial(map, combine), [selectors(start, stop) for selectors in parts])
+    column1, operator, value_or_column2, column = condition
+    compare = comparisons[operator]
+
+    if is_columnar(table):
+        store = table['data']
+        left = store.column(column1)
+        if column:
+            right = store.column(value_or_column2)
+            if isinstance(left, storage.DictColumn) and isinstance(right, storage.DictColumn):
+                # compare the ranks of the codes instead of decoding the strings
+                left_ranks, right_ranks = left.ranks(right)
+                return lambda start=0, stop=None: map(compare, map(left_ranks.__getitem__, part(left.codes, start, stop)),
+                                                      map(right_ranks.__getitem__, part(right.codes, start, stop)))
+            if store.types[column1] != store.types[value_or_column2] and not (is_text(table, column1) and is_text(table, value_or_column2)):
+                # mixed types are compared as text, like in the row layout
+                return lambda start=0, stop=None: map(compare, map(str, part(left, start, stop)), map(str, part(right, start, stop)))
+            return lambda start=0, stop=None: map(compare, iter(part(left, start, stop)), iter(part(right, start, stop)))
+        if isinstance(left, storage.DictColumn):
+            compare, code = left.code_condition(operator, value_or_column2)
+            return lambda start=0, stop=None: map(partial(flipped[compare], code), part(left.codes, start, stop))
+        return lambda start=0, stop=None: map(partial(swapped[operator], value_or_column2), part(left, start, stop))
+
+    data = table['data']
+    get_left = op.itemgetter(column1)
+    if column:
+        get_right = op.itemgetter(value_or_column2)
+        if is_text(table, column1) and is_text(table, value_or_column2):
+            return lambda start=0, stop=None: map(compare, map(get_left, part(data, start, stop)), map(get_right, part(data, start, stop)))
+        return lambda start=0, stop=None: map(compare, map(str, map(get_left, part(data, start, stop))), map(str, map(get_right, part(data, start, stop))))
+    test = partial(swapped[operator], str(value_or_column2))
+    if is_text(table, column1):
+        return lambda start=0, stop=None: map(test, map(get_left, part(data, start, stop)))
+    return lambda start=0, stop=None: map(test, map(str, map(get_left, part(data, start, stop))))
+
+def live_ids(table, ids):
+    # the row ids without the ones of deleted rows, lazily
+    dead = tombstones(table)
+    return ids if dead is None else filterfalse(dead.__contains__, ids)
+
+def compile_scan(table, condition, column=False):
+    # the condition as a function that returns an iterator over the matching items of the
+    # whole table; the iterator is lazy, a LIMIT can stop it early
+    selectors = compile_selectors(table, condition, column)
+    # the row ids also bound the scan to the rows of a read view
+    rows = range(len(table['data']))
+    if is_columnar(table):
+        return lambda: live_ids(table, compress(rows, selectors()))
+    data = table['data']
+    if tombstones(table) is None:
+        return lambda: compress(data, selectors())
+    # only the matches are checked for tombstones, by their row ids
+    get = row_getter(table)
+    return lambda: map(get, live_ids(table, compress(rows, selectors())))
+
+def walk_index(table, plan, visited=None):
+    # yields the items in the order of the index on the leading order column
+    # :param visited: one element list, counts the postings read from the index
+    index = table['index'][plan['index']]
+    order_by = plan['order_by']
+    # the comparisons on the index column itself only walk the matching keys
+    bounds, residual = index_bounds(table, plan['condition'], plan['index'])
+    keys = bound_keys(index, bounds) if bounds else None
+    keep = compile_predicate(table, residual) if residual else None
+    descending = order_by[0][1].upper() == "DESC"
+    if keys is None:
+        keys = reversed(index.keys()) if descending else index.keys()
+    elif descending:
+        keys = reversed(list(keys))
+
+    for key in keys:
+        items = posting_items(table, index[key])
+        if visited is not None:
+            visited[0] += len(items)
+        if keep is not None:
+            items = list(filter(keep, items))
+        if len(order_by) > 1 and len(items) > 1:
+            items = list(items)
+            sort_items(table, items, order_by[1:])
+        yield from items
+
+def scan(table, condition, column=False, lazy=False, workers=1):
+    # lazy: yield the matching items one by one, so a LIMIT can stop the scan early
+    # workers: split the scan into this many row ranges filtered in parallel processes
+    if not condition:
+        rows = range(len(table['data']))
+        if tombstones(table) is not None:
+            items = live_ids(table, rows)
+            items = items if is_columnar(table) else map(row_getter(table), items)
+            return items if lazy else list(items)
+        if is_columnar(table):
+            return rows
+        return iter(table['data']) if lazy else list(table['data'])
+    if workers > 1:
+        ids = parallel.scan(len(table['data']), compile_selectors(table, condition, column), workers)
+        return posting_items(table, list(live_ids(table, ids)))
+    items = compile_scan(table, condition, column)()
+    return items if lazy else list(items)
@@ -0,0 +1,64 @@
+import sys, io, csv, json
+
+# output formats that can be chosen with SET FORMAT
+formats = ['table', 'csv', 'jsonl']
+
+# rows are formatted into a buffer and written out in chunks of this many rows
+chunk_rows = 4096
+
+def table_writer(columns, out):
+    # same box layout as database.print_table
+    border = '+' + ("=" * 16 + '+') * len(columns) + '\n'
+    separator = '+' + ("-" * 16 + '+') * len(columns) + '\n'
+    line = '║' + ' |'.join(['{:<15}'] * len(columns)) + ' ║\n' + separator
+    out.write(border + '║' + ' ║'.join(col_name.ljust(15) for col_name in columns) + ' ║\n' + border)
+
+    def write(rows):
+        out.write(''.join([line.format(*[str(row[column]) for column in columns]) for row in rows]))
+    return write
+
+def csv_writer(columns, out):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(columns)
+
+    def write(rows):
+        writer.writerows([[row[column] for column in columns] for row in rows])
+        out.write(buffer.getvalue())
+        buffer.seek(0)
+        buffer.truncate()
+    write([])
+    return write
+
+def jsonl_writer(columns, out):
+    dumps = json.JSONEncoder(ensure_ascii=False, default=str).encode
+
+    def write(rows):
+        out.write(''.join([dumps({column: row[column] for column in columns}) + '\n' for row in rows]))
+    return write
+
+writers = {'table': table_writer, 'csv': csv_writer, 'jsonl': jsonl_writer}
+
+def render(columns, rows, out=None, fmt='table'):
+    # rows: any iterable of row dicts, it is consumed chunk by chunk so a generator
+    # of rows is written out without ever being materialized as a whole
+    # :return: number of rows written
+    out = out or sys.stdout
+    write = writers[fmt](columns, out)
+    count = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_rows:
+            write(chunk)
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        write(chunk)
+        count += len(chunk)
+    out.flush()
+    return count
+
+def open_output(path):
+    # large write buffer for result files
+    return open(path, 'w', encoding='utf-8', newline='', buffering=1 << 20)
@@ -0,0 +1,96 @@
+import sys
+import threading
+from collections import OrderedDict
+
+# opt-in cache of SELECT results, shared by all interpreters (and server connections).
+# an entry is the output text of a SELECT, keyed by the output format and the parsed
+# statement with its literal values, so the same query written with other spacing or
+# run as a prepared statement finds it too. every entry is tagged with the version of each
+# table it read: writers give a table a new version whenever they publish rows
+# (database.publish), so an entry whose tables have moved on is dropped instead of served.
+# the versions are read before the query runs, a write that lands while it runs only makes
+# the entry look older than it is. memory is bounded by the total size of the cached
+# texts, the least recently used entries are evicted first
+
+class ResultCache(object):
+
+    def __init__(self, max_bytes=0):
+        self.max_bytes = max_bytes  # 0 turns the cache off
+        self.entries = OrderedDict()  # key -> (tags, text, row count, size)
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, tags):
+        # :return: (text, row count), or None when there is no entry for these table versions
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] != tags:
+                self.remove(key)
+                self.invalidations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, key, tags, text, count):
+        size = sys.getsizeof(text) + sys.getsizeof(key[1])
+        with self.lock:
+            if size > self.max_bytes:
+                return
+            if key in self.entries:
+                self.remove(key)
+            self.entries[key] = (tags, text, count, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                self.remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def remove(self, key):
+        self.size -= self.entries.pop(key)[3]
+
+    def resize(self, max_bytes):
+        with self.lock:
+            self.max_bytes = max_bytes
+            while self.entries and self.size > max_bytes:
+                self.remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.size, 'max_bytes': self.max_bytes, 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions, 'invalidations': self.invalidations}
+
+results = ResultCache()
+
+
+class Tee(object):
+    # passes the output of a query through and keeps a copy of it while it fits in limit bytes
+
+    def __init__(self, out, limit):
+        self.out = out
+        self.limit = limit
+        self.parts = []
+        self.size = 0
+
+    def write(self, text):
+        self.out.write(text)
+        if self.parts is not None:
+            self.size += len(text)
+            if self.size > self.limit:
+                self.parts = None
+            else:
+                self.parts.append(text)
+
+    def flush(self):
+        self.out.flush()
+
+    def text(self):
+        # None when the output was too large to keep
+        return None if self.parts is None else ''.join(self.parts)
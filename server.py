@@ -0,0 +1,198 @@
+import sys, io, asyncio, threading
+from concurrent.futures import ThreadPoolExecutor
+from parser import Interpreter, is_quit
+
+# TCP server that lets many clients use the same in-memory database.
+# protocol, line based and utf-8 encoded:
+#   client: a request is one or more statements, it ends with a line ending in ";"
+#   server: for every statement of the request its output lines, each sent with a leading ".",
+#           then one status line: "OK" or "ERROR <message>". a statement fails when it writes
+#           to stderr or the engine prints an "Error" line. a request with a broken string
+#           gets a single ERROR line and none of its statements run.
+# every connection has its own interpreter: SET FORMAT, the statement cache and prepared
+# statements are per connection. results are written as JSONL unless the client changes it.
+# the statements run in a pool of database threads, so the event loop keeps accepting
+# connections and streaming rows while a long query runs. selects read from snapshot views
+# (views.py) and do not wait for the inserts of other connections; large scans are spread
+# over worker processes by parallel.py
+
+# largest request line
+line_limit = 1 << 20
+
+# the statements of one connection still run one after the other
+database_threads = ThreadPoolExecutor(8, thread_name_prefix='database')
+
+
+class ThreadOutput(object):
+    # stands in for sys.stdout / sys.stderr: a database thread writes to the stream of the
+    # statement it runs, every other thread to the original stream
+
+    def __init__(self, default):
+        self.default = default
+        self.local = threading.local()
+
+    def target(self):
+        return getattr(self.local, 'stream', None) or self.default
+
+    def write(self, text):
+        return self.target().write(text)
+
+    def flush(self):
+        self.target().flush()
+
+stdout = ThreadOutput(sys.stdout)
+stderr = ThreadOutput(sys.stderr)
+
+
+class ResultStream(object):
+    # file-like object the interpreter writes to in the database thread, the text is
+    # handed to the connection's event loop and sent out as data lines
+
+    def __init__(self, loop, queue):
+        self.loop = loop
+        self.queue = queue
+        self.line_start = True
+
+    def write(self, text):
+        if not text:
+            return
+        data = ('.' if self.line_start else '') + text[:-1].replace('\n', '\n.') + text[-1]
+        self.line_start = text.endswith('\n')
+        self.send(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def status(self, errors):
+        # ends the output of a statement with its status line
+        end = '' if self.line_start else '\n'
+        self.line_start = True
+        errors = errors.strip()
+        self.send(end + ('ERROR ' + ' | '.join(errors.splitlines()) if errors else 'OK') + '\n')
+
+    def send(self, text):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, text.encode('utf-8'))
+
+
+class EngineOutput(object):
+    # sys.stdout of a statement: the database engine prints its messages, the lines starting
+    # with "Error" are errors of the statement and end up in its status line, the others are
+    # sent as data lines like the results
+
+    def __init__(self, stream, errors):
+        self.stream = stream
+        self.errors = errors
+        self.line = ''
+
+    def write(self, text):
+        lines = (self.line + text).split('\n')
+        self.line = lines.pop()
+        for line in lines:
+            (self.errors if line.startswith('Error') else self.stream).write(line + '\n')
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.line:
+            self.write('\n')
+
+
+def is_set_output(tokens):
+    return len(tokens) > 1 and tokens[0].text.upper() == "SET" and tokens[1].text.upper() == "OUTPUT"
+
+def run_request(interpreter, text, stream):
+    # runs in the database thread
+    # :return: False when the client asked to quit
+    errors = io.StringIO()
+    stderr.local.stream = errors
+    try:
+        tokens = interpreter.parser.lexer.tokenize(text)
+    finally:
+        stderr.local.stream = None
+    if any(token.type == "error" for token in tokens):
+        stream.status(errors.getvalue())
+        return True
+    interpreter.parser.pending = []
+    for statement in interpreter.parser.split(tokens):
+        if is_quit(statement[0]):
+            return False
+        errors = io.StringIO()
+        if is_set_output(statement):
+            errors.write('SET OUTPUT is not available over the network')
+        else:
+            output = EngineOutput(stream, errors)
+            stdout.local.stream = output
+            stderr.local.stream = errors
+            try:
+                interpreter.execute(statement)
+            except Exception as e:
+                errors.write(f'{type(e).__name__}: {e}')
+            finally:
+                output.close()
+                stdout.local.stream = None
+                stderr.local.stream = None
+        stream.status(errors.getvalue())
+    if interpreter.parser.pending:
+        interpreter.parser.pending = []
+        stream.status('the last command is missing its ";"')
+    return True
+
+async def send_results(queue, writer):
+    while True:
+        data = await queue.get()
+        if data is None:
+            return
+        writer.write(data)
+        await writer.drain()
+
+async def handle_connection(reader, writer):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stream = ResultStream(loop, queue)
+    interpreter = Interpreter()
+    interpreter.format = 'jsonl'
+    interpreter.output = stream
+    sender = loop.create_task(send_results(queue, writer))
+    lines = []
+    try:
+        while True:
+            try:
+                line = await reader.readline()
+            except (ValueError, ConnectionError):
+                break  # line over the limit or connection reset
+            if not line:
+                break
+            lines.append(line.decode('utf-8', 'replace'))
+            if not line.rstrip().endswith(b';'):
+                continue
+            text = ''.join(lines)
+            lines = []
+            if not await loop.run_in_executor(database_threads, run_request, interpreter, text, stream):
+                break
+    finally:
+        queue.put_nowait(None)
+        try:
+            await sender
+        except ConnectionError:
+            pass
+        writer.close()
+
+async def serve(host='127.0.0.1', port=5433):
+    sys.stdout = stdout
+    sys.stderr = stderr
+    server = await asyncio.start_server(handle_connection, host, port, limit=line_limit)
+    addresses = ', '.join(str(socket.getsockname()[:2]) for socket in server.sockets)
+    sys.__stdout__.write(f"Serving on {addresses}\n")
+    sys.__stdout__.flush()
+    async with server:
+        await server.serve_forever()
+
+def run(host='127.0.0.1', port=5433):
+    try:
+        asyncio.run(serve(host, port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,225 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import repeat, islice
+import operator as op
+
+# column types that can be declared in CREATE, mapped to the internal type name
+type_names = {
+    'INT': 'int', 'INTEGER': 'int',
+    'FLOAT': 'float', 'REAL': 'float',
+    'STR': 'str', 'TEXT': 'str', 'VARCHAR': 'str',
+    'DICT': 'dict', 'ENUM': 'dict'
+}
+
+# fixed width types are kept in typed arrays, everything else in plain lists
+typecodes = {'int': 'q', 'float': 'd'}
+
+# index postings of both layouts: the row ids of a key in increasing order, 4 bytes each
+posting_type = 'I' if array('I').itemsize >= 4 else 'L'
+
+def postings(row_ids=()):
+    return array(posting_type, row_ids)
+
+def new_column(column_type):
+    if column_type in typecodes:
+        return array(typecodes[column_type])
+    if column_type == 'dict':
+        return DictColumn()
+    return []
+
+def convert(column_type, value):
+    # raises ValueError if the value does not fit the column type
+    if column_type == 'int':
+        return int(value)
+    if column_type == 'float':
+        return float(value)
+    return str(value)
+
+
+class DictColumn(object):
+    # dictionary encoded text column for low cardinality values:
+    # every value is stored as a small integer code into a sorted list of the distinct strings,
+    # since the dictionary is kept sorted, comparing codes gives the same order as comparing strings
+
+    def __init__(self):
+        self.dictionary = []  # sorted distinct values, code -> value
+        self.lookup = {}  # value -> code
+        self.codes = array('B')
+
+    def append(self, value):
+        code = self.lookup.get(value)
+        if code is None:
+            code = self.add_value(value)
+        self.codes.append(code)
+
+    def extend(self, values):
+        # register the new distinct values first so the codes are shifted at most once per value
+        for value in set(values).difference(self.lookup):
+            self.add_value(value)
+        lookup = self.lookup
+        self.codes.extend([lookup[value] for value in values])
+
+    def add_value(self, value):
+        # a value that goes in the middle of the dictionary replaces the dictionary, lookup and
+        # codes with shifted copies instead of changing them in place, so a read view that holds
+        # the old ones (see pinned) keeps decoding its rows correctly
+        code = bisect_left(self.dictionary, value)
+        typecode = self.codes.typecode
+        if len(self.dictionary) + 1 > 2 ** (8 * self.codes.itemsize):
+            # widen the codes once they stop fitting
+            typecode = 'H' if typecode == 'B' else 'I'
+        if code == len(self.dictionary):
+            self.dictionary.append(value)
+            self.lookup[value] = code
+            if typecode != self.codes.typecode:
+                self.codes = array(typecode, self.codes)
+            return code
+        dictionary = self.dictionary[:code] + [value] + self.dictionary[code:]
+        codes = array(typecode, [c + 1 if c >= code else c for c in self.codes])
+        self.lookup = {value: i for i, value in enumerate(dictionary)}
+        self.dictionary = dictionary
+        self.codes = codes
+        return code
+
+    def code_condition(self, operator, value):
+        # translate "column <operator> value" into a comparison on the codes
+        if operator == '>':
+            return op.ge, bisect_right(self.dictionary, value)
+        if operator == '>=':
+            return op.ge, bisect_left(self.dictionary, value)
+        if operator == '<':
+            return op.lt, bisect_left(self.dictionary, value)
+        if operator == '<=':
+            return op.lt, bisect_right(self.dictionary, value)
+        if operator == '=':
+            return op.eq, self.lookup.get(value, -1)
+        if operator == '!=':
+            return op.ne, self.lookup.get(value, -1)
+        return None, None
+
+    def ranks(self, other):
+        # code -> position in the merged dictionaries of both columns, so two
+        # dictionary encoded columns can be compared code to code
+        merged = sorted(set(self.dictionary) | set(other.dictionary))
+        position = {value: i for i, value in enumerate(merged)}
+        return [position[value] for value in self.dictionary], [position[value] for value in other.dictionary]
+
+    def pinned(self):
+        # a column object sharing the current dictionary and codes; appends to the codes go
+        # past the rows of a read view and the encoding is only replaced, never changed
+        column = DictColumn.__new__(DictColumn)
+        column.dictionary = self.dictionary
+        column.lookup = self.lookup
+        column.codes = self.codes
+        return column
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, row_id):
+        return self.dictionary[self.codes[row_id]]
+
+    def __iter__(self):
+        return map(self.dictionary.__getitem__, self.codes)
+
+
+class ColumnStore(object):
+    # stores a table column by column instead of a list of row dicts,
+    # a row is only identified by its position (row id) in the column arrays
+
+    def __init__(self, columns, types):
+        self.columns = columns
+        self.types = {column: types.get(column, 'str') for column in columns}
+        self.arrays = {column: new_column(self.types[column]) for column in columns}
+        self.size = 0
+
+    def append(self, values):
+        # values: already converted, in the same order as the columns
+        for column, value in zip(self.columns, values):
+            self.arrays[column].append(value)
+        self.size += 1
+
+    def extend(self, column_values):
+        # column_values: one list of converted values per column, all of the same length
+        for column, values in zip(self.columns, column_values):
+            self.arrays[column].extend(values)
+        self.size += len(column_values[0]) if column_values else 0
+
+    def column(self, name):
+        return self.arrays[name]
+
+    def view(self, size):
+        # read only store of the first size rows sharing the column arrays: rows appended
+        # later lie past its size, dictionary columns are pinned to their current encoding
+        store = ColumnStore.__new__(ColumnStore)
+        store.columns = self.columns
+        store.types = self.types
+        store.arrays = {column: values.pinned() if isinstance(values, DictColumn) else values
+                        for column, values in self.arrays.items()}
+        store.size = size
+        return store
+
+    def take(self, row_ids):
+        # new store of the given rows, in that order; dictionary columns keep sharing their
+        # encoding, which is only appended to or replaced
+        store = ColumnStore.__new__(ColumnStore)
+        store.columns = self.columns
+        store.types = self.types
+        store.arrays = {}
+        for column, values in self.arrays.items():
+            if isinstance(values, DictColumn):
+                taken = values.pinned()
+                taken.codes = array(values.codes.typecode, map(values.codes.__getitem__, row_ids))
+            elif isinstance(values, array):
+                taken = array(values.typecode, map(values.__getitem__, row_ids))
+            else:
+                taken = list(map(values.__getitem__, row_ids))
+            store.arrays[column] = taken
+        store.size = len(row_ids)
+        return store
+
+    def sort_key(self, name):
+        # dictionary encoded columns are sorted by their codes
+        values = self.arrays[name]
+        if isinstance(values, DictColumn):
+            return values.codes.__getitem__
+        return values.__getitem__
+
+    def row(self, row_id):
+        return {column: self.arrays[column][row_id] for column in self.columns}
+
+    def rows(self, row_ids):
+        # materialize only the requested rows: gather the values column by column,
+        # decoding dictionary columns through the dictionary, then zip them into rows
+        row_ids = row_ids if isinstance(row_ids, (list, range, array)) else list(row_ids)
+        gathered = []
+        for column in self.columns:
+            values = self.arrays[column]
+            if isinstance(values, DictColumn):
+                gathered.append(list(map(values.dictionary.__getitem__, map(values.codes.__getitem__, row_ids))))
+            else:
+                gathered.append(list(map(values.__getitem__, row_ids)))
+        return list(map(dict, map(zip, repeat(self.columns), zip(*gathered))))
+
+    def iter_rows(self, row_ids):
+        arrays = [self.arrays[column] for column in self.columns]
+        columns = self.columns
+        for i in row_ids:
+            yield dict(zip(columns, [values[i] for values in arrays]))
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, row_id):
+        if isinstance(row_id, slice):
+            return self.rows(range(*row_id.indices(self.size)))
+        if row_id < 0:
+            row_id += self.size
+        if row_id < 0 or row_id >= self.size:
+            raise IndexError("row id out of range")
+        return self.row(row_id)
+
+    def __iter__(self):
+        columns = self.columns
+        for values in islice(zip(*[self.arrays[column] for column in columns]), self.size):
+            yield dict(zip(columns, values))
@@ -0,0 +1,54 @@
+import os
+import re
+import subprocess
+import sys
+import pytest
+
+# the modules live at the top of the repository and are imported by name, like main.py does
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+import database
+
+
+@pytest.fixture(autouse=True)
+def empty_database():
+    # every test starts without tables and without a journal
+    database.database.clear()
+    yield
+    database.database.clear()
+    database.journal = None
+    database.after_write = None
+
+
+@pytest.fixture
+def switch_often():
+    # let the threads take turns after a few bytecodes, so the writes land inside the reads
+    # and compactions of the other threads
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+@pytest.fixture
+def serve():
+    # starts servers on free ports, in their own processes like main.py runs them, and kills
+    # them after the test
+    # :return: function(*arguments of main.py) -> (process, port)
+    processes = []
+
+    def start(*arguments):
+        process = subprocess.Popen([sys.executable, os.path.join(root, "main.py")] + list(arguments) + ["--serve", "127.0.0.1:0"],
+                                   stdout=subprocess.PIPE, text=True)
+        processes.append(process)
+        for line in process.stdout:
+            if line.startswith("Serving on"):
+                return process, int(re.search(r"(\d+)\)", line).group(1))
+        raise RuntimeError("the server did not start")
+
+    yield start
+    for process in processes:
+        process.kill()
+        process.wait()
+        process.stdout.close()
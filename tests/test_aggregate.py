@@ -0,0 +1,40 @@
+import parser
+import database
+import views
+
+
+def select(interpreter, capsys, query):
+    capsys.readouterr()
+    interpreter.run("SET FORMAT CSV; " + query)
+    return capsys.readouterr().out.splitlines()[1:]
+
+
+def test_index_groups_count_without_reading_postings(capsys, monkeypatch):
+    interpreter = parser.Interpreter()
+    interpreter.run('CREATE c (id INT, dept DICT INDEXED); CREATE r (id, dept INDEXED);')
+    for table in ("c", "r"):
+        database.bulk_insert(table, [[str(i), "d" + str(i % 4)] for i in range(100)])
+    expected = ["d0,25", "d1,25", "d2,25", "d3,25"]
+    # without tombstones the groups are counted from the lengths of the posting lists
+    monkeypatch.setattr(views.IndexView, 'visible', None)
+    for table in ("c", "r"):
+        capsys.readouterr()
+        interpreter.run("EXPLAIN SELECT dept, COUNT(*) FROM " + table + " GROUP_BY dept;")
+        assert "counts from posting list lengths" in capsys.readouterr().out
+        assert select(interpreter, capsys, "SELECT dept, COUNT(*) FROM " + table + " GROUP_BY dept;") == expected
+    monkeypatch.undo()
+    for table in ("c", "r"):
+        interpreter.run('DELETE FROM ' + table + ' WHERE dept = "d1"; DELETE FROM ' + table + ' WHERE id = "2";')
+        assert select(interpreter, capsys, "SELECT dept, COUNT(*) FROM " + table + " GROUP_BY dept;") == ["d0,25", "d2,24", "d3,25"]
+        assert select(interpreter, capsys, 'SELECT dept, COUNT(*) FROM ' + table + ' WHERE dept >= "d1" GROUP_BY dept;') == ["d2,24", "d3,25"]
+
+
+def test_order_by_result_columns(capsys):
+    interpreter = parser.Interpreter()
+    interpreter.run('CREATE t (id INT, dept TEXT, salary INT);')
+    database.bulk_insert("t", [[str(i), "d" + str(i % 5), str(i % 3 * 100)] for i in range(30)])
+    rows = select(interpreter, capsys, "SELECT dept, salary, COUNT(*) FROM t GROUP_BY dept, salary ORDER_BY dept DESC, salary ASC;")
+    assert rows == sorted(sorted(rows, key=lambda row: int(row.split(",")[1])), key=lambda row: row.split(",")[0], reverse=True)
+    assert select(interpreter, capsys, "SELECT dept, salary, COUNT(*) FROM t GROUP_BY dept, salary ORDER_BY dept DESC, salary ASC LIMIT 4;") == rows[:4]
+    assert select(interpreter, capsys, "SELECT dept, salary, COUNT(*) FROM t GROUP_BY dept, salary ORDER_BY dept DESC, salary DESC LIMIT 4;") == \
+        sorted(rows, key=lambda row: (row.split(",")[0], int(row.split(",")[1])), reverse=True)[:4]
@@ -0,0 +1,90 @@
+import random
+import threading
+import pytest
+import database
+import planner
+import views
+
+
+def value(layout, number):
+    return number if layout == 'columnar' else str(number)
+
+
+def contents(table, condition=None):
+    return {int(row['id']): str(row['v']) for row in planner.select(table, condition)}
+
+
+@pytest.mark.parametrize("layout", ["columnar", "rows"])
+def test_compaction_under_concurrent_writes(layout, switch_often, monkeypatch):
+    monkeypatch.setattr(database, 'compaction_threshold', 2)  # only the compactions started here
+    database.create_table('t', ['id', 'v'], ['id', 'v'], {'id': 'int', 'v': 'int'} if layout == 'columnar' else None)
+    database.bulk_insert('t', [[str(i), str(i % 97)] for i in range(20000)])
+    table = database.database['t']
+    model = {i: str(i % 97) for i in range(20000)}
+    failures = []
+    monkeypatch.setattr(threading, 'excepthook', failures.append)
+    rnd = random.Random(7)
+    next_id = 20000
+    for round_ in range(4):
+        bound = value(layout, 10 + round_ * 10)
+        database.delete_from_table('t', ('v', '<', bound, False))
+        model = {key: v for key, v in model.items() if value(layout, int(v)) >= bound}
+        # the rows the compaction keeps, and the rows appended while it runs
+        kept = len(table['data']) - len(table['dead'])
+        appended = 0
+        compaction = threading.Thread(target=database.compact_table, args=('t',))
+        compaction.start()
+        while compaction.is_alive():
+            choice = rnd.random()
+            if choice < 0.5:
+                database.insert_into_table('t', [str(next_id), str(next_id % 97)])
+                model[next_id] = str(next_id % 97)
+                next_id += 1
+                appended += 1
+            elif choice < 0.8:
+                victim = rnd.choice(list(model))
+                database.delete_from_table('t', ('id', '=', value(layout, victim), False))
+                del model[victim]
+            else:
+                # many rows at once, their new versions extend the postings of many keys
+                old = str(rnd.randrange(40, 96))
+                appended += database.update_table('t', [('v', '96')], ('v', '=', value(layout, int(old)), False))
+                model.update((key, '96') for key, v in model.items() if v == old)
+        compaction.join()
+        assert not failures
+        # the rows deleted before the compaction are gone, the writes made during it are kept;
+        # the compaction may also drop rows deleted before it took its read view
+        assert len(table['data']) <= kept + appended
+        assert len(table['data']) == len(model) + len(table['dead'])
+        assert contents(table) == model
+        assert contents(table, ('v', '=', value(layout, 96), False)) == {key: v for key, v in model.items() if v == '96'}
+        assert contents(table, ('id', '>=', value(layout, 20000), False)) == {key: v for key, v in model.items() if value(layout, key) >= value(layout, 20000)}
+
+
+def test_read_view_survives_compaction():
+    database.create_table('t', ['id', 'v'], ['v'])
+    database.bulk_insert('t', [[str(i), str(i % 10)] for i in range(1000)])
+    database.delete_from_table('t', ('v', '<', '5', False))
+    table = database.database['t']
+    view = views.read_view(table)
+    before = contents(view, ('v', '=', '7', False))
+    database.compact_table('t')
+    assert len(table['data']) == 500 and not table['dead']
+    assert contents(view, ('v', '=', '7', False)) == before == contents(table, ('v', '=', '7', False))
+
+
+def test_update_that_does_not_fit_the_index_changes_nothing(monkeypatch):
+    database.create_table('e', ['id', 'name'], ['id'])
+    for i in range(20):
+        database.insert_into_table('e', [i, 'n' + str(i)])
+    records = []
+    monkeypatch.setattr(database, 'journal', records.append)
+    table = database.database['e']
+    before = list(planner.select(table, None))
+    # text among the number keys of the index
+    assert database.update_table('e', [('id', '99')], ('name', '=', 'n1', False)) == 0
+    assert not records and not table['dead'] and len(table['data']) == 20
+    database.insert_into_table('e', [20, 'n20'])
+    assert list(planner.select(table, None)) == before + [{'id': 20, 'name': 'n20'}]
+    assert database.update_table('e', [('id', 99)], ('name', '=', 'n1', False)) == 1
+    assert list(planner.select(table, ('id', '=', 99, False), column=False)) == [{'id': 99, 'name': 'n1'}]
@@ -0,0 +1,103 @@
+import random
+import pytest
+import database
+import joins
+import parser
+import planner
+import views
+
+
+def output(interpreter, capsys, text):
+    capsys.readouterr()
+    interpreter.run(text)
+    return capsys.readouterr().out
+
+
+@pytest.fixture
+def tables():
+    # emp.dept holds text, dept.id numbers of a columnar table: joined as text, "07" finds no dept;
+    # num.dept holds numbers of the row layout, which are compared as text too
+    rnd = random.Random(4)
+    database.create_table('emp', ['id', 'name', 'dept'], ['dept'])
+    database.create_table('dept', ['id', 'title'], ['id'], {'id': 'int', 'title': 'dict'}, {'id': 'hash'})
+    database.create_table('num', ['id', 'dept'], ['dept'])
+    database.bulk_insert('emp', [[str(i), 'n%03d' % rnd.randrange(1000), rnd.choice(['07', '12']) if i % 50 == 0 else str(rnd.randrange(40))]
+                                 for i in range(600)])
+    database.bulk_insert('dept', [[str(i), 't' + str(i % 6)] for i in range(0, 30, 2)])
+    database.bulk_insert('num', [[i, rnd.randrange(40)] for i in range(300)])
+    # tombstones on every side
+    database.delete_from_table('emp', ('name', '<', 'n100', False))
+    database.delete_from_table('dept', ('id', '=', '8', False))
+    database.delete_from_table('num', ('id', '<', '20', False))
+    return [views.read_view(database.database[name]) for name in ('emp', 'dept', 'num')]
+
+
+def expected_pairs(left, right, left_column, right_column):
+    # the pairs of visible rows with equal join values, compared as text
+    return sorted((tuple(a.values()), tuple(b.values())) for a in planner.select(left) for b in planner.select(right)
+                  if str(a[left_column]) == str(b[right_column]))
+
+
+def variants(plan):
+    # the plan with every way of finding the pairs its tables allow
+    plans = [dict(plan, access='hash_join', build=build, outer=None) for build in (0, 1)]
+    for inner in (0, 1):
+        side = plan['sides'][inner]
+        if side['column'] in side['table']['index'] and planner.index_fits(side['table'], side['column']):
+            plans.append(dict(plan, access='index_join', build=None, outer=1 - inner))
+    return plans
+
+
+@pytest.mark.parametrize("names", [('emp', 'dept'), ('dept', 'emp'), ('num', 'dept'), ('emp', 'num')])
+def test_every_join_finds_the_same_pairs(tables, names, monkeypatch):
+    views_ = dict(zip(('emp', 'dept', 'num'), tables))
+    left, right = views_[names[0]], views_[names[1]]
+    columns = {'emp': 'dept', 'dept': 'id', 'num': 'dept'}
+    on = (names[0] + '.' + columns[names[0]], names[1] + '.' + columns[names[1]])
+    plan = joins.plan_join([left, right], list(names), on)
+    expected = expected_pairs(left, right, columns[names[0]], columns[names[1]])
+    assert expected
+    accesses = set()
+    for variant in variants(plan):
+        accesses.add((variant['access'], variant['outer']))
+        width = len(left['columns'])
+        got = sorted((tuple(row.values())[:width], tuple(row.values())[width:]) for row in joins.execute(variant))
+        assert got == expected, (names, variant['access'], variant['outer'])
+    if 'num' not in names:
+        assert accesses == {('hash_join', None), ('index_join', 0), ('index_join', 1)}
+    # the index of num holds numbers, which do not compare like the text the join compares:
+    # even with hash joins priced out it is never the inner side of an index join
+    monkeypatch.setattr(joins, 'build_cost', 1e9)
+    plan = joins.plan_join([left, right], list(names), on)
+    assert plan['access'] == 'index_join'
+    assert plan['sides'][1 - plan['outer']]['name'] != 'num'
+
+
+def test_conditions_are_pushed_to_their_side(tables):
+    emp, dept = tables[:2]
+    condition = ('and', [('name', '>', 'n5', False), ('dept.title', '=', 't3', False), ('emp.name', '>', 'title', True)])
+    plan = joins.plan_join([emp, dept], ['emp', 'dept'], ('dept', 'dept.id'), condition, [('emp.id', 'ASC')])
+    assert plan['sides'][0]['condition'] == ('name', '>', 'n5', False)
+    assert plan['sides'][1]['condition'] == ('title', '=', 't3', False)
+    assert plan['residual'] == ('emp.name', '>', 'dept.title', True)
+    expected = sorted(((a, b) for a, b in ((tuple(a.values()), tuple(b.values())) for a in planner.select(emp) for b in planner.select(dept)
+                       if a['dept'] == str(b['id']) and a['name'] > 'n5' and b['title'] == 't3' and a['name'] > b['title'])),
+                      key=lambda pair: pair[0][0])
+    for variant in variants(plan):
+        assert [(tuple(row.values())[:3], tuple(row.values())[3:]) for row in joins.execute(variant)] == expected
+
+
+def test_column_names(tables, capsys):
+    interpreter = parser.Interpreter()
+    # bare names that only one of the tables has resolve to it
+    rows = output(interpreter, capsys, 'SET FORMAT CSV; SELECT * FROM emp JOIN dept ON dept = dept.id WHERE title = "t2" ORDER_BY name LIMIT 2;')
+    assert rows.splitlines()[0] == 'emp.id,emp.name,emp.dept,dept.id,dept.title'
+    assert all(line.endswith(',t2') for line in rows.splitlines()[1:])
+    assert output(interpreter, capsys, 'SELECT * FROM emp JOIN dept ON id = dept.id;') == \
+        "Error: Column 'id' is in both tables, write it as emp.id or dept.id.\n"
+    assert output(interpreter, capsys, 'SELECT * FROM emp JOIN dept ON emp.dept = dept.id WHERE salary > "1";') == \
+        "Error: Column 'salary' does not exist.\n"
+    assert output(interpreter, capsys, 'SELECT * FROM emp JOIN dept ON emp.dept = emp.id;') == \
+        "Error: the columns of ON must come from different tables.\n"
+    assert output(interpreter, capsys, 'SELECT * FROM emp JOIN dept ON emp.dept = dept.id ORDER_BY id;') == \
+        "Error: Column 'id' is in both tables, write it as emp.id or dept.id.\n"
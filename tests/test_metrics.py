@@ -0,0 +1,30 @@
+import re
+import database
+import parser
+import resultcache
+
+
+def test_query_metrics(capsys, monkeypatch):
+    monkeypatch.setattr(resultcache, 'results', resultcache.ResultCache())
+    interpreter = parser.Interpreter()
+    interpreter.run('CREATE t (id, v INDEXED); CREATE u (v, w); INSERT INTO t ("1", "a"); INSERT INTO u ("a", "b");')
+    reported = []
+    database.add_query_hook(reported.append)
+    try:
+        capsys.readouterr()
+        interpreter.run('EXPLAIN ANALYZE SELECT * FROM t WHERE v = "a"; EXPLAIN ANALYZE SELECT v, COUNT(*) FROM t GROUP_BY v;'
+                        'EXPLAIN ANALYZE SELECT * FROM t JOIN u ON t.v = u.v;')
+        lines = [line for line in capsys.readouterr().out.splitlines() if line.startswith('parse: ')]
+        interpreter.prepare('SELECT * FROM t WHERE v = ?').execute('a')
+        interpreter.run('SET CACHE 1; SELECT * FROM t; SELECT * FROM t;')
+    finally:
+        database.remove_query_hook(reported.append)
+    stages = r'parse: [\d.]+ ms  plan: [\d.]+ ms  '
+    assert re.fullmatch(stages + r'filter: [\d.]+ ms  sort: [\d.]+ ms  render: [\d.]+ ms  total: [\d.]+ ms', lines[0])
+    assert all(re.fullmatch(stages + r'execute: [\d.]+ ms  total: [\d.]+ ms', line) for line in lines[1:]) and len(lines) == 3
+    assert [metrics['access'] for metrics in reported] == ['full_scan', 'aggregate_index', 'hash_join', 'full_scan', 'full_scan', 'result_cache']
+    for metrics in reported:
+        timed = [stage for stage in ('parse', 'plan', 'filter', 'sort', 'render', 'execute') if stage in metrics]
+        assert abs(metrics['total'] - sum(metrics[stage] for stage in timed)) < 1e-9
+    # a prepared statement is not parsed when it runs
+    assert reported[3]['parse'] == 0.0 and reported[3]['cached']
@@ -0,0 +1,77 @@
+import signal
+import pytest
+import database
+import persistence
+import planner
+from client import Client
+
+
+@pytest.fixture
+def storage_dir(tmp_path):
+    yield str(tmp_path)
+    persistence.close_storage()
+
+
+def reopen(path):
+    persistence.close_storage()
+    database.database.clear()
+    persistence.open_storage(path)
+
+
+def contents(table_name):
+    return sorted(tuple(row.values()) for row in planner.select(database.database[table_name], None))
+
+
+def fill(path):
+    persistence.open_storage(path)
+    database.create_table('c', ['id', 'v', 's'], ['id', 'v'], {'id': 'int', 'v': 'int', 's': 'dict'})
+    database.create_table('r', ['id', 'v', 's'], ['v'])
+    for table_name in ('c', 'r'):
+        database.bulk_insert(table_name, [[str(i), str(i % 10), 's' + str(i % 3)] for i in range(500)])
+        database.insert_into_table(table_name, ['500', '5', 'new'])
+        database.delete_from_table(table_name, ('v', '=', '3', False))
+        database.update_table(table_name, [('v', '7')], ('s', '=', 's1', False))
+    return {table_name: contents(table_name) for table_name in ('c', 'r')}
+
+
+def test_log_replay(storage_dir):
+    expected = fill(storage_dir)
+    reopen(storage_dir)
+    assert {table_name: contents(table_name) for table_name in ('c', 'r')} == expected
+
+
+def test_snapshot_and_log_replay(storage_dir):
+    fill(storage_dir)
+    persistence.checkpoint()
+    database.insert_into_table('c', ['501', '1', 'late'])
+    database.delete_from_table('r', ('id', '<', '100', False))
+    expected = {table_name: contents(table_name) for table_name in ('c', 'r')}
+    reopen(storage_dir)
+    assert {table_name: contents(table_name) for table_name in ('c', 'r')} == expected
+
+
+def test_torn_record_is_cut(storage_dir):
+    expected = fill(storage_dir)
+    path = persistence.log_path(persistence.generation)
+    persistence.close_storage()
+    with open(path, 'ab') as log:
+        log.write(persistence.record_header.pack(100, 0) + b'torn')
+    reopen(storage_dir)
+    assert {table_name: contents(table_name) for table_name in ('c', 'r')} == expected
+    database.insert_into_table('r', ['600', '1', 'after'])
+    reopen(storage_dir)
+    assert ('600', '1', 'after') in contents('r')
+
+
+def test_idle_server_killed(storage_dir, serve):
+    # the writes of a server that sits idle are in the log when it is killed
+    process, port = serve("--data-dir", storage_dir)
+    with Client(port=port) as db:
+        db.execute('CREATE t (id INT INDEXED, name TEXT);')
+        for i in range(20):
+            db.execute(f'INSERT INTO t ("{i}", "n{i}");')
+        db.execute('DELETE FROM t WHERE id < "5";')
+        process.send_signal(signal.SIGKILL)
+        process.wait()
+    persistence.open_storage(storage_dir)
+    assert contents('t') == [(i, f'n{i}') for i in range(5, 20)]
@@ -0,0 +1,166 @@
+import operator
+import random
+import pytest
+import parser
+import database
+import planner
+import parallel
+
+
+def explain(interpreter, capsys, query):
+    capsys.readouterr()
+    interpreter.run("EXPLAIN " + query)
+    return capsys.readouterr().out
+
+
+def select(interpreter, capsys, query):
+    capsys.readouterr()
+    interpreter.run("SET FORMAT CSV; " + query)
+    return capsys.readouterr().out.splitlines()
+
+
+def test_between_with_another_predicate_uses_both_indexes(capsys):
+    interpreter = parser.Interpreter()
+    interpreter.run('CREATE c (id INT, s INDEXED, d INDEXED); CREATE r (id, s INDEXED, d INDEXED);')
+    for table in ("c", "r"):
+        database.bulk_insert(table, [[str(i), str(i % 20), "d" + str(i % 3)] for i in range(300)])
+    for table in ("c", "r"):
+        for query in ('SELECT * FROM ' + table + ' WHERE s BETWEEN "10" AND "12" AND d = "d1";',
+                      'SELECT * FROM ' + table + ' WHERE (s >= "10" AND s <= "12") AND d = "d1";'):
+            assert "access: index intersection" in explain(interpreter, capsys, query)
+            expected = [row for row in range(300) if "10" <= str(row % 20) <= "12" and row % 3 == 1]
+            assert [int(line.split(",")[0]) for line in select(interpreter, capsys, query)[1:]] == expected
+
+
+def test_nested_conditions_are_flattened():
+    condition = ('and', [('and', [('s', '>=', '1'), ('s', '<=', '3')]), ('or', [('d', '=', 'a'), ('or', [('d', '=', 'b'), ('d', '=', 'c')])])])
+    assert planner.normalize_condition(condition, False) == ('and', [
+        ('s', '>=', '1', False), ('s', '<=', '3', False),
+        ('or', [('d', '=', 'a', False), ('d', '=', 'b', False), ('d', '=', 'c', False)])])
+
+
+@pytest.mark.parametrize("layout", ["columnar", "rows"])
+def test_mixed_direction_top_k(layout, monkeypatch):
+    types = {'i': 'int', 'f': 'float', 'd': 'dict', 's': 'str'} if layout == 'columnar' else None
+    database.create_table('t', ['i', 'f', 'd', 's'], [], types)
+    rnd = random.Random(3)
+    database.bulk_insert('t', [[str(rnd.randrange(20)), str(rnd.randrange(5) / 2), 'd' + str(rnd.randrange(7)), 's' + str(rnd.randrange(30))]
+                               for row in range(2000)])
+    table = database.database['t']
+    rows = list(range(2000)) if layout == 'columnar' else list(table['data'])
+    expected = {}
+    for order_by in ([('i', 'ASC'), ('f', 'DESC')], [('d', 'DESC'), ('s', 'ASC'), ('i', 'DESC')],
+                     [('s', 'DESC'), ('f', 'ASC')], [('f', 'DESC'), ('d', 'ASC'), ('s', 'DESC')]):
+        items = list(rows)
+        planner.sort_items(table, items, order_by)
+        expected[tuple(order_by)] = items[:25]
+    # the top k are picked with the heap alone, nothing is sorted in full
+    monkeypatch.setattr(planner, 'sort_items', None)
+    for order_by, items in expected.items():
+        assert planner.top_items(table, iter(rows), list(order_by), 25) == items
+
+
+comparisons = {'>': operator.gt, '<': operator.lt, '=': operator.eq, '>=': operator.ge, '<=': operator.le, '!=': operator.ne}
+names = ['n%02d' % i for i in range(40)]
+
+
+def random_condition(rnd, depth=0):
+    # comparisons combined with AND, OR, NOT and BETWEEN, a few of them column to column
+    choice = rnd.random()
+    if depth < 3 and choice < 0.1:
+        return ('not', random_condition(rnd, depth + 1))
+    if depth < 3 and choice < 0.2:
+        low, high = sorted(rnd.sample(range(1, 51), 2))
+        return ('and', [('sal', '>=', str(low * 100), False), ('sal', '<=', str(high * 100), False)])
+    if depth < 3 and choice < 0.5:
+        return (rnd.choice(['and', 'or']), [random_condition(rnd, depth + 1) for child in range(rnd.randint(2, 3))])
+    column_name = rnd.choice(['id', 'name', 'pos', 'sal'])
+    operator_ = rnd.choice(list(comparisons))
+    if column_name in ('name', 'pos') and rnd.random() < 0.1:
+        return (column_name, operator_, 'pos' if column_name == 'name' else 'name', True)
+    value = {'id': str(rnd.randrange(1000)), 'sal': str(rnd.randint(1, 50) * 100)}.get(column_name) or rnd.choice(names)
+    return (column_name, operator_, value, False)
+
+
+def holds(condition, row, as_text=False):
+    # as_text: compare like the row layout, which turns the values that are not text into text
+    if len(condition) == 2:
+        kind, operand = condition
+        if kind == 'not':
+            return not holds(operand, row, as_text)
+        return (all if kind == 'and' else any)(holds(child, row, as_text) for child in operand)
+    column_name, operator_, value, column = condition
+    if as_text:
+        return comparisons[operator_](str(row[column_name]), str(row[value]) if column else str(value))
+    if column:
+        return comparisons[operator_](row[column_name], row[value])
+    if isinstance(row[column_name], int):
+        value = int(value)
+    return comparisons[operator_](row[column_name], value)
+
+
+def test_parallel_scan_of_an_empty_table(monkeypatch):
+    monkeypatch.setattr(parallel, 'workers', 3)
+    monkeypatch.setattr(parallel, 'threshold', 0)
+    database.create_table('e', ['a', 'b'])
+    assert planner.select(database.database['e'], ('a', '>', 'b')) == []
+    assert database.delete_from_table('e', ('a', '>', 'b', True)) == 0
+    assert parallel.scan(0, None) == []
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_plans_agree_with_a_scan(workers, monkeypatch):
+    # every plan the planner picks returns the rows a condition selects, in ORDER BY order
+    if workers > 1:
+        monkeypatch.setattr(parallel, 'workers', workers)
+        monkeypatch.setattr(parallel, 'threshold', 100)
+        monkeypatch.setattr(parallel, 'startup_cost', 0)
+    rnd = random.Random(5)
+    types = {'id': 'int', 'name': 'dict', 'pos': 'str', 'sal': 'int'}
+    database.create_table('c', ['id', 'name', 'pos', 'sal'], ['name', 'sal', 'id'], types)
+    database.create_table('r', ['id', 'name', 'pos', 'sal'], ['name', 'sal', 'pos'])
+    database.create_table('h', ['id', 'name', 'pos', 'sal'], ['name', 'sal'], dict(types, name='str'), {'name': 'hash', 'sal': 'hash'})
+    # a row layout table holding numbers, whose values are compared as text
+    database.create_table('n', ['id', 'name', 'pos', 'sal'], ['name', 'sal', 'id'])
+    rows = [[str(i), rnd.choice(names), rnd.choice(names), str(rnd.randint(1, 50) * 100)] for i in range(1000)]
+    for table_name in 'crh':
+        database.bulk_insert(table_name, rows)
+    typed = [{'id': int(i), 'name': name, 'pos': pos, 'sal': int(sal)} for i, name, pos, sal in rows]
+    text = [{'id': i, 'name': name, 'pos': pos, 'sal': sal} for i, name, pos, sal in rows]
+    database.bulk_insert('n', [list(row.values()) for row in typed])
+    accesses = set()
+    for query in range(150 if workers == 1 else 40):
+        condition = random_condition(rnd)
+        order_by = rnd.choice([None, [('id', 'ASC')], [('sal', 'DESC'), ('id', 'ASC')], [('name', 'ASC'), ('id', 'DESC')]])
+        limit = rnd.choice([None, None, 5, 50])
+        for table_name in 'crhn':
+            expected = [row for row in (text if table_name == 'r' else typed) if holds(condition, row, table_name == 'n')]
+            for column_name, order in reversed(order_by or []):
+                expected.sort(key=operator.itemgetter(column_name), reverse=order == 'DESC')
+            for use_indexes in (True, False):
+                plan = planner.plan_select(database.database[table_name], condition, order_by, True, use_indexes, limit)
+                accesses.add((plan['access'], plan.get('workers', 1) > 1))
+                got = list(planner.select(database.database[table_name], condition, order_by, True, False, use_indexes, limit))
+                if order_by:
+                    assert got == expected[:limit], (table_name, condition, order_by, limit, plan['access'])
+                elif limit is None:
+                    assert sorted(got, key=str) == sorted(expected, key=str), (table_name, condition, plan['access'])
+                else:
+                    assert len(got) == min(limit, len(expected)) and all(holds(condition, row, table_name == 'n') for row in got)
+    assert {access for access, parallel_scan in accesses} == {'full_scan', 'index_range', 'index_order'}
+    assert any(parallel_scan for access, parallel_scan in accesses) == (workers > 1)
+
+
+def test_row_layout_numbers_compare_as_text():
+    # the keys of an index on numbers of the row layout do not compare like the scan, which
+    # compares the values as text, so the planner does not use them for the condition
+    database.create_table('e', ['id', 'name'], ['id'])
+    for i in range(2000):
+        database.insert_into_table('e', [i, 'n' + str(i)])
+    table = database.database['e']
+    for condition in (('id', '>', '3', False), ('id', '>', 1990, False), ('id', '=', '3', False), ('id', '<=', 12, False),
+                      ('and', [('id', '>=', '19', False), ('id', '<', '2', False)])):
+        expected = [row for row in table['data'] if holds(condition, row, True)]
+        assert database.select_from_table(table, condition, column=False) == expected
+        assert database.select_from_table_indexed(table, condition, column=False) == expected
+        assert list(planner.select(table, condition, [('id', 'DESC')], False, limit=3)) == sorted(expected, key=operator.itemgetter('id'), reverse=True)[:3]
@@ -0,0 +1,88 @@
+import pytest
+import database
+import parser
+
+
+@pytest.fixture
+def interpreter():
+    interpreter = parser.Interpreter()
+    interpreter.run('CREATE t (id, v INDEXED); SET FORMAT CSV;')
+    return interpreter
+
+
+def run(interpreter, capsys, text):
+    # :return: (output, errors)
+    capsys.readouterr()
+    interpreter.run(text)
+    captured = capsys.readouterr()
+    return captured.out, captured.err
+
+
+def rows(table_name='t'):
+    return [tuple(row.values()) for row in database.select_from_table(database.database[table_name])]
+
+
+def test_prepare_execute_deallocate(interpreter, capsys):
+    interpreter.run('PREPARE ins AS INSERT INTO t (?, ?); PREPARE q AS SELECT * FROM t WHERE v = ? ORDER_BY id DESC LIMIT ?;')
+    interpreter.run('EXECUTE ins ("1", "a"); EXECUTE ins ("2", "b"); EXECUTE ins ("3", "a");')
+    assert rows() == [('1', 'a'), ('2', 'b'), ('3', 'a')]
+    assert run(interpreter, capsys, 'EXECUTE q ("a", "1");') == ('id,v\n3,a\n', '')
+    assert run(interpreter, capsys, 'EXECUTE q ("b", "5");') == ('id,v\n2,b\n', '')
+    assert run(interpreter, capsys, 'EXECUTE ins ("4");') == ('', 'Error: expected 2 values, got 1\n')
+    assert run(interpreter, capsys, 'EXECUTE q ("a", "many");')[1] == 'Error: LIMIT and OFFSET must be numbers of rows.\n'
+    # literals stay in the prepared statement, only ? are filled in
+    interpreter.run('PREPARE upd AS UPDATE t SET v = "c" WHERE id = ?; EXECUTE upd ("2"); PREPARE del AS DELETE FROM t WHERE v = ?;')
+    interpreter.run('EXECUTE del ("a");')
+    assert rows() == [('2', 'c')]
+    interpreter.run('DEALLOCATE q;')
+    assert run(interpreter, capsys, 'EXECUTE q ("a", "1");')[1] == 'Error: no prepared statement called "q"\n'
+    assert run(interpreter, capsys, 'DEALLOCATE q;')[1] == 'Error: no prepared statement called "q"\n'
+    assert run(interpreter, capsys, 'PREPARE c AS CREATE x (a);')[1] == 'Error: only SELECT, INSERT, DELETE and UPDATE can be prepared\n'
+    assert run(interpreter, capsys, 'PREPARE q SELECT * FROM t;')[1] == 'Error: expected PREPARE name AS statement\n'
+
+
+def test_interpreter_prepare(interpreter, capsys):
+    insert = interpreter.prepare('INSERT INTO t (?, "x")')
+    for i in range(3):
+        insert.execute(str(i))
+    assert rows() == [('0', 'x'), ('1', 'x'), ('2', 'x')]
+    select = interpreter.prepare('SELECT * FROM t WHERE id >= ? AND v = ?;')
+    capsys.readouterr()
+    select.execute('1', 'x')
+    assert capsys.readouterr().out == 'id,v\n1,x\n2,x\n'
+    assert interpreter.prepare('SELECT * FROM t; SELECT * FROM t') is None
+    assert interpreter.prepare('SELECT * FROM') is None
+    assert interpreter.prepare('SHOW CACHE') is None
+
+
+def test_placeholders_only_inside_prepare(interpreter, capsys):
+    # outside of PREPARE a ? is a misplaced word, or the name of a column that does not exist
+    assert run(interpreter, capsys, 'INSERT INTO t (?, "x");')[1] == 'Values must be enclosed in double quotes.\n'
+    for text in ('SELECT * FROM t WHERE v = ?;', 'DELETE FROM t WHERE v = ?;'):
+        assert "Error: Column '?' does not exist." in ''.join(run(interpreter, capsys, text))
+    assert rows() == []
+    # a parsed statement never runs with a parameter left unbound
+    statement = interpreter.prepare('INSERT INTO t (?, ?)').statement
+    interpreter.run_statement(statement, ['1', None])
+    assert capsys.readouterr().err == 'Error: no value was given for parameter 2\n'
+    assert rows() == []
+
+
+def test_statement_cache_key(interpreter, capsys, monkeypatch):
+    # statements that only differ in their literals and spacing are parsed once
+    parsed = []
+    parse_statement = interpreter.parse_statement
+    monkeypatch.setattr(interpreter, 'parse_statement', lambda: parsed.append(1) or parse_statement())
+    interpreter.run('INSERT INTO t ("1", "a"); INSERT  INTO t("2","b") ;\nINSERT INTO t ("3", "a");')
+    interpreter.run('SELECT * FROM t WHERE v = "a"; SELECT * FROM t WHERE v="b"; SELECT * FROM t WHERE id = "a";')
+    assert rows() == [('1', 'a'), ('2', 'b'), ('3', 'a')]
+    assert len(parsed) == 3 and len(interpreter.cache) == 3
+    assert ('SELECT', '*', 'FROM', 't', 'WHERE', 'v', '=', 'param', ';') in interpreter.cache
+    # a prepared statement of the same shape shares the entry
+    interpreter.run('PREPARE q AS SELECT * FROM t WHERE v = ?;')
+    assert len(parsed) == 3
+    # the cache is bounded, the least recently used shape goes first
+    interpreter.cache_size = 3
+    interpreter.run('SELECT * FROM t WHERE v = "a"; DELETE FROM t WHERE v = "z";')
+    assert len(interpreter.cache) == 3 and len(parsed) == 4
+    assert ('INSERT', 'INTO', 't', '(', 'param', ',', 'param', ')', ';') not in interpreter.cache
@@ -0,0 +1,115 @@
+import pytest
+import database
+import parser
+import resultcache
+
+
+@pytest.fixture
+def interpreter(monkeypatch):
+    # a fresh cache of one megabyte, the one of the module is shared by all interpreters
+    monkeypatch.setattr(resultcache, 'results', resultcache.ResultCache())
+    interpreter = parser.Interpreter()
+    interpreter.run('CREATE t (id, v INDEXED); SET FORMAT CSV; SET CACHE 1;')
+    database.bulk_insert('t', [[str(i), 'v' + str(i % 10)] for i in range(100)])
+    return interpreter
+
+
+def output(interpreter, capsys, text):
+    capsys.readouterr()
+    interpreter.run(text)
+    return capsys.readouterr().out
+
+
+def stats():
+    return resultcache.results.stats()
+
+
+def test_hit_after_respacing_and_through_prepared_statements(interpreter, capsys):
+    first = output(interpreter, capsys, 'SELECT * FROM t WHERE v = "v3" ORDER_BY id DESC;')
+    assert stats()['misses'] == 1 and stats()['entries'] == 1
+    assert output(interpreter, capsys, 'SELECT  *   FROM t\nWHERE v="v3"   ORDER_BY  id  DESC ;') == first
+    assert stats()['hits'] == 1
+    interpreter.run('PREPARE q AS SELECT * FROM t WHERE v = ? ORDER_BY id DESC;')
+    assert output(interpreter, capsys, 'EXECUTE q ("v3");') == first
+    capsys.readouterr()
+    interpreter.prepare('SELECT * FROM t WHERE v = ? ORDER_BY id DESC').execute('v3')
+    assert capsys.readouterr().out == first
+    assert stats()['hits'] == 3 and stats()['misses'] == 1
+    # another value is another entry
+    assert output(interpreter, capsys, 'EXECUTE q ("v4");') != first
+    assert stats()['misses'] == 2 and stats()['entries'] == 2
+
+
+def write_csv(tmp_path):
+    path = tmp_path / 'more.csv'
+    path.write_text('id,v\n' + ''.join(str(i) + ',v3\n' for i in range(100, 105)))
+    return 'COPY t FROM "' + str(path) + '";'
+
+
+@pytest.mark.parametrize("write", [
+    'INSERT INTO t ("100", "v3");',
+    write_csv,
+    'DELETE FROM t WHERE id = "13";',
+    'UPDATE t SET v = "v0" WHERE id = "23";',
+    database.compact_table,
+])
+def test_writes_invalidate_through_publish(interpreter, capsys, monkeypatch, tmp_path, write):
+    query = 'SELECT * FROM t WHERE v = "v3";'
+    if write is database.compact_table:
+        interpreter.run('DELETE FROM t WHERE id = "33";')
+    before = output(interpreter, capsys, query)
+    assert output(interpreter, capsys, query) == before and stats()['hits'] == 1
+    published = []
+    publish = database.publish
+    monkeypatch.setattr(database, 'publish', lambda table: published.append(table) or publish(table))
+    if write is database.compact_table:
+        write('t')
+    else:
+        interpreter.run(write(tmp_path) if callable(write) else write)
+    assert published
+    after = output(interpreter, capsys, query)
+    assert stats()['invalidations'] == 1 and stats()['hits'] == 1
+    # the fresh result, which is cached again
+    fresh = sorted(row['id'] for row in database.select_from_table(database.database['t'], ('v', '=', 'v3'), column=False))
+    assert sorted(line.split(',')[0] for line in after.splitlines()[1:]) == fresh
+    assert (after == before) == (write is database.compact_table)
+    assert output(interpreter, capsys, query) == after and stats()['hits'] == 2
+
+
+def test_least_recently_used_entries_are_evicted(interpreter, capsys):
+    # results of about 300 KiB each, three of them fit into one megabyte
+    database.bulk_insert('t', [[str(i), 'big' + str(i % 4) + 'x' * 200] for i in range(6000)])
+    queries = ['SELECT * FROM t WHERE v > "big' + str(k) + '" AND v < "big' + str(k) + 'y";' for k in range(4)]
+    for query in queries[:3]:
+        output(interpreter, capsys, query)
+    assert stats()['entries'] == 3 and stats()['evictions'] == 0
+    output(interpreter, capsys, queries[0])
+    assert stats()['hits'] == 1
+    # the fourth result pushes out the one used longest ago, which is the second now
+    output(interpreter, capsys, queries[3])
+    assert stats()['entries'] == 3 and stats()['evictions'] == 1
+    assert stats()['bytes'] <= stats()['max_bytes'] == 1 << 20
+    for query in (queries[0], queries[2], queries[3]):
+        output(interpreter, capsys, query)
+    assert stats()['hits'] == 4
+    output(interpreter, capsys, queries[1])
+    assert stats()['misses'] == 5
+    # shrinking the cache evicts at once, OFF empties it and stops caching
+    interpreter.run('SET CACHE OFF;')
+    assert stats()['entries'] == 0 and stats()['bytes'] == 0
+    output(interpreter, capsys, queries[0])
+    assert stats()['entries'] == 0 and stats()['hits'] == 4
+
+
+def test_show_cache(interpreter, capsys):
+    assert output(interpreter, capsys, 'SHOW CACHE;').splitlines() == [
+        'result cache: 0.00 of 1 MiB used by 0 entries',
+        'hits: 0  misses: 0  hit rate: -  evictions: 0  invalidations: 0']
+    for text in ('SELECT * FROM t WHERE v = "v1";', 'SELECT * FROM t WHERE v = "v1";', 'SELECT * FROM t WHERE v = "v2";',
+                 'INSERT INTO t ("200", "v1");', 'SELECT * FROM t WHERE v = "v1";'):
+        interpreter.run(text)
+    lines = output(interpreter, capsys, 'SHOW CACHE;').splitlines()
+    assert lines[0].endswith('MiB used by 2 entries')
+    assert lines[1] == 'hits: 1  misses: 3  hit rate: 25.0%  evictions: 0  invalidations: 1'
+    interpreter.run('SET CACHE OFF;')
+    assert output(interpreter, capsys, 'SHOW CACHE;').splitlines()[0] == 'result cache: off'
@@ -0,0 +1,32 @@
+import pytest
+from client import Client, QueryError
+
+
+@pytest.fixture
+def port(serve):
+    return serve()[1]
+
+
+def test_statements_and_rows(port):
+    with Client(port=port) as db:
+        db.execute('CREATE t (id INT INDEXED, name TEXT);')
+        db.execute('INSERT INTO t ("1", "a");')
+        db.execute('INSERT INTO t ("2", "b");')
+        assert db.query('SELECT * FROM t WHERE id > "1";') == [{"id": 2, "name": "b"}]
+
+
+@pytest.mark.parametrize("statement", [
+    'SELECT * FROM t WHERE missing = "1";',
+    'INSERT INTO t ("1");',
+    'INSERT INTO nowhere ("1", "a");',
+    'UPDATE t SET id = "x";',
+    'SELECT * FROM t WHERE id > ;',
+])
+def test_bad_statement_is_an_error(port, statement):
+    with Client(port=port) as db:
+        db.execute('CREATE t (id INT INDEXED, name TEXT);')
+        with pytest.raises(QueryError):
+            db.query(statement)
+        # the connection goes on after the error
+        db.execute('INSERT INTO t ("1", "a");')
+        assert db.query('SELECT * FROM t;') == [{"id": 1, "name": "a"}]
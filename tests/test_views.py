@@ -0,0 +1,89 @@
+import bisect
+import random
+import threading
+import time
+import pytest
+import aggregate
+import database
+import planner
+import views
+
+
+def test_readers_see_consistent_views_while_writing(switch_often, monkeypatch):
+    # readers compare index and scan results on the same view while a writer inserts rows,
+    # loads batches, deletes and updates; the rows of a view never change under a reader
+    monkeypatch.setattr(database, 'compaction_threshold', 0.1)
+    database.create_table('c', ['id', 'name', 'v'], ['id', 'name', 'v'], {'id': 'int', 'name': 'dict', 'v': 'int'})
+    database.create_table('r', ['id', 'name', 'v'], ['id', 'name', 'v'])
+    stop = threading.Event()
+    errors = []
+    monkeypatch.setattr(threading, 'excepthook', errors.append)
+
+    def writer():
+        rnd = random.Random(1)
+        i = 0
+        while not stop.is_set():
+            values = [str(i), 'n%05d' % rnd.randrange(100000), str(rnd.randrange(1000))]
+            for table_name in 'cr':
+                database.insert_into_table(table_name, values)
+            i += 1
+            if i % 500 == 0:
+                database.bulk_insert('c', [[str(i + k), 'b%04d' % rnd.randrange(9999), '7'] for k in range(200)])
+            if i % 50 == 0:
+                v = rnd.randrange(1000)
+                for table_name in 'cr':
+                    key = v if table_name == 'c' else str(v)
+                    if rnd.random() < 0.5:
+                        database.delete_from_table(table_name, ('v', '=', key, False))
+                    else:
+                        database.update_table(table_name, [('name', 'u%03d' % rnd.randrange(100))], ('v', '=', key, False))
+
+    def reader(seed):
+        rnd = random.Random(seed)
+        while not stop.is_set():
+            for table_name in 'cr':
+                view = views.read_view(database.database[table_name])
+                condition = rnd.choice([('name', '>', 'n5'), ('v', '<', '300'), ('v', '=', '7'), ('id', '>', '100'), ('name', '>=', 'u05')])
+                if table_name == 'c' and condition[0] in ('v', 'id'):
+                    condition = (condition[0], condition[1], int(condition[2]))
+                order_by = rnd.choice([None, [('name', 'ASC')], [('v', 'DESC'), ('id', 'ASC')]])
+                results = []
+                for use_indexes in (True, False):
+                    plan = planner.plan_select(view, condition, order_by, False, use_indexes)
+                    results.append(sorted(tuple(row.values()) for row in planner.execute(view, plan)))
+                count = aggregate.execute(view, aggregate.plan_aggregate(view, [('COUNT', '*')]))[0]['COUNT(*)']
+                if results[0] != results[1] or count != len(planner.select(view)):
+                    errors.append((table_name, condition, order_by, len(results[0]), len(results[1])))
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader, args=(seed,)) for seed in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(3)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert database.database['c']['rows'] > 500
+
+
+def test_btree_key_snapshots():
+    # keys going anywhere among thousands of others, through single inserts and batches that
+    # split the chunks of the index; every view keeps the keys it was taken with
+    database.create_table('r', ['name'], ['name'])
+    table = database.database['r']
+    rnd = random.Random(2)
+    taken = []
+    for round_ in range(60):
+        if round_ % 10 == 9:
+            database.bulk_insert('r', [['k%06d' % rnd.randrange(10 ** 6)] for row in range(3000)])
+        for row in range(rnd.randrange(1, 5)):
+            database.insert_into_table('r', ['k%06d' % rnd.randrange(10 ** 6)])
+        taken.append((views.read_view(table), list(table['index']['name'].keys())))
+    for view, keys in taken:
+        index = view['index']['name']
+        assert list(index.keys()) == keys and list(reversed(index.keys())) == keys[::-1]
+        for probe in ('k%06d' % rnd.randrange(10 ** 6) for test in range(20)):
+            start, stop = index.bisect_left(probe), index.bisect_right('k' + probe[1:4] + '999')
+            assert start == bisect.bisect_left(keys, probe) and stop == bisect.bisect_right(keys, 'k' + probe[1:4] + '999')
+            assert index.irange(probe, 'k' + probe[1:4] + '999') == keys[start:stop]
+            assert index.keys()[start - len(keys) if start < len(keys) else -1] == keys[min(start, len(keys) - 1)]
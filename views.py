@@ -0,0 +1,252 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import islice, filterfalse, chain, accumulate, compress
+from operator import is_, ne
+from sortedcontainers import SortedDict
+import storage
+
+# snapshot reads: writers change a table only under its writer lock and publish the new
+# row count (table['rows']) as the last step of every insert or batch, readers never wait
+# for a whole write. a query runs on a read view taken under the lock in O(columns + indexes),
+# plus O(chunks) for every btree index that got new keys since the last view:
+#   - the column arrays and the row list are append-only, the view only reads their first rows
+#   - dictionary columns are pinned to their encoding, which writers replace instead of changing
+#   - posting lists are sorted row ids that only grow at the end, the view cuts off the ids
+#     past its row count
+#   - btree keys are copied chunk by chunk from the SortedDict, which keeps them as a list of
+#     sorted lists of about a thousand keys; the views share the copies of the chunks that did
+#     not change, so only the chunks the new keys went into are copied again
+#   - deleted rows stay in place as tombstones (table['dead']: row id -> version of the delete),
+#     which are only added until a compaction replaces the dict, so a view uses the ones that
+#     were there when it was taken and skips their rows in scans and postings
+#   - compaction builds new rows and indexes and swaps them in, views keep the old ones
+
+def read_view(table):
+    if table.get('view'):
+        return table
+    columnar = isinstance(table['data'], storage.ColumnStore)
+    with table['lock']:
+        rows = table['rows']
+        data = table['data'].view(rows) if columnar else RowsView(table['data'], rows)
+        dead = Tombstones(table['dead'], table['version']) if table['dead'] else None
+        indexes = {}
+        for column, index in table['index'].items():
+            keys = sorted_keys(table, column, index) if isinstance(index, SortedDict) else None
+            indexes[column] = IndexView(index, keys, rows, dead)
+    return dict(table, data=data, index=indexes, dead=dead, view=True)
+
+
+def sorted_keys(table, column, index):
+    # the keys of a btree index as KeyChunks. keys are only ever added to an index (compaction
+    # builds a new one), which makes a chunk of the SortedDict longer or splits it in two, so a
+    # chunk of the same length still holds the keys of its copy. the chunks themselves are kept
+    # with their copies, which keeps their ids from being reused
+    cached = table['key_cache'].get(column)
+    if cached is not None and cached[0] is not index:
+        cached = None
+    if cached is not None and len(cached[1]) == len(index):
+        return cached[1]
+    chunks = index._list._lists
+    lengths = list(map(len, chunks))
+    if cached is not None and len(chunks) == len(cached[2]) and all(map(is_, chunks, cached[2])):
+        # no chunk was split: only the ones that got longer are copied, found in C
+        copies = cached[1].chunks[:]
+        for position in compress(range(len(chunks)), map(ne, lengths, cached[3])):
+            copies[position] = chunks[position][:]
+    else:
+        known = {} if cached is None else dict(zip(map(id, cached[2]), zip(cached[3], cached[1].chunks)))
+        copies = []
+        for chunk, length in zip(chunks, lengths):
+            copy = known.get(id(chunk))
+            copies.append(copy[1] if copy is not None and copy[0] == length else chunk[:])
+    keys = KeyChunks(copies)
+    table['key_cache'][column] = (index, keys, chunks[:], lengths)
+    return keys
+
+
+class KeyChunks(object):
+    # the sorted keys of a btree index when a read view was taken, as a list of sorted chunks
+    # that reads like a list of the keys. the first and last position of every chunk are only
+    # worked out when a query searches the keys, outside of the writer lock
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.size = sum(map(len, chunks))
+        self.offsets = None
+        self.maxes = None
+
+    def locate(self):
+        if self.maxes is None:
+            self.offsets = list(accumulate(map(len, self.chunks), initial=0))
+            self.maxes = [chunk[-1] for chunk in self.chunks]
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return chain.from_iterable(self.chunks)
+
+    def __reversed__(self):
+        return chain.from_iterable(map(reversed, reversed(self.chunks)))
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            start, stop, step = position.indices(self.size)
+            if start >= stop:
+                return []
+            self.locate()
+            first = bisect_right(self.offsets, start) - 1
+            offset = self.offsets[first]
+            return list(islice(chain.from_iterable(islice(self.chunks, first, None)), start - offset, stop - offset))
+        if position < 0:
+            position += self.size
+        if position < 0 or position >= self.size:
+            raise IndexError("key position out of range")
+        self.locate()
+        chunk = bisect_right(self.offsets, position) - 1
+        return self.chunks[chunk][position - self.offsets[chunk]]
+
+    def bisect_left(self, key):
+        self.locate()
+        chunk = bisect_left(self.maxes, key)
+        if chunk == len(self.chunks):
+            return self.size
+        return self.offsets[chunk] + bisect_left(self.chunks[chunk], key)
+
+    def bisect_right(self, key):
+        self.locate()
+        chunk = bisect_right(self.maxes, key)
+        if chunk == len(self.chunks):
+            return self.size
+        return self.offsets[chunk] + bisect_right(self.chunks[chunk], key)
+
+
+class RowsView(object):
+    # the first size rows of the row list of a row layout table, without copying them
+
+    def __init__(self, live, size):
+        self.live = live
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return islice(self.live, self.size)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return self.live[slice(*position.indices(self.size))]
+        if position < 0:
+            position += self.size
+        if position < 0 or position >= self.size:
+            raise IndexError("row out of range")
+        return self.live[position]
+
+
+class Tombstones(object):
+    # the tombstones of a table when a read view was taken
+
+    def __init__(self, dead, version):
+        self.dead = dead
+        self.count = len(dead)
+        self.version = version  # every delete seen by the view has a lower version
+        self.older = None
+
+    def ids(self):
+        # a container of the deleted row ids the view sees: the table's dict itself while
+        # nothing was deleted after the view was taken
+        if len(self.dead) == self.count:
+            return self.dead
+        if self.older is None:
+            self.older = {row_id for row_id, version in self.dead.copy().items() if version < self.version}
+        return self.older
+
+    def __len__(self):
+        return self.count
+
+
+class IndexView(object):
+    # the part of SortedDict / dict used by the planner, over the rows of a read view
+
+    def __init__(self, index, keys, rows, dead=None):
+        self.index = index
+        self.ordered = keys is not None
+        self.key_list = keys
+        self.rows = rows
+        self.dead = dead
+
+    def visible(self, postings):
+        # copy of the postings without the rows added after the view was taken
+        # and without the rows deleted before
+        end = len(postings)
+        if end and postings[end - 1] >= self.rows:
+            end = bisect_left(postings, self.rows)
+        if self.dead is None:
+            return postings[:end]
+        return array(postings.typecode, filterfalse(self.dead.ids().__contains__, islice(postings, end)))
+
+    def remapped(self, positions):
+        # the visible postings of every key with the row ids replaced by positions[row id],
+        # as a plain dict without the keys that are left without rows; used by compaction
+        remap = positions.__getitem__
+        dead = self.dead.ids().__contains__ if self.dead is not None else None
+        index = self.index
+        rows = self.rows
+        remapped = {}
+        for key in self.keys():
+            # the postings may be extended while they are read, only their first end ids are seen
+            postings = index[key]
+            end = len(postings)
+            if end and postings[end - 1] >= rows:
+                end = bisect_left(postings, rows)
+            visible = islice(postings, end)
+            postings = array(postings.typecode, map(remap, visible if dead is None else filterfalse(dead, visible)))
+            if postings:
+                remapped[key] = postings
+        return remapped
+
+    def __len__(self):
+        return len(self.key_list) if self.ordered else len(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __getitem__(self, key):
+        return self.visible(self.index[key])
+
+    def row_count(self, key):
+        # the number of visible rows of a key, the postings are only read to skip tombstones
+        postings = self.index.get(key)
+        if postings is None:
+            return 0
+        end = len(postings)
+        if end and postings[end - 1] >= self.rows:
+            end = bisect_left(postings, self.rows)
+        if self.dead is None:
+            return end
+        return end - sum(map(self.dead.ids().__contains__, islice(postings, end)))
+
+    def get(self, key, default=None):
+        postings = self.index.get(key)
+        if postings is None:
+            return default
+        return self.visible(postings)
+
+    def keys(self):
+        return self.key_list if self.ordered else list(self.index)
+
+    def bisect_left(self, key):
+        return self.key_list.bisect_left(key)
+
+    def bisect_right(self, key):
+        return self.key_list.bisect_right(key)
+
+    def irange(self, minimum=None, maximum=None, inclusive=(True, True)):
+        start = 0
+        stop = len(self.key_list)
+        if minimum is not None:
+            start = self.bisect_left(minimum) if inclusive[0] else self.bisect_right(minimum)
+        if maximum is not None:
+            stop = self.bisect_right(maximum) if inclusive[1] else self.bisect_left(maximum)
+        return self.key_list[start:stop]